@@ -1,23 +1,78 @@
-from fastapi import FastAPI, HTTPException, Body, WebSocket, Depends
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, Body, WebSocket, WebSocketDisconnect, Depends, Header, Request
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_swagger_ui_html, get_redoc_html
 import asyncio
+import contextlib
+import json
 import time
-from router import Router, MEMORY_STORE
+from contextlib import asynccontextmanager
+from router import Router, MEMORY_STORE, retrieve_documents
+from memory.session_memory import SessionMemory
+from cancellation import CANCELLED, CancelToken, RequestCancelled, reset_current_token, set_current_token
+from core.ollama_client import OllamaClient
 from settings import settings
-from plugins import list_tools, call_tool
+from plugins import list_tools
+from tool_executor import TOOL_EXECUTOR, ToolNotFound, ToolTimeout
+from ratelimit import RateLimitExceeded
+from embeddings import encode_embeddings, embeddings_to_bytes
+from documents import ingest_documents
+from jobs import JOBS, resolve_job_path, start_job
+from images import IMAGE_QUEUE
+from overload import OVERLOAD_DETECTOR, SHED, ServerOverloaded
+import metrics
+from request_metrics import HTTP_IN_FLIGHT, HTTP_LATENCY, HTTP_REQUESTS, OVERHEAD, begin_request, end_request
+from starlette.routing import Match
+from tracing import end_trace, format_traceparent, span, start_trace
+from profiling import (PROFILE_MODES, PROFILES, ProfiledRoute, RequestProfile, StackSampler, admin_authorized,
+                       keep_profile, reset_request_profile, run_profiled, set_request_profile)
 from pydantic import BaseModel, Field, ValidationError
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Union, Literal
 from utils import log_error, log_request, log_response, format_error_response
 
+async def warm_up_ollama_models(client, models):
+    """Load each model concurrently; a failure is logged so it never blocks startup."""
+    async def warm_up(model):
+        start_time = time.time()
+        try:
+            await asyncio.to_thread(client.warm_up, model)
+            log_response("ollama", "warm_up", 200, time.time() - start_time)
+        except Exception as e:
+            log_error(e, {"provider": "ollama", "model": model, "endpoint": "warm_up"})
+
+    await asyncio.gather(*(warm_up(model) for model in models))
+
+async def keep_ollama_models_warm(client, models, interval):
+    """Periodically re-load hot models so Ollama never evicts them between requests."""
+    while True:
+        await asyncio.sleep(interval)
+        await warm_up_ollama_models(client, models)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    background_tasks = [asyncio.create_task(OVERLOAD_DETECTOR.monitor())]
+    ollama = OllamaClient()
+    if settings.OLLAMA_PRELOAD_MODELS:
+        await warm_up_ollama_models(ollama, settings.OLLAMA_PRELOAD_MODELS)
+    if settings.OLLAMA_KEEP_WARM_MODELS:
+        background_tasks.append(asyncio.create_task(keep_ollama_models_warm(
+            ollama, settings.OLLAMA_KEEP_WARM_MODELS, settings.OLLAMA_KEEP_WARM_INTERVAL
+        )))
+    yield
+    for task in background_tasks:
+        task.cancel()
+
 app = FastAPI(
     title="Smart-Host LLM API",
     description="A unified API for multiple LLM providers including OpenAI, OpenRouter, and Ollama",
     version="0.1.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
+# Sync endpoints run through run_profiled() so a request can ask for its handling to be profiled
+app.router.route_class = ProfiledRoute
 
 # Add CORS middleware
 app.add_middleware(
@@ -28,6 +83,94 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def shed_when_overloaded(request: Request, call_next):
+    """Reject new LLM work early while health and memory management stay available."""
+    if request.method == "POST" and request.url.path in settings.OVERLOAD_SHED_PATHS:
+        reason = OVERLOAD_DETECTOR.overload_reason()
+        if reason:
+            SHED.labels(reason).inc()
+            return JSONResponse(
+                status_code=503,
+                content=format_error_response(ServerOverloaded(f"Server overloaded ({reason}), retry later")),
+                headers={"Retry-After": str(settings.OVERLOAD_RETRY_AFTER)}
+            )
+    return await call_next(request)
+
+def route_template(request: Request) -> str:
+    """The path template of the route serving a request, so metrics aren't labelled per id."""
+    template = getattr(request.state, "route_template", None)
+    if template is None:
+        template = "unmatched"
+        for route in app.router.routes:
+            match, _ = route.matches(request.scope)
+            if match == Match.FULL:
+                template = route.path
+                break
+        # Every middleware shares the request's state
+        request.state.route_template = template
+    return template
+
+@app.middleware("http")
+async def record_http_metrics(request: Request, call_next):
+    """Count and time every request per route, separating provider time from Smart-Host overhead."""
+    route = route_template(request)
+    in_flight = HTTP_IN_FLIGHT.labels(route)
+    in_flight.inc()
+    handle, upstream = begin_request()
+    start_time = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # Streaming responses are timed up to their headers
+        elapsed = time.perf_counter() - start_time
+        end_request(handle)
+        in_flight.dec()
+        HTTP_REQUESTS.labels(request.method, route, status_code).inc()
+        HTTP_LATENCY.labels(request.method, route).observe(elapsed)
+        # Batches overlap provider calls, so their summed time can exceed the wall time
+        OVERHEAD.labels(route).observe(max(0.0, elapsed - upstream[0]))
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Trace each request, continuing the caller's trace, and report its stages in a Server-Timing header."""
+    if not settings.TRACING_ENABLED:
+        return await call_next(request)
+    route = route_template(request)
+    root, handle = start_trace(f"{request.method} {route}", request.headers.get("traceparent"),
+                               {"http.method": request.method, "http.route": route})
+    try:
+        response = await call_next(request)
+        root.set_attribute("http.status_code", response.status_code)
+        response.headers["Server-Timing"] = root.trace.server_timing(root)
+        response.headers["traceparent"] = format_traceparent(root)
+        return response
+    except Exception as e:
+        root.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        end_trace(root, handle)
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """Profile a request's handling when an admin asks for it with an X-Profile header."""
+    mode = request.headers.get("x-profile")
+    if mode not in PROFILE_MODES or not admin_authorized(request.headers.get("x-admin-token")):
+        return await call_next(request)
+    profile = RequestProfile(mode)
+    handle = set_request_profile(profile)
+    try:
+        response = await call_next(request)
+    finally:
+        reset_request_profile(handle)
+        profile.stop()
+        keep_profile(profile)
+    response.headers["X-Profile-Id"] = profile.id
+    return response
+
 class Message(BaseModel):
     role: str = Field(..., description="The role of the message sender (system, user, or assistant)")
     content: str = Field(..., description="The content of the message")
@@ -41,11 +184,51 @@ class ChatRequest(BaseModel):
     user_id: Optional[str] = Field(None, description="User identifier for user-specific memory across conversations")
     include_user_memory: Optional[bool] = Field(True, description="Whether to include user memory in the context")
     save_to_user_memory: Optional[bool] = Field(False, description="Whether to save this exchange to user memory")
+    priority: int = Field(0, description="Admission priority when the provider is rate limited (higher is served first)")
+    temperature: Optional[float] = Field(None, description="Sampling temperature passed to the provider")
+    top_p: Optional[float] = Field(None, description="Nucleus sampling parameter passed to the provider")
+    max_tokens: Optional[int] = Field(None, description="Maximum number of tokens to generate")
+    cache: Optional[bool] = Field(None, description="Force (true) or bypass (false) the response cache; by default only deterministic requests are cached")
+    retrieve_top_k: int = Field(0, ge=0, description="Inject this many chunks retrieved from the document collection for the latest user message")
+    collection: str = Field("default", description="Document collection to retrieve from when retrieve_top_k is set")
+
+class ChatBatchRequest(BaseModel):
+    requests: List[ChatRequest] = Field(..., description="Chat requests to run concurrently")
+    stream: bool = Field(False, description="Stream results as NDJSON lines as they complete instead of one ordered JSON response")
+    max_concurrency: Optional[int] = Field(None, gt=0, description="Requests run at once (at most CHAT_BATCH_MAX_CONCURRENCY)")
 
 class EmbedRequest(BaseModel):
     provider: str = Field(..., description="LLM provider to use (openai, openrouter, or ollama)")
-    input: str = Field(..., description="Text to convert into embeddings")
+    input: Union[str, List[str]] = Field(..., description="Text, or list of texts, to convert into embeddings")
     model: Optional[str] = Field(None, description="Specific embedding model to use")
+    encoding_format: Literal["float", "base64", "float16", "int8", "binary", "npy"] = Field(
+        "float",
+        description="float: provider JSON; base64/float16/int8: base64-encoded rows; "
+                    "binary: raw float32 application/octet-stream; npy: NumPy .npy file"
+    )
+
+class Document(BaseModel):
+    id: Optional[str] = Field(None, description="Document identifier; re-ingesting an id replaces its chunks")
+    text: str = Field(..., description="Full text of the document")
+    metadata: Dict[str, Any] = Field(default_factory=dict, description="Metadata returned with every chunk of the document")
+
+class DocumentsRequest(BaseModel):
+    provider: str = Field(..., description="Embedding provider (openai, openrouter, or ollama)")
+    model: Optional[str] = Field(None, description="Specific embedding model to use")
+    collection: str = Field("default", description="Collection to index the documents into")
+    documents: List[Document] = Field(..., description="Documents to chunk, embed and index")
+    chunk_size: Optional[int] = Field(None, gt=0, description="Maximum characters per chunk (default: DOCUMENT_CHUNK_SIZE)")
+    chunk_overlap: Optional[int] = Field(None, ge=0, description="Characters shared by consecutive chunks (default: DOCUMENT_CHUNK_OVERLAP)")
+
+class SearchRequest(BaseModel):
+    query: str = Field(..., description="Text to search the collection for")
+    collection: str = Field("default", description="Collection to search")
+    top_k: int = Field(5, gt=0, description="Number of chunks to return")
+
+class JobRequest(BaseModel):
+    input_path: str = Field(..., description="JSONL file of chat/embed requests, relative to JOBS_DIR")
+    output_path: str = Field(..., description="JSONL file for results, relative to JOBS_DIR; an existing checkpoint is resumed")
+    concurrency: Optional[int] = Field(None, gt=0, description="Lines run at once (default: JOBS_CONCURRENCY, at most JOBS_MAX_CONCURRENCY)")
 
 class ImageRequest(BaseModel):
     provider: str = Field(..., description="LLM provider to use (openai, openrouter)")
@@ -56,10 +239,70 @@ class CallToolRequest(BaseModel):
     args: List[Any] = Field(default_factory=list, description="Positional arguments for the tool")
     kwargs: Dict[str, Any] = Field(default_factory=dict, description="Keyword arguments for the tool")
 
+class CallToolsRequest(BaseModel):
+    calls: List[CallToolRequest] = Field(..., description="Tool calls to run in parallel")
+
+# Upstream capacity is shared fairly per tenant; without this header the user_id is used
+TENANT_HEADER = Header(None, description="Tenant used for fair scheduling of upstream capacity")
+
+SAMPLING_PARAMS = ("temperature", "top_p", "max_tokens")
+
+def sampling_params(request: ChatRequest) -> Dict[str, Any]:
+    """Only forward sampling parameters the caller actually set."""
+    return {name: getattr(request, name) for name in SAMPLING_PARAMS if getattr(request, name) is not None}
+
+def rate_limited_response(error: RateLimitExceeded):
+    return JSONResponse(
+        status_code=429,
+        content=format_error_response(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+def overloaded_response(error: ServerOverloaded):
+    return JSONResponse(
+        status_code=503,
+        content=format_error_response(error),
+        headers={"Retry-After": str(settings.OVERLOAD_RETRY_AFTER)}
+    )
+
+def run_chat(request: ChatRequest, tenant: Optional[str] = None):
+    """Route one ChatRequest to its provider; shared by /chat and /chat/batch."""
+    router = Router(request.provider, tenant=tenant)
+    return router.chat(
+        [m.model_dump() for m in request.messages],
+        model=request.model,
+        profile=request.profile,
+        chat_id=request.chat_id,
+        user_id=request.user_id,
+        include_user_memory=request.include_user_memory,
+        save_to_user_memory=request.save_to_user_memory,
+        priority=request.priority,
+        cache=request.cache,
+        retrieve_top_k=request.retrieve_top_k,
+        collection=request.collection,
+        **sampling_params(request)
+    )
+
+async def cancel_on_disconnect(http_request: Request, token: CancelToken):
+    """Cancel `token` once the HTTP client has gone away."""
+    while not token.cancelled:
+        if await http_request.is_disconnected():
+            token.cancel("client disconnected")
+            return
+        await asyncio.sleep(settings.DISCONNECT_CHECK_INTERVAL)
+
+def run_with_token(token: Optional[CancelToken], fn, *args):
+    """Call fn on this worker thread with `token` as the current request's cancel token."""
+    handle = set_current_token(token)
+    try:
+        return run_profiled(fn, *args)
+    finally:
+        reset_current_token(handle)
+
 @app.post("/chat", tags=["LLM Endpoints"], 
          summary="Generate a chat completion",
          description="Send a conversation to an LLM provider and get a completion response")
-def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request, x_tenant_id: Optional[str] = TENANT_HEADER):
     start_time = time.time()
     try:
         # Log the incoming request
@@ -73,21 +316,29 @@ def chat(request: ChatRequest):
             "messages_count": len(request.messages)
         })
         
-        router = Router(request.provider)
-        response = router.chat(
-            [m.model_dump() for m in request.messages],
-            model=request.model,
-            profile=request.profile,
-            chat_id=request.chat_id,
-            user_id=request.user_id,
-            include_user_memory=request.include_user_memory,
-            save_to_user_memory=request.save_to_user_memory
-        )
+        # Abandon the provider call if the caller hangs up before it returns
+        token = CancelToken()
+        watcher = asyncio.create_task(cancel_on_disconnect(http_request, token))
+        try:
+            with span("chat", provider=request.provider):
+                response = await run_in_threadpool(run_with_token, token, run_chat, request, x_tenant_id)
+        finally:
+            watcher.cancel()
         
         # Log the successful response
-        log_response(request.provider, "chat", 200, time.time() - start_time)
+        log_response(request.provider, "chat", 200, time.time() - start_time, request.model)
         return response
         
+    except RequestCancelled as e:
+        # Nobody is left to read this; 499 is the conventional "client closed request" status
+        log_response(request.provider, "chat", 499, time.time() - start_time, request.model)
+        return JSONResponse(status_code=499, content=format_error_response(e))
+    except RateLimitExceeded as e:
+        log_response(request.provider, "chat", 429, time.time() - start_time, request.model)
+        return rate_limited_response(e)
+    except ServerOverloaded as e:
+        log_response(request.provider, "chat", 503, time.time() - start_time, request.model)
+        return overloaded_response(e)
     except ValidationError as ve:
         log_error(ve, {"request": request.model_dump()})
         return JSONResponse(
@@ -101,10 +352,72 @@ def chat(request: ChatRequest):
             content=format_error_response(e)
         )
 
+def chat_batch_item(index: int, request: ChatRequest, tenant: Optional[str],
+                    token: Optional[CancelToken] = None) -> Dict[str, Any]:
+    """Run one item of a batch, turning its failure into a per-item error instead of failing the batch."""
+    start_time = time.time()
+    try:
+        response = run_with_token(token, run_chat, request, tenant)
+        log_response(request.provider, "chat_batch", 200, time.time() - start_time, request.model)
+        return {"index": index, "status": "success", "response": response}
+    except RequestCancelled as e:
+        log_response(request.provider, "chat_batch", 499, time.time() - start_time, request.model)
+        return {"index": index, "status": "cancelled", "status_code": 499, **format_error_response(e)}
+    except RateLimitExceeded as e:
+        log_response(request.provider, "chat_batch", 429, time.time() - start_time, request.model)
+        return {"index": index, "status": "error", "status_code": 429, "retry_after": e.retry_after,
+                **format_error_response(e)}
+    except ServerOverloaded as e:
+        log_response(request.provider, "chat_batch", 503, time.time() - start_time, request.model)
+        return {"index": index, "status": "error", "status_code": 503,
+                "retry_after": settings.OVERLOAD_RETRY_AFTER, **format_error_response(e)}
+    except Exception as e:
+        log_error(e, {"index": index, "provider": request.provider, "model": request.model})
+        return {"index": index, "status": "error", "status_code": 500, **format_error_response(e)}
+
+@app.post("/chat/batch", tags=["LLM Endpoints"],
+         summary="Run many chat completions",
+         description="Run a list of chat requests concurrently and return their results in order, or stream them as NDJSON")
+async def chat_batch(request: ChatBatchRequest, http_request: Request, x_tenant_id: Optional[str] = TENANT_HEADER):
+    log_request("batch", "chat_batch", {"requests_count": len(request.requests), "stream": request.stream})
+    if len(request.requests) > settings.CHAT_BATCH_MAX_ITEMS:
+        error = ValueError(f"Batch has {len(request.requests)} requests; at most {settings.CHAT_BATCH_MAX_ITEMS} are allowed")
+        return JSONResponse(status_code=400, content=format_error_response(error))
+    
+    # Items run in the same worker threads as /chat, at most `limit` of this batch at a time
+    limit = min(request.max_concurrency or settings.CHAT_BATCH_MAX_CONCURRENCY, settings.CHAT_BATCH_MAX_CONCURRENCY)
+    semaphore = asyncio.Semaphore(limit)
+    token = CancelToken()
+    
+    async def run(index, item):
+        async with semaphore:
+            return await run_in_threadpool(chat_batch_item, index, item, x_tenant_id, token)
+    
+    if not request.stream:
+        watcher = asyncio.create_task(cancel_on_disconnect(http_request, token))
+        try:
+            results = await asyncio.gather(*(run(i, item) for i, item in enumerate(request.requests)))
+        finally:
+            watcher.cancel()
+        return {"status": "success", "results": results}
+    
+    async def stream_results():
+        tasks = [asyncio.ensure_future(run(i, item)) for i, item in enumerate(request.requests)]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield json.dumps(await next_result) + "\n"
+        finally:
+            # A client that disconnects stops the items in flight and those that haven't started
+            token.cancel("client disconnected")
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
 @app.post("/embed", tags=["LLM Endpoints"],
          summary="Generate embeddings",
          description="Convert text into vector embeddings using the specified provider")
-def embed(request: EmbedRequest):
+def embed(request: EmbedRequest, x_tenant_id: Optional[str] = TENANT_HEADER):
     start_time = time.time()
     try:
         # Log the incoming request
@@ -113,13 +426,34 @@ def embed(request: EmbedRequest):
             "input_length": len(request.input)
         })
         
-        router = Router(request.provider)
-        response = router.embed(request.input, model=request.model)
+        router = Router(request.provider, tenant=x_tenant_id)
+        if request.encoding_format == "float":
+            response = router.embed(request.input, model=request.model)
+        else:
+            matrix = router.embed_matrix(request.input, model=request.model)
+            with span("encode", format=request.encoding_format):
+                if request.encoding_format in ("binary", "npy"):
+                    response = Response(
+                        content=embeddings_to_bytes(matrix, request.encoding_format),
+                        media_type="application/octet-stream",
+                        headers={
+                            "X-Embedding-Shape": f"{matrix.shape[0]},{matrix.shape[1]}",
+                            "X-Embedding-Dtype": "float32",
+                        }
+                    )
+                else:
+                    response = encode_embeddings(matrix, request.encoding_format, request.model)
         
         # Log the successful response
-        log_response(request.provider, "embed", 200, time.time() - start_time)
+        log_response(request.provider, "embed", 200, time.time() - start_time, request.model)
         return response
         
+    except RateLimitExceeded as e:
+        log_response(request.provider, "embed", 429, time.time() - start_time, request.model)
+        return rate_limited_response(e)
+    except ServerOverloaded as e:
+        log_response(request.provider, "embed", 503, time.time() - start_time, request.model)
+        return overloaded_response(e)
     except ValidationError as ve:
         log_error(ve, {"request": request.model_dump()})
         return JSONResponse(
@@ -133,30 +467,157 @@ def embed(request: EmbedRequest):
             content=format_error_response(e)
         )
 
-@app.post("/image", tags=["LLM Endpoints"],
-         summary="Generate an image",
-         description="Create an image based on a text prompt using the specified provider")
-def image(request: ImageRequest):
+@app.post("/documents", tags=["Documents"],
+         summary="Ingest documents",
+         description="Chunk documents, embed the chunks and index them into a collection for /search and chat retrieval")
+def documents(request: DocumentsRequest, x_tenant_id: Optional[str] = TENANT_HEADER):
     start_time = time.time()
     try:
         # Log the incoming request
-        log_request(request.provider, "image", {
-            "prompt_length": len(request.prompt)
+        log_request(request.provider, "documents", {
+            "model": request.model,
+            "collection": request.collection,
+            "documents_count": len(request.documents)
         })
         
-        router = Router(request.provider)
-        response = router.image(request.prompt)
+        router = Router(request.provider, tenant=x_tenant_id)
+        result = ingest_documents(
+            router,
+            MEMORY_STORE,
+            (document.model_dump() for document in request.documents),
+            collection=request.collection,
+            model=request.model,
+            chunk_size=request.chunk_size,
+            chunk_overlap=request.chunk_overlap,
+        )
         
         # Log the successful response
-        log_response(request.provider, "image", 200, time.time() - start_time)
-        return response
+        log_response(request.provider, "documents", 200, time.time() - start_time, request.model)
+        return {"status": "success", **result}
         
-    except ValidationError as ve:
-        log_error(ve, {"request": request.model_dump()})
+    except RateLimitExceeded as e:
+        log_response(request.provider, "documents", 429, time.time() - start_time, request.model)
+        return rate_limited_response(e)
+    except ServerOverloaded as e:
+        log_response(request.provider, "documents", 503, time.time() - start_time, request.model)
+        return overloaded_response(e)
+    except ValueError as e:
+        log_error(e, {"collection": request.collection, "provider": request.provider})
         return JSONResponse(
-            status_code=422,
-            content=format_error_response(ve)
+            status_code=400,
+            content=format_error_response(e)
+        )
+    except Exception as e:
+        log_error(e, {"collection": request.collection, "provider": request.provider})
+        return JSONResponse(
+            status_code=500,
+            content=format_error_response(e)
+        )
+
+@app.post("/search", tags=["Documents"],
+         summary="Search documents",
+         description="Return the chunks of a collection most similar to a query")
+def search(request: SearchRequest, x_tenant_id: Optional[str] = TENANT_HEADER):
+    start_time = time.time()
+    try:
+        log_request("documents", "search", {"collection": request.collection, "top_k": request.top_k})
+        
+        results = retrieve_documents(request.query, request.collection, request.top_k, tenant=x_tenant_id)
+        
+        log_response("documents", "search", 200, time.time() - start_time)
+        return {"status": "success", "collection": request.collection, "results": results}
+        
+    except RateLimitExceeded as e:
+        log_response("documents", "search", 429, time.time() - start_time)
+        return rate_limited_response(e)
+    except ServerOverloaded as e:
+        log_response("documents", "search", 503, time.time() - start_time)
+        return overloaded_response(e)
+    except Exception as e:
+        log_error(e, {"collection": request.collection})
+        return JSONResponse(
+            status_code=500,
+            content=format_error_response(e)
+        )
+
+@app.delete("/documents/{collection}/{document_id}", tags=["Documents"],
+           summary="Delete a document",
+           description="Remove every chunk of a document from a collection")
+def delete_document(collection: str, document_id: str):
+    try:
+        MEMORY_STORE.delete_document(collection, document_id)
+        return {"status": "success", "message": f"Document {document_id} has been deleted from {collection}"}
+    except Exception as e:
+        log_error(e, {"collection": collection, "document_id": document_id})
+        return JSONResponse(
+            status_code=500,
+            content=format_error_response(e)
+        )
+
+@app.post("/jobs", tags=["Jobs"],
+         summary="Start a batch job",
+         description="Run a JSONL file of chat/embed requests in the background, resuming from its checkpoint if one exists")
+def create_job(request: JobRequest):
+    try:
+        runner = start_job(resolve_job_path(request.input_path), resolve_job_path(request.output_path),
+                           request.concurrency)
+        return {"status": "success", "job": runner.status()}
+    except ValueError as e:
+        return JSONResponse(
+            status_code=400,
+            content=format_error_response(e)
+        )
+    except Exception as e:
+        log_error(e, {"request": request.model_dump()})
+        return JSONResponse(
+            status_code=500,
+            content=format_error_response(e)
+        )
+
+@app.get("/jobs/{job_id}", tags=["Jobs"],
+        summary="Get job status",
+        description="Progress of a batch job started through /jobs")
+def get_job(job_id: str):
+    runner = JOBS.get(job_id)
+    if runner is None:
+        return JSONResponse(
+            status_code=404,
+            content=format_error_response(KeyError(f"Job not found: {job_id}"))
+        )
+    return {"status": "success", "job": runner.status()}
+
+@app.delete("/jobs/{job_id}", tags=["Jobs"],
+           summary="Cancel a job",
+           description="Stop a batch job after its in-flight lines finish; starting it again resumes it")
+def cancel_job(job_id: str):
+    runner = JOBS.get(job_id)
+    if runner is None:
+        return JSONResponse(
+            status_code=404,
+            content=format_error_response(KeyError(f"Job not found: {job_id}"))
         )
+    runner.cancel()
+    return {"status": "success", "job": runner.status()}
+
+@app.post("/image", tags=["LLM Endpoints"],
+         summary="Generate an image",
+         description="Queue an image generation and return its job id; fetch the result from /image/{job_id}")
+def image(request: ImageRequest, x_tenant_id: Optional[str] = TENANT_HEADER):
+    try:
+        # Log the incoming request
+        log_request(request.provider, "image", {
+            "prompt_length": len(request.prompt)
+        })
+        
+        job = IMAGE_QUEUE.submit(request.provider, request.prompt, tenant=x_tenant_id)
+        return JSONResponse(
+            status_code=202,
+            content={"status": "success", "job": job.status()},
+            headers={"Location": f"/image/{job.id}"}
+        )
+        
+    except ServerOverloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         log_error(e, {"request": request.model_dump()})
         return JSONResponse(
@@ -164,6 +625,66 @@ def image(request: ImageRequest):
             content=format_error_response(e)
         )
 
+def image_job_not_found(job_id: str):
+    return JSONResponse(
+        status_code=404,
+        content=format_error_response(KeyError(f"Image job not found: {job_id}"))
+    )
+
+@app.get("/image/{job_id}", tags=["LLM Endpoints"],
+        summary="Get a generated image",
+        description="Serve a finished job's image file, or its status (202 while it is still running)")
+def get_image(job_id: str, index: int = 0):
+    job = IMAGE_QUEUE.get(job_id)
+    if job is None:
+        return image_job_not_found(job_id)
+    if not job.done.is_set():
+        return JSONResponse(
+            status_code=202,
+            content={"status": "success", "job": job.status()},
+            headers={"Retry-After": "1"}
+        )
+    if job.state == "failed":
+        return JSONResponse(
+            status_code=502,
+            content={"status": "error", "job": job.status()}
+        )
+    if not 0 <= index < len(job.files):
+        return image_job_not_found(f"{job_id}?index={index}")
+    stored = job.files[index]
+    # Content-addressed files never change, so clients may cache them indefinitely
+    return FileResponse(
+        stored["path"],
+        media_type=stored["media_type"],
+        headers={"ETag": f'"{stored["sha256"]}"', "Cache-Control": "public, max-age=31536000, immutable"}
+    )
+
+@app.get("/image/{job_id}/status", tags=["LLM Endpoints"],
+        summary="Get image job status",
+        description="State of an image job and the files it produced")
+def get_image_status(job_id: str):
+    job = IMAGE_QUEUE.get(job_id)
+    if job is None:
+        return image_job_not_found(job_id)
+    return {"status": "success", "job": job.status()}
+
+@app.websocket("/ws/image/{job_id}")
+async def ws_image(websocket: WebSocket, job_id: str):
+    """Send the job's status once it finishes, then close."""
+    await websocket.accept()
+    job = IMAGE_QUEUE.get(job_id)
+    if job is None:
+        await websocket.send_json(format_error_response(KeyError(f"Image job not found: {job_id}")))
+        await websocket.close()
+        return
+    loop = asyncio.get_running_loop()
+    finished = loop.create_future()
+    job.add_listener(lambda job: loop.call_soon_threadsafe(
+        lambda: finished.done() or finished.set_result(job.status())
+    ))
+    await websocket.send_json(await finished)
+    await websocket.close()
+
 @app.get("/tools", tags=["Tools"],
        summary="List available tools",
        description="Returns a list of all available tools that can be called via the API")
@@ -180,10 +701,17 @@ def get_tools():
             content=format_error_response(e)
         )
 
+def tool_error_status(error: Exception) -> int:
+    if isinstance(error, ToolNotFound):
+        return 404
+    if isinstance(error, ToolTimeout):
+        return 504
+    return 500
+
 @app.post("/call_tool", tags=["Tools"],
           summary="Execute a tool",
           description="Call a custom tool with specified arguments and return the result")
-def api_call_tool(request: CallToolRequest):
+async def api_call_tool(request: CallToolRequest):
     start_time = time.time()
     try:
         # Log the tool call
@@ -193,7 +721,7 @@ def api_call_tool(request: CallToolRequest):
             "kwargs_count": len(request.kwargs)
         })
         
-        result = call_tool(request.name, *request.args, **request.kwargs)
+        result = await TOOL_EXECUTOR.call(request.name, request.args, request.kwargs)
         
         log_response("system", "call_tool", 200, time.time() - start_time)
         return {"result": result}
@@ -205,67 +733,203 @@ def api_call_tool(request: CallToolRequest):
             content=format_error_response(ve)
         )
     except Exception as e:
-        log_error(e, {"request": request.model_dump()})
+        status_code = tool_error_status(e)
+        if status_code == 500:
+            log_error(e, {"request": request.model_dump()})
+        else:
+            log_response("system", "call_tool", status_code, time.time() - start_time)
         return JSONResponse(
-            status_code=500,
+            status_code=status_code,
             content=format_error_response(e)
         )
 
+async def call_tools_item(index: int, request: CallToolRequest) -> Dict[str, Any]:
+    """Run one call of a /call_tools request, turning its failure into a per-call error."""
+    start_time = time.time()
+    try:
+        result = await TOOL_EXECUTOR.call(request.name, request.args, request.kwargs)
+        log_response("system", "call_tools", 200, time.time() - start_time)
+        return {"index": index, "status": "success", "result": result}
+    except Exception as e:
+        status_code = tool_error_status(e)
+        if status_code == 500:
+            log_error(e, {"index": index, "name": request.name})
+        else:
+            log_response("system", "call_tools", status_code, time.time() - start_time)
+        return {"index": index, "status": "error", "status_code": status_code, **format_error_response(e)}
+
+@app.post("/call_tools", tags=["Tools"],
+          summary="Execute several tools",
+          description="Run a list of tool calls in parallel and return their results in order")
+async def api_call_tools(request: CallToolsRequest):
+    log_request("system", "call_tools", {"calls_count": len(request.calls)})
+    if len(request.calls) > settings.TOOL_CALLS_MAX_ITEMS:
+        error = ValueError(f"Request has {len(request.calls)} calls; at most {settings.TOOL_CALLS_MAX_ITEMS} are allowed")
+        return JSONResponse(status_code=400, content=format_error_response(error))
+    # Each tool's own concurrency limit decides how many of its calls actually run at once
+    results = await asyncio.gather(*(call_tools_item(i, call) for i, call in enumerate(request.calls)))
+    return {"status": "success", "results": results}
+
+def ws_chat_options(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Router.chat keyword arguments from a /ws_chat message."""
+    return {
+        "model": data.get("model"),
+        "profile": data.get("profile"),
+        "chat_id": data.get("chat_id"),
+        "user_id": data.get("user_id"),
+        "include_user_memory": data.get("include_user_memory", True),
+        "save_to_user_memory": data.get("save_to_user_memory", False),
+        "priority": data.get("priority", 0),
+        "cache": data.get("cache"),
+        "retrieve_top_k": data.get("retrieve_top_k", 0),
+        "collection": data.get("collection", "default"),
+        **{name: data[name] for name in SAMPLING_PARAMS if data.get(name) is not None},
+    }
+
+def response_content(response: Any) -> Optional[str]:
+    """The assistant text of an OpenAI- or Ollama-shaped chat response."""
+    if isinstance(response, dict):
+        if response.get("choices"):
+            return response["choices"][0].get("message", {}).get("content")
+        if isinstance(response.get("message"), dict):
+            return response["message"].get("content")
+    return None
+
+def ws_chat_turn(data: Dict[str, Any], tenant: Optional[str], session_memory: SessionMemory):
+    """Run one /ws_chat message through the router on a worker thread."""
+    provider = data.get("provider")
+    log_request(provider, "ws_chat", {
+        "request_id": data.get("id"),
+        "model": data.get("model"),
+        "chat_id": data.get("chat_id"),
+        "user_id": data.get("user_id"),
+        "messages_count": len(data.get("messages") or [])
+    })
+    router = Router(provider, tenant=tenant)
+    return router.chat(data.get("messages"), session_memory=session_memory, **ws_chat_options(data))
+
 @app.websocket("/ws_chat")
 async def websocket_chat(websocket: WebSocket):
+    """
+    Chat over a websocket.
+
+    A message without an "id" is answered on its own, as plain text chunks
+    followed by "[END]". Messages with an "id" are multiplexed: they run
+    concurrently, and every frame sent back is JSON tagged with that id
+    ({"type": "chunk" | "end" | "error" | "cancelled"}). A {"type": "cancel",
+    "id": ...} frame aborts the matching request.
+    """
     await websocket.accept()
-    start_time = time.time()
+    tenant = websocket.headers.get("x-tenant-id")
+    session_memory = SessionMemory(MEMORY_STORE)
+    send_lock = asyncio.Lock()
+    active: Dict[Any, CancelToken] = {}
+    tasks = set()
+    closed = False
+    
+    async def send(payload):
+        # Frames from concurrent requests must not interleave mid-message
+        async with send_lock:
+            if not closed:
+                await websocket.send_json(payload)
+    
+    async def generate(request_id, data, token):
+        start_time = time.time()
+        provider = data.get("provider")
+        try:
+            response = await run_in_threadpool(run_with_token, token, ws_chat_turn, data, tenant, session_memory)
+            content = response_content(response)
+            if content is not None:
+                for i in range(0, len(content), 20):
+                    if token.cancelled:
+                        CANCELLED.labels("ws_chat", "streaming").inc()
+                        raise RequestCancelled(token.reason, "streaming")
+                    await send({"id": request_id, "type": "chunk", "content": content[i:i+20]})
+                await send({"id": request_id, "type": "end", "usage": response.get("usage")})
+            else:
+                await send({"id": request_id, "type": "end", "response": response})
+            log_response(provider, "ws_chat", 200, time.time() - start_time, data.get("model"))
+        except RequestCancelled:
+            await send({"id": request_id, "type": "cancelled"})
+        except RateLimitExceeded as e:
+            log_response(provider, "ws_chat", 429, time.time() - start_time, data.get("model"))
+            await send({"id": request_id, "type": "error", "retry_after": e.retry_after, **format_error_response(e)})
+        except ServerOverloaded as e:
+            log_response(provider, "ws_chat", 503, time.time() - start_time, data.get("model"))
+            await send({"id": request_id, "type": "error", "retry_after": settings.OVERLOAD_RETRY_AFTER,
+                        **format_error_response(e)})
+        except Exception as e:
+            log_error(e, {"provider": provider, "endpoint": "ws_chat", "request_id": request_id})
+            await send({"id": request_id, "type": "error", **format_error_response(e)})
+        finally:
+            active.pop(request_id, None)
+    
+    # A receive started during a legacy turn is carried over to the next loop iteration
+    next_message = None
     try:
         while True:
-            data = await websocket.receive_json()
-            provider = data.get("provider")
-            messages = data.get("messages")
-            model = data.get("model")
-            profile = data.get("profile")
-            chat_id = data.get("chat_id")
-            user_id = data.get("user_id")
-            include_user_memory = data.get("include_user_memory", True)
-            save_to_user_memory = data.get("save_to_user_memory", False)
+            data = await (next_message or websocket.receive_json())
+            next_message = None
+            request_id = data.get("id")
             
-            # Log the websocket request
-            log_request(provider, "ws_chat", {
-                "model": model,
-                "profile": profile,
-                "chat_id": chat_id,
-                "user_id": user_id,
-                "include_user_memory": include_user_memory,
-                "save_to_user_memory": save_to_user_memory,
-                "messages_count": len(messages) if messages else 0
-            })
+            if data.get("type") == "cancel":
+                if request_id in active:
+                    active[request_id].cancel("cancelled by client")
+                continue
             
-            router = Router(provider)
-            # Simulate streaming by splitting response into chunks
-            response = router.chat(
-                messages, 
-                model=model, 
-                profile=profile, 
-                chat_id=chat_id,
-                user_id=user_id,
-                include_user_memory=include_user_memory,
-                save_to_user_memory=save_to_user_memory
-            )
+            if request_id is None:
+                # Legacy protocol: one request at a time, plain text chunks
+                start_time = time.time()
+                provider = data.get("provider")
+                token = CancelToken()
+                turn = asyncio.ensure_future(run_in_threadpool(run_with_token, token, ws_chat_turn,
+                                                               data, tenant, session_memory))
+                # Keep listening during the turn so a disconnect abandons the provider call
+                next_message = asyncio.ensure_future(websocket.receive_json())
+                await asyncio.wait({turn, next_message}, return_when=asyncio.FIRST_COMPLETED)
+                if next_message.done() and next_message.exception() is not None:
+                    token.cancel("client disconnected")
+                    with contextlib.suppress(Exception):
+                        await turn
+                    raise next_message.exception()
+                response = await turn
+                content = response_content(response) if isinstance(response, dict) and "choices" in response else None
+                if content is not None:
+                    # Stream content in chunks
+                    for i in range(0, len(content), 20):
+                        await websocket.send_text(content[i:i+20])
+                        await asyncio.sleep(0.05)
+                    await websocket.send_text("[END]")
+                else:
+                    await websocket.send_text(str(response))
+                log_response(provider, "ws_chat", 200, time.time() - start_time, data.get("model"))
+                continue
             
-            if isinstance(response, dict) and "choices" in response:
-                content = response["choices"][0]["message"]["content"]
-                # Stream content in chunks
-                for i in range(0, len(content), 20):
-                    await websocket.send_text(content[i:i+20])
-                    await asyncio.sleep(0.05)
-                await websocket.send_text("[END]")
+            if request_id in active:
+                await send({"id": request_id, "type": "error",
+                            **format_error_response(ValueError(f"Request {request_id} is already running"))})
+            elif len(active) >= settings.WS_MAX_CONCURRENT_REQUESTS:
+                await send({"id": request_id, "type": "error", **format_error_response(ServerOverloaded(
+                    f"At most {settings.WS_MAX_CONCURRENT_REQUESTS} requests may run at once on one connection"))})
             else:
-                await websocket.send_text(str(response))
-                
-            # Log successful websocket response
-            log_response(provider, "ws_chat", 200, time.time() - start_time)
+                token = CancelToken()
+                active[request_id] = token
+                task = asyncio.create_task(generate(request_id, data, token))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
             
+    except WebSocketDisconnect:
+        closed = True
+        for token in list(active.values()):
+            token.cancel("client disconnected")
     except Exception as e:
+        closed = True
+        for token in list(active.values()):
+            token.cancel("connection failed")
+        if next_message is not None:
+            next_message.cancel()
         log_error(e, {
-            "provider": provider if 'provider' in locals() else "unknown",
+            "provider": data.get("provider", "unknown") if 'data' in locals() and isinstance(data, dict) else "unknown",
             "endpoint": "ws_chat"
         })
         await websocket.close(code=1011, reason=str(e))
@@ -300,6 +964,46 @@ def health_check():
     
     return health_status
 
+@app.get("/metrics", tags=["System"],
+        summary="Prometheus metrics",
+        description="Returns runtime metrics in the Prometheus text exposition format")
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def admin_denied(token: Optional[str]) -> Optional[JSONResponse]:
+    """The response refusing a debug request, or None when `token` is the admin token."""
+    if admin_authorized(token):
+        return None
+    if not settings.ADMIN_TOKEN:
+        # Debug endpoints don't exist until an admin token is configured
+        return JSONResponse(status_code=404, content={"detail": "Not Found"})
+    return JSONResponse(status_code=403, content=format_error_response(PermissionError("Invalid admin token")))
+
+@app.get("/debug/profile", tags=["Debug"],
+        summary="Sample all threads",
+        description="Run a sampling profiler across every thread for N seconds and return collapsed stacks")
+async def debug_profile(seconds: float = 10, interval: Optional[float] = None,
+                        x_admin_token: Optional[str] = Header(None)):
+    denied = admin_denied(x_admin_token)
+    if denied:
+        return denied
+    seconds = min(max(seconds, 0), settings.PROFILE_MAX_SECONDS)
+    log_request("system", "debug.profile", {"seconds": seconds, "interval": interval})
+    stacks = await run_in_threadpool(StackSampler(interval).run, seconds)
+    return PlainTextResponse(stacks)
+
+@app.get("/debug/profiles/{profile_id}", tags=["Debug"],
+        summary="Get a request profile",
+        description="Return the collapsed stacks captured for a request sent with an X-Profile header")
+def get_request_profile(profile_id: str, x_admin_token: Optional[str] = Header(None)):
+    denied = admin_denied(x_admin_token)
+    if denied:
+        return denied
+    profile = PROFILES.get(profile_id)
+    if profile is None:
+        return JSONResponse(status_code=404, content=format_error_response(KeyError(f"Profile not found: {profile_id}")))
+    return PlainTextResponse(profile.collapsed(), headers={"X-Profile-Mode": profile.mode})
+
 @app.delete("/memory/conversation/{conversation_id}", tags=["Memory Management"],
            summary="Delete conversation memory",
            description="Delete all memory associated with a specific conversation")
@@ -0,0 +1,65 @@
+import threading
+import metrics
+
+MICRO_BATCH_SIZE = metrics.histogram(
+    'smart_host_micro_batch_size', 'Items merged into one upstream call by the micro-batcher', ['batcher'],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+
+class _Batch:
+    __slots__ = ('items', 'full', 'done', 'results', 'error')
+
+    def __init__(self):
+        self.items = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+class MicroBatcher:
+    """
+    Merges concurrent single-item calls with the same key into one batched call.
+
+    The first caller to arrive for a key opens a batch and waits up to
+    `window` seconds (or until the batch holds `max_size` items) for others
+    to join; it then runs the batch function once and every caller gets the
+    result at its own position.
+    """
+
+    def __init__(self, name, window, max_size):
+        self.name = name
+        self.window = window
+        self.max_size = max_size
+        self._open = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, item, run_batch):
+        """Add item to the open batch for key; run_batch(items) -> results is only called by the leader."""
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._open[key] = _Batch()
+            index = len(batch.items)
+            batch.items.append(item)
+            if len(batch.items) >= self.max_size:
+                del self._open[key]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._open.get(key) is batch:
+                    del self._open[key]
+            MICRO_BATCH_SIZE.labels(self.name).observe(len(batch.items))
+            try:
+                batch.results = run_batch(batch.items)
+            except Exception as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[index]
@@ -0,0 +1,273 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+import httpx
+from benchmarks.stats import compare, distribution
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = ("chat", "chat_memory", "embed", "ws_chat", "call_tool")
+
+class Sample:
+    __slots__ = ("latency", "ttft", "overhead", "ok")
+
+    def __init__(self, latency, ttft=None, overhead=None, ok=True):
+        self.latency = latency
+        self.ttft = ttft
+        self.overhead = overhead
+        self.ok = ok
+
+def server_overhead(header):
+    """Smart-Host's own time from a Server-Timing header: the total minus time spent in provider calls."""
+    if not header:
+        return None
+    durations = {}
+    for entry in header.split(","):
+        name, _, params = entry.strip().partition(";")
+        if params.startswith("dur="):
+            durations[name] = durations.get(name, 0.0) + float(params[4:])
+    if "total" not in durations:
+        return None
+    return max(0.0, durations["total"] - durations.get("provider", 0.0)) / 1000
+
+def chat_body(options, i, memory=False):
+    body = {
+        "provider": options.provider,
+        "messages": [{"role": "user", "content": f"Benchmark request {i}: summarize the plot of a short story."}],
+    }
+    if options.model:
+        body["model"] = options.model
+    if memory:
+        # A fixed pool of conversations and users so memory grows the way it does in production
+        body["chat_id"] = f"bench-chat-{i % options.conversations}"
+        body["user_id"] = f"bench-user-{i % max(1, options.conversations // 10)}"
+        body["save_to_user_memory"] = True
+    return body
+
+def http_request(name, options, i):
+    """(path, json body) of the i-th request of an HTTP scenario."""
+    if name == "chat":
+        return "/chat", chat_body(options, i)
+    if name == "chat_memory":
+        return "/chat", chat_body(options, i, memory=True)
+    if name == "embed":
+        body = {"provider": options.provider, "input": [f"benchmark passage {i} {j}" for j in range(options.embed_batch)]}
+        if options.embed_model:
+            body["model"] = options.embed_model
+        return "/embed", body
+    if name == "call_tool":
+        return "/call_tool", {"name": "add", "args": [i, 1]}
+    raise ValueError(f"Unknown scenario: {name}")
+
+async def timed_http(client, name, options, i):
+    path, body = http_request(name, options, i)
+    start = time.perf_counter()
+    ttft = None
+    async with client.stream("POST", path, json=body) as response:
+        async for _ in response.aiter_bytes():
+            if ttft is None:
+                ttft = time.perf_counter() - start
+        latency = time.perf_counter() - start
+        return Sample(latency, ttft, server_overhead(response.headers.get("server-timing")),
+                      response.status_code < 400)
+
+async def ws_worker(options, next_index, samples, deadline):
+    """One connection sending /ws_chat requests one after another, timing the first chunk and the end."""
+    try:
+        import websockets
+    except ImportError:
+        raise SystemExit("The ws_chat scenario needs the 'websockets' package (pip install websockets)")
+    url = options.url.replace("http", "ws", 1).rstrip("/") + "/ws_chat"
+    async with websockets.connect(url, max_size=None) as websocket:
+        while True:
+            i = next_index()
+            if i is None or time.perf_counter() > deadline:
+                return
+            request_id = uuid.uuid4().hex
+            start = time.perf_counter()
+            await websocket.send(json.dumps({**chat_body(options, i), "id": request_id}))
+            ttft, ok = None, True
+            while True:
+                frame = json.loads(await websocket.recv())
+                if frame.get("id") != request_id:
+                    continue
+                if frame["type"] == "chunk" and ttft is None:
+                    ttft = time.perf_counter() - start
+                if frame["type"] in ("end", "error", "cancelled"):
+                    ok = frame["type"] == "end"
+                    break
+            if i >= 0:
+                samples.append(Sample(time.perf_counter() - start, ttft, None, ok))
+
+async def run_scenario(name, options, transport=None):
+    """
+    Drive one scenario at options.concurrency and summarize it.
+
+    The first options.warmup requests are sent but not measured. The run
+    stops after options.requests measured requests or options.duration
+    seconds, whichever comes first.
+    """
+    total = options.warmup + options.requests
+    counter = iter(range(total))
+    samples = []
+
+    def next_index():
+        # Warm-up requests get negative indices so they aren't recorded
+        i = next(counter, None)
+        return None if i is None else i - options.warmup
+
+    started = time.perf_counter()
+    deadline = started + options.duration if options.duration else float("inf")
+
+    if name == "ws_chat":
+        await asyncio.gather(*(ws_worker(options, next_index, samples, deadline) for _ in range(options.concurrency)))
+    else:
+        limits = httpx.Limits(max_connections=options.concurrency, max_keepalive_connections=options.concurrency)
+        async with httpx.AsyncClient(base_url=options.url, transport=transport, limits=limits,
+                                     timeout=options.timeout) as client:
+            async def worker():
+                while True:
+                    i = next_index()
+                    if i is None or time.perf_counter() > deadline:
+                        return
+                    try:
+                        sample = await timed_http(client, name, options, i)
+                    except httpx.HTTPError:
+                        sample = Sample(None, ok=False)
+                    if i >= 0:
+                        samples.append(sample)
+            await asyncio.gather(*(worker() for _ in range(options.concurrency)))
+
+    elapsed = time.perf_counter() - started
+    errors = sum(1 for s in samples if not s.ok)
+    ok = [s for s in samples if s.ok]
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": distribution([s.latency for s in ok]),
+        "ttft_ms": distribution([s.ttft for s in ok]),
+        "overhead_ms": distribution([s.overhead for s in ok]),
+    }
+
+def wait_until_ready(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+def spawn_servers(options):
+    """Start the mock provider and a Smart-Host pointed at it, in a scratch directory."""
+    workdir = tempfile.mkdtemp(prefix="smart-host-bench-")
+    mock_url = f"http://127.0.0.1:{options.mock_port}"
+    mock = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "mock_provider.py"), "--port", str(options.mock_port),
+         "--latency", options.mock_latency, "--token-rate", str(options.mock_token_rate),
+         "--completion-tokens", str(options.mock_completion_tokens), "--seed", "0"],
+        cwd=workdir)
+    env = {
+        **os.environ,
+        "OPENAI_BASE_URL": f"{mock_url}/v1/",
+        "OPENROUTER_BASE_URL": f"{mock_url}/v1/",
+        "OLLAMA_HOST": mock_url,
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "mock-key"),
+        "OPENROUTER_API_KEY": os.environ.get("OPENROUTER_API_KEY", "mock-key"),
+        "LOG_FILE": "",
+        "LOG_LEVEL": "WARNING",
+    }
+    port = options.url.rsplit(":", 1)[-1].rstrip("/")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api_wrapper:app", "--app-dir", ROOT, "--port", port,
+         "--log-level", "warning"],
+        cwd=workdir, env=env)
+    try:
+        wait_until_ready(f"{mock_url}/docs")
+        wait_until_ready(f"{options.url.rstrip('/')}/metrics")
+    except Exception:
+        stop_servers([mock, server])
+        raise
+    return [mock, server]
+
+def stop_servers(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait(timeout=10)
+
+async def run(options):
+    results = {
+        "meta": {
+            "timestamp": time.time(),
+            "url": options.url,
+            "provider": options.provider,
+            "concurrency": options.concurrency,
+            "requests": options.requests,
+            "duration": options.duration,
+        },
+        "scenarios": {},
+    }
+    for name in options.scenarios:
+        results["scenarios"][name] = await run_scenario(name, options)
+        print(f"{name}: {json.dumps(results['scenarios'][name])}", file=sys.stderr)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test Smart-Host and compare against a saved baseline")
+    parser.add_argument("--url", default="http://127.0.0.1:8080", help="Smart-Host base URL")
+    parser.add_argument("--scenario", dest="scenarios", action="append", choices=SCENARIOS,
+                        help="Scenario to run; repeat for several (default: all but ws_chat)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at once (default: 16)")
+    parser.add_argument("--requests", type=int, default=500, help="Measured requests per scenario (default: 500)")
+    parser.add_argument("--duration", type=float, default=0, help="Stop each scenario after this many seconds")
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests first (default: 20)")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds")
+    parser.add_argument("--provider", default="openai")
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--embed-model", default=None)
+    parser.add_argument("--embed-batch", type=int, default=8, help="Texts per /embed request (default: 8)")
+    parser.add_argument("--conversations", type=int, default=100,
+                        help="Distinct chat_ids used by chat_memory (default: 100)")
+    parser.add_argument("--output", default=None, help="Write results JSON here")
+    parser.add_argument("--baseline", default=None, help="Compare against this results JSON")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Allowed relative regression in throughput or latency percentiles (default: 0.1)")
+    parser.add_argument("--spawn", action="store_true",
+                        help="Start mock_provider.py and a Smart-Host pointed at it for the run")
+    parser.add_argument("--mock-port", type=int, default=9000)
+    parser.add_argument("--mock-latency", default="lognormal:0.2,0.5")
+    parser.add_argument("--mock-token-rate", type=float, default=0)
+    parser.add_argument("--mock-completion-tokens", type=int, default=50)
+    options = parser.parse_args(argv)
+    options.scenarios = options.scenarios or [s for s in SCENARIOS if s != "ws_chat"]
+
+    processes = spawn_servers(options) if options.spawn else []
+    try:
+        results = asyncio.run(run(options))
+    finally:
+        stop_servers(processes)
+
+    print(json.dumps(results, indent=2))
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if options.baseline:
+        with open(options.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), options.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,324 @@
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from benchmarks.stats import compare, distribution
+from memory.vector_store import InMemoryVectorStore, SQLiteVectorStore
+
+WORKLOADS = ("add", "query", "delete_conversation", "delete_user_memory", "mixed")
+
+# Workloads that remove data; the store is reloaded before each one after the first
+DESTRUCTIVE = ("delete_conversation", "delete_user_memory", "mixed")
+
+# Operation mix of the "mixed" workload
+MIXED = (("query", 0.7), ("add", 0.25), ("delete_conversation", 0.05))
+
+WORDS = ("remember that the user prefers short answers about python sqlite vectors memory chat "
+         "tokens latency routing models providers embeddings").split()
+
+def skewed_weights(n, skew):
+    """Zipf-like weights over n ranks: with skew around 1, a handful of ranks get most of the mass."""
+    weights = np.arange(1, n + 1, dtype=np.float64) ** -skew
+    return weights / weights.sum()
+
+class Dataset:
+    """
+    A synthetic population of users and chats with production-like skew.
+
+    Users own chats with Zipf weights, so a few users have thousands of
+    chats. Messages land in chats with Zipf weights too, so a few chats are
+    huge and most have only a handful of entries. `user_fraction` of the
+    rows are long-term user memories, skewed towards the same heavy users.
+    """
+
+    def __init__(self, rows, users, chats, skew=1.1, user_fraction=0.2, text_size=200, seed=0):
+        self.rows = rows
+        self.users = users
+        self.chats = chats
+        self.user_fraction = user_fraction
+        self.rng = np.random.default_rng(seed)
+        self.user_weights = skewed_weights(users, skew)
+        self.chat_weights = skewed_weights(chats, skew)
+        self.chat_cdf = np.cumsum(self.chat_weights)
+        self.chat_user = self.rng.choice(users, size=chats, p=self.user_weights)
+        # Every load of the dataset yields the same rows
+        self.batch_seed = int(self.rng.integers(1 << 32))
+        words = random.Random(seed)
+        self.texts = [" ".join(words.choice(WORDS) for _ in range(max(1, int(words.expovariate(1 / text_size) / 6))))
+                      for _ in range(1024)]
+
+    @staticmethod
+    def chat_id(index):
+        return f"chat-{index}"
+
+    @staticmethod
+    def user_id(index):
+        return f"user-{index}"
+
+    def entry(self, rng, memory_type, index, user, timestamp):
+        """(id, text, metadata, user_id) of one memory entry as Router stores it."""
+        metadata = {"role": "user" if rng.random() < 0.5 else "assistant", "timestamp": timestamp}
+        text = self.texts[int(rng.integers(len(self.texts)))]
+        if memory_type == "user":
+            return self.user_id(user), text, metadata, None
+        return self.chat_id(index), text, metadata, self.user_id(user)
+
+    def batches(self, batch_size=100_000):
+        """Yield (conversation_rows, user_rows) in chunks, each row being (id, text, metadata, user_id)."""
+        rng = np.random.default_rng(self.batch_seed)
+        timestamp = time.time() - self.rows
+        produced = 0
+        while produced < self.rows:
+            size = min(batch_size, self.rows - produced)
+            n_user = int(rng.binomial(size, self.user_fraction))
+            chats = rng.choice(self.chats, size=size - n_user, p=self.chat_weights)
+            users = rng.choice(self.users, size=n_user, p=self.user_weights)
+            conversation = [self.entry(rng, "conversation", c, self.chat_user[c], timestamp + produced + i)
+                            for i, c in enumerate(chats)]
+            user = [self.entry(rng, "user", 0, u, timestamp + produced + i) for i, u in enumerate(users)]
+            produced += size
+            yield conversation, user
+
+    def hot_chat(self, rng):
+        """A chat picked with the same skew as traffic: busy chats are read and written most."""
+        return min(int(np.searchsorted(self.chat_cdf, rng.random())), self.chats - 1)
+
+class InMemoryBackend:
+    name = "memory"
+
+    def __init__(self, path=None):
+        self.store = InMemoryVectorStore()
+
+    def load(self, conversation_rows, user_rows):
+        for id, text, metadata, _ in conversation_rows:
+            self.store.add(id, text, metadata, 'conversation')
+        for id, text, metadata, _ in user_rows:
+            self.store.add(id, text, metadata, 'user')
+
+    def add(self, id, text, metadata, memory_type, user_id=None):
+        self.store.add(id, text, metadata, memory_type)
+
+    def query(self, chat_id, user_id, top_k=5):
+        # This store keys user memory by the id queried, so a chat's context takes two lookups
+        return self.store.query(chat_id, include_user_memory=False, top_k=top_k) + self.store.query(user_id, top_k=top_k)
+
+    def delete_conversation(self, chat_id):
+        self.store.delete_conversation(chat_id)
+
+    def delete_user_memory(self, user_id):
+        self.store.delete_user_memory(user_id)
+
+    def delete_all(self):
+        self.store.delete_all_conversation_memories()
+        self.store.delete_all_user_memories()
+
+    def size_bytes(self):
+        return None
+
+class SQLiteBackend:
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self.store = SQLiteVectorStore(path)
+
+    def load(self, conversation_rows, user_rows):
+        # Seeding through add() would cost a connection and a commit per row, so load in bulk
+        with sqlite3.connect(self.path) as conn:
+            conn.executemany('''INSERT INTO conversation_memory (chat_id, user_id, vector, role, timestamp, metadata)
+                                VALUES (?, ?, ?, ?, ?, ?)''',
+                             [(id, user_id, text, m["role"], m["timestamp"], json.dumps(m))
+                              for id, text, m, user_id in conversation_rows])
+            conn.executemany('''INSERT INTO user_memory (user_id, vector, role, timestamp, metadata)
+                                VALUES (?, ?, ?, ?, ?)''',
+                             [(id, text, m["role"], m["timestamp"], json.dumps(m)) for id, text, m, _ in user_rows])
+
+    def add(self, id, text, metadata, memory_type, user_id=None):
+        self.store.add(id, text, metadata, memory_type, user_id=user_id)
+
+    def query(self, chat_id, user_id, top_k=5):
+        return self.store.query(chat_id, user_id=user_id, top_k=top_k)
+
+    def delete_conversation(self, chat_id):
+        self.store.delete_conversation(chat_id)
+
+    def delete_user_memory(self, user_id):
+        self.store.delete_user_memory(user_id)
+
+    def delete_all(self):
+        self.store.delete_all_conversation_memories()
+        self.store.delete_all_user_memories()
+
+    def size_bytes(self):
+        return sum(os.path.getsize(self.path + suffix) for suffix in ("", "-wal", "-journal")
+                   if os.path.exists(self.path + suffix))
+
+# Backends by name; a new store gets an adapter with the same methods and an entry here
+BACKENDS = {"memory": InMemoryBackend, "sqlite": SQLiteBackend}
+
+def run_workload(backend, dataset, workload, ops, threads, seed=0):
+    """
+    Run `ops` operations of one workload on `threads` threads and summarize them.
+
+    Deletes walk chats and users hottest first, so each one removes data
+    that is still there, and stop early once every chat or user is gone.
+    """
+    rng = np.random.default_rng(seed)
+    lock = threading.Lock()
+    deletable = {"delete_conversation": iter(range(dataset.chats)), "delete_user_memory": iter(range(dataset.users))}
+    plan = iter(range(ops))
+    latencies = []
+    errors = [0]
+
+    def prepare(kind, worker_rng):
+        """The call for one operation, with its arguments drawn up front so they aren't timed."""
+        if kind in deletable:
+            with lock:
+                index = next(deletable[kind], None)
+            if index is None:
+                return None
+            if kind == "delete_conversation":
+                return lambda: backend.delete_conversation(dataset.chat_id(index))
+            return lambda: backend.delete_user_memory(dataset.user_id(index))
+        chat = dataset.hot_chat(worker_rng)
+        user = int(dataset.chat_user[chat])
+        if kind == "query":
+            return lambda: backend.query(dataset.chat_id(chat), dataset.user_id(user))
+        memory_type = "user" if worker_rng.random() < dataset.user_fraction else "conversation"
+        id, text, metadata, user_id = dataset.entry(worker_rng, memory_type, chat, user, time.time())
+        return lambda: backend.add(id, text, metadata, memory_type, user_id=user_id)
+
+    def worker(worker_seed):
+        worker_rng = np.random.default_rng(worker_seed)
+        kinds, weights = zip(*MIXED)
+        local, failed = [], 0
+        while True:
+            with lock:
+                if next(plan, None) is None:
+                    break
+            kind = workload if workload != "mixed" else kinds[worker_rng.choice(len(kinds), p=weights)]
+            call = prepare(kind, worker_rng)
+            if call is None:
+                break
+            start = time.perf_counter()
+            try:
+                call()
+            except Exception:
+                failed += 1
+                continue
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for future in [pool.submit(worker, int(rng.integers(1 << 32))) for _ in range(threads)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+    done = len(latencies) + errors[0]
+    return {
+        "ops": done,
+        "errors": errors[0],
+        "error_rate": round(errors[0] / done, 4) if done else 0.0,
+        "ops_per_sec": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": distribution(latencies),
+    }
+
+def load(backend, dataset, batch_size=100_000):
+    started = time.perf_counter()
+    for conversation_rows, user_rows in dataset.batches(batch_size):
+        backend.load(conversation_rows, user_rows)
+    return time.perf_counter() - started
+
+def benchmark_backend(name, options, workdir):
+    """
+    Load a fresh store for each thread count, run every workload on it, and return the results.
+
+    The store is emptied and reloaded before each destructive workload after
+    the first, so every workload runs against the full dataset.
+    """
+    results, storage = {}, {}
+    for threads in options.threads:
+        path = os.path.join(workdir, f"{name}-{threads}.sqlite3")
+        backend = BACKENDS[name](path)
+        dataset = Dataset(options.rows, options.users, options.chats, options.skew, options.user_fraction,
+                          options.text_size, options.seed)
+        load_seconds = load(backend, dataset)
+        storage[f"{name}.t{threads}"] = {"rows": options.rows, "load_seconds": round(load_seconds, 3),
+                                         "size_bytes": backend.size_bytes()}
+        damaged = False
+        for workload in options.workloads:
+            if damaged and workload in DESTRUCTIVE:
+                backend.delete_all()
+                load(backend, dataset)
+                damaged = False
+            damaged = damaged or workload in DESTRUCTIVE
+            key = f"{name}.{workload}.t{threads}"
+            results[key] = run_workload(backend, dataset, workload, options.ops, threads, options.seed)
+            print(f"{key}: {json.dumps(results[key])}", file=sys.stderr)
+        start = time.perf_counter()
+        backend.delete_all()
+        results[f"{name}.delete_all.t{threads}"] = {"ops": 1, "latency_ms": distribution([time.perf_counter() - start])}
+        storage[f"{name}.t{threads}"]["size_after_bytes"] = backend.size_bytes()
+        if os.path.exists(path) and not options.keep:
+            os.remove(path)
+    return results, storage
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark memory store backends on synthetic, skewed data")
+    parser.add_argument("--backend", dest="backends", action="append", choices=sorted(BACKENDS),
+                        help="Backend to benchmark; repeat for several (default: all)")
+    parser.add_argument("--workload", dest="workloads", action="append", choices=WORKLOADS,
+                        help="Workload to run; repeat for several (default: all)")
+    parser.add_argument("--rows", type=int, default=100_000, help="Entries loaded before measuring (default: 100000)")
+    parser.add_argument("--users", type=int, default=1_000, help="Distinct users (default: 1000)")
+    parser.add_argument("--chats", type=int, default=20_000, help="Distinct chats (default: 20000)")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of users and chats (default: 1.1)")
+    parser.add_argument("--user-fraction", type=float, default=0.2, help="Share of rows that are user memory")
+    parser.add_argument("--text-size", type=int, default=200, help="Mean entry length in characters (default: 200)")
+    parser.add_argument("--ops", type=int, default=2_000, help="Operations per workload (default: 2000)")
+    parser.add_argument("--threads", default="1,4,16", help="Comma-separated thread counts (default: 1,4,16)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dir", default=None, help="Where to create the database files (default: a temp dir)")
+    parser.add_argument("--keep", action="store_true", help="Keep the database files afterwards")
+    parser.add_argument("--output", default=None, help="Write results JSON here")
+    parser.add_argument("--baseline", default=None, help="Compare against this results JSON")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Allowed relative regression in ops/sec or latency percentiles (default: 0.1)")
+    options = parser.parse_args(argv)
+    options.backends = options.backends or sorted(BACKENDS)
+    options.workloads = options.workloads or list(WORKLOADS)
+    options.threads = [int(t) for t in options.threads.split(",")]
+
+    workdir = options.dir or tempfile.mkdtemp(prefix="smart-host-store-bench-")
+    results = {"meta": {"timestamp": time.time(), "rows": options.rows, "users": options.users,
+                        "chats": options.chats, "skew": options.skew, "ops": options.ops,
+                        "threads": options.threads},
+               "scenarios": {}, "storage": {}}
+    for name in options.backends:
+        scenarios, storage = benchmark_backend(name, options, workdir)
+        results["scenarios"].update(scenarios)
+        results["storage"].update(storage)
+
+    print(json.dumps(results, indent=2))
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if options.baseline:
+        with open(options.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), options.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
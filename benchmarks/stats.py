@@ -0,0 +1,57 @@
+import math
+
+# Metrics where a higher value is better; everything else regresses upward
+HIGHER_IS_BETTER = ("throughput_rps", "ops_per_sec")
+
+def percentile(sorted_values, q):
+    """The q-th percentile (0-100) of already sorted values, interpolating between ranks."""
+    if not sorted_values:
+        return None
+    rank = (len(sorted_values) - 1) * q / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+def distribution(values, scale=1000):
+    """p50/p95/p99/mean/max of values in seconds, reported in milliseconds by default."""
+    values = sorted(v * scale for v in values if v is not None)
+    if not values:
+        return None
+    return {
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "mean": round(sum(values) / len(values), 3),
+        "max": round(values[-1], 3),
+    }
+
+def compare(results, baseline, tolerance=0.1, error_tolerance=0.01):
+    """
+    Compare two result sets of the form {"scenarios": {name: {metric: value or {stat: value}}}}.
+
+    Returns human-readable regressions: throughput more than `tolerance`
+    below the baseline, p50/p95/p99 more than `tolerance` above it, or an
+    error rate more than `error_tolerance` above it. Scenarios missing from
+    either side are skipped.
+    """
+    regressions = []
+    for name, base in baseline.get("scenarios", {}).items():
+        current = results.get("scenarios", {}).get(name)
+        if current is None:
+            continue
+        for metric, base_value in base.items():
+            value = current.get(metric)
+            if value is None or base_value is None:
+                continue
+            if metric == "error_rate":
+                if value > base_value + error_tolerance:
+                    regressions.append(f"{name}: error_rate {value:.3f} vs baseline {base_value:.3f}")
+            elif metric in HIGHER_IS_BETTER:
+                if value < base_value * (1 - tolerance):
+                    regressions.append(f"{name}: {metric} {value:.1f} vs baseline {base_value:.1f}")
+            elif isinstance(base_value, dict):
+                for stat in ("p50", "p95", "p99"):
+                    if stat in base_value and value.get(stat) is not None \
+                            and value[stat] > base_value[stat] * (1 + tolerance):
+                        regressions.append(f"{name}: {metric} {stat} {value[stat]:.2f} vs baseline "
+                                           f"{base_value[stat]:.2f}")
+    return regressions
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import metrics
+from settings import settings
+
+CACHE_REQUESTS = metrics.counter(
+    'smart_host_response_cache_requests_total', 'Response cache lookups by result', ['result'])
+
+def cache_key(*parts):
+    """Canonical sha256 of JSON-serializable parts; dict ordering and whitespace don't matter."""
+    canonical = json.dumps(parts, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """
+    Exact-match cache of provider responses.
+
+    A bounded in-process LRU sits in front of an optional SQLite table so
+    entries survive restarts. Values are stored serialized, so every hit
+    hands the caller a fresh copy it is free to mutate.
+    """
+
+    def __init__(self, max_entries=None, ttl=None, db_path=None):
+        self.max_entries = settings.RESPONSE_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.ttl = settings.RESPONSE_CACHE_TTL if ttl is None else ttl
+        self.db_path = settings.RESPONSE_CACHE_DB_PATH if db_path is None else db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        if self.db_path:
+            self._init_db()
+
+    def _init_db(self):
+        with self._get_conn() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            conn.commit()
+
+    def _get_conn(self):
+        return sqlite3.connect(self.db_path, check_same_thread=False)
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    CACHE_REQUESTS.labels('hit_memory').inc()
+                    return json.loads(entry[0])
+                del self._entries[key]
+        if self.db_path:
+            with self._get_conn() as conn:
+                row = conn.execute(
+                    'SELECT value, expires_at FROM response_cache WHERE key=? AND expires_at>?', (key, now)
+                ).fetchone()
+            if row:
+                self._remember(key, row[0], row[1])
+                CACHE_REQUESTS.labels('hit_disk').inc()
+                return json.loads(row[0])
+        CACHE_REQUESTS.labels('miss').inc()
+        return None
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        serialized = json.dumps(value)
+        self._remember(key, serialized, expires_at)
+        if self.db_path:
+            with self._get_conn() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)',
+                    (key, serialized, expires_at)
+                )
+                self._writes += 1
+                if self._writes % 1000 == 0:
+                    conn.execute('DELETE FROM response_cache WHERE expires_at<=?', (time.time(),))
+                conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            with self._get_conn() as conn:
+                conn.execute('DELETE FROM response_cache')
+                conn.commit()
+
+RESPONSE_CACHE = ResponseCache()
@@ -0,0 +1,127 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from settings import settings
+
+CANCELLED = metrics.counter(
+    'smart_host_cancelled_requests_total', 'Requests abandoned because the caller went away or cancelled them',
+    ['endpoint', 'stage'])
+
+class RequestCancelled(Exception):
+    """
+    Raised inside the request pipeline once its caller has gone away or asked it to stop.
+
+    `stage` says how far the request got: "queued" (waiting for capacity),
+    "upstream" (provider call in flight) or "response" (the provider had
+    already answered). `abandoned` is the future of a provider call that
+    was left running, if any.
+    """
+
+    def __init__(self, reason=None, stage="upstream", abandoned=None):
+        super().__init__(reason or "cancelled")
+        self.stage = stage
+        self.abandoned = abandoned
+
+class CancelToken:
+    """A thread-safe flag shared by a request's handler and the worker thread running it."""
+
+    def __init__(self):
+        self.reason = None
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason="cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback):
+        """Run `callback()` on cancellation (now if already cancelled); returns a function that unregisters it."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._discard(callback)
+        callback()
+        return lambda: None
+
+    def _discard(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self, stage="upstream"):
+        if self._event.is_set():
+            raise RequestCancelled(self.reason, stage)
+
+# The token of the request the current thread or task is working on, if it can be cancelled
+_CURRENT_TOKEN = contextvars.ContextVar('cancel_token', default=None)
+
+def current_token():
+    return _CURRENT_TOKEN.get()
+
+def set_current_token(token):
+    """Make `token` current; returns a handle for reset_current_token()."""
+    return _CURRENT_TOKEN.set(token)
+
+def reset_current_token(handle):
+    _CURRENT_TOKEN.reset(handle)
+
+def check_cancelled(stage="queued"):
+    """Raise RequestCancelled if the current request has been cancelled."""
+    token = _CURRENT_TOKEN.get()
+    if token is not None:
+        token.raise_if_cancelled(stage)
+
+def is_cancelled():
+    token = _CURRENT_TOKEN.get()
+    return token is not None and token.cancelled
+
+# Blocking provider calls of cancellable requests run here so the request's own thread can walk away
+UPSTREAM_EXECUTOR = ThreadPoolExecutor(max_workers=settings.HTTP_POOL_MAXSIZE, thread_name_prefix="upstream-call")
+
+def _close_abandoned(future):
+    if not future.cancelled() and future.exception() is None:
+        close = getattr(future.result(), 'close', None)
+        if close:
+            close()
+
+def run_cancellable(fn, *args, **kwargs):
+    """
+    Call fn, giving up as soon as the current request is cancelled.
+
+    Without a current token fn simply runs inline. Otherwise it runs on
+    UPSTREAM_EXECUTOR while this thread waits for either its result or the
+    cancellation; a blocking HTTP call can't be interrupted mid-flight, so
+    an abandoned call's response is closed (dropping its connection) as soon
+    as it arrives instead of being read. The RequestCancelled raised for it
+    carries its future, so a scheduler slot can stay held until it returns.
+    """
+    token = _CURRENT_TOKEN.get()
+    if token is None:
+        return fn(*args, **kwargs)
+    token.raise_if_cancelled()
+    future = UPSTREAM_EXECUTOR.submit(fn, *args, **kwargs)
+    finished = threading.Event()
+    future.add_done_callback(lambda _: finished.set())
+    unregister = token.add_callback(finished.set)
+    try:
+        finished.wait()
+    finally:
+        unregister()
+    if not future.done():
+        if future.cancel():
+            raise RequestCancelled(token.reason, "upstream")
+        future.add_done_callback(_close_abandoned)
+        raise RequestCancelled(token.reason, "upstream", abandoned=future)
+    return future.result()
@@ -0,0 +1,59 @@
+import copy
+import threading
+import metrics
+from settings import settings
+
+COALESCED = metrics.counter(
+    'smart_host_coalesced_requests_total', 'Requests that shared an identical in-flight upstream call', ['endpoint'])
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one execution.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is in flight block and receive a copy of its result or
+    its exception. Nothing is remembered once the call completes.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Return (result, is_leader)."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            COALESCED.labels(self.endpoint).inc()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result), False
+        try:
+            call.result = fn()
+            return call.result, True
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+def coalescing_enabled(endpoint):
+    return endpoint in settings.COALESCE_ENDPOINTS
+
+CHAT_FLIGHTS = SingleFlight('chat')
+EMBED_FLIGHTS = SingleFlight('embed')
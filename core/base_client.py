@@ -1,6 +1,40 @@
+import time
 from abc import ABC, abstractmethod
+from urllib.parse import urlsplit
+from . import cassette
+from .session import get_session
+from cancellation import run_cancellable
+from request_metrics import observe_upstream
 
 class BaseClient(ABC):
+    # Label for upstream latency metrics
+    provider = None
+    # Clients authenticating with API keys set this to a shared KeyPool
+    key_pool = None
+
+    def _send(self, url, data, **kwargs):
+        if self.key_pool is None:
+            return get_session().post(url, json=data, **kwargs)
+        return self.key_pool.post(url, data, **kwargs)
+
+    def _exchange(self, url, data):
+        # PROVIDER_CASSETTE_MODE: answer from a recording, or record the live call
+        if cassette.REPLAYER is not None:
+            return cassette.REPLAYER.replay(url, data)
+        if cassette.RECORDER is not None:
+            return cassette.RECORDER.record(self.provider, url, data, self._send)
+        return self._send(url, data)
+
+    def _post(self, url, data):
+        # Returns early with RequestCancelled if the request driving this call is cancelled
+        start_time = time.perf_counter()
+        try:
+            response = run_cancellable(self._exchange, url, data)
+        finally:
+            observe_upstream(self.provider, urlsplit(url).path, time.perf_counter() - start_time)
+        response.raise_for_status()
+        return response
+
     @abstractmethod
     def chat(self, *args, **kwargs):
         pass
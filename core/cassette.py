@@ -0,0 +1,152 @@
+import atexit
+import gzip
+import itertools
+import json
+import threading
+import time
+from datetime import timedelta
+from urllib.parse import urlsplit
+import requests
+from requests.structures import CaseInsensitiveDict
+from settings import settings
+
+# Response headers worth replaying; auth, cookies and transport headers are never recorded
+RECORDED_HEADERS = ('content-type', 'retry-after')
+RECORDED_HEADER_PREFIXES = ('x-ratelimit-',)
+
+class CassetteMiss(LookupError):
+    """Raised when a replayed request has no recording for its path."""
+
+def _text(chunk):
+    # Keeps arbitrary bytes (e.g. a UTF-8 character split across chunks) round-trippable through JSON
+    return chunk.decode('utf-8', 'surrogateescape')
+
+def _bytes(text):
+    return text.encode('utf-8', 'surrogateescape')
+
+def _request_key(path, data):
+    return path, json.dumps(data, sort_keys=True, default=str)
+
+def _recorded_headers(headers):
+    return {name.lower(): value for name, value in headers.items()
+            if name.lower() in RECORDED_HEADERS or name.lower().startswith(RECORDED_HEADER_PREFIXES)}
+
+class CassetteRecorder:
+    """
+    Appends provider request/response pairs to a gzip-compressed JSONL cassette.
+
+    Each record holds the request body, the response status, selected
+    headers, the time to the response headers and every body chunk with
+    its offset from the start of the request, so streaming responses can
+    be replayed with their original pacing.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def record(self, provider, url, data, send):
+        """Call `send(url, data, stream=True)`, read the response chunk by chunk, record it and return it."""
+        started_at = time.time()
+        start = time.perf_counter()
+        response = send(url, data, stream=True)
+        ttfb = time.perf_counter() - start
+        chunks = []
+        try:
+            for chunk in response.iter_content(chunk_size=None):
+                chunks.append((time.perf_counter() - start, chunk))
+        finally:
+            response.close()
+        response._content = b''.join(chunk for _, chunk in chunks)
+        self.write({
+            "provider": provider,
+            "method": "POST",
+            "url": url,
+            "path": urlsplit(url).path,
+            "request": data,
+            "status": response.status_code,
+            "headers": _recorded_headers(response.headers),
+            "started_at": started_at,
+            "ttfb": round(ttfb, 6),
+            "chunks": [[round(offset, 6), _text(chunk)] for offset, chunk in chunks],
+        })
+        return response
+
+    def write(self, interaction):
+        line = json.dumps(interaction, default=str) + '\n'
+        with self._lock:
+            if self._file is None:
+                self._file = gzip.open(self.path, 'at', encoding='utf-8')
+            self._file.write(line)
+            # A sync flush keeps the cassette readable if the process dies, at a small cost in ratio
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+class Cassette:
+    """
+    Recorded provider traffic, served back in place of live provider calls.
+
+    A request is answered by the recordings of the same path and body, in
+    the order they were recorded; requests with no exact match cycle
+    through every recording for their path, so traffic with fresh prompts
+    still gets realistic response shapes, sizes and timing. Recorded
+    delays are multiplied by `time_scale`: 1 replays the original timing,
+    0.5 runs twice as fast and 0 answers at once.
+    """
+
+    def __init__(self, interactions, time_scale=1.0):
+        self.interactions = list(interactions)
+        self.time_scale = time_scale
+        exact, by_path = {}, {}
+        for interaction in self.interactions:
+            exact.setdefault(_request_key(interaction["path"], interaction["request"]), []).append(interaction)
+            by_path.setdefault(interaction["path"], []).append(interaction)
+        self._exact = {key: itertools.cycle(matches) for key, matches in exact.items()}
+        self._by_path = {path: itertools.cycle(matches) for path, matches in by_path.items()}
+        self.paths = frozenset(by_path)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path, time_scale=1.0):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return cls((json.loads(line) for line in f if line.strip()), time_scale)
+
+    def match(self, path, data):
+        with self._lock:
+            matches = self._exact.get(_request_key(path, data)) or self._by_path.get(path)
+            if matches is None:
+                raise CassetteMiss(f"No recorded response for POST {path}")
+            return next(matches)
+
+    def delays(self, interaction):
+        """Scaled (seconds until the headers, [(seconds after the headers, chunk bytes), ...]) of a recording."""
+        ttfb = interaction["ttfb"] * self.time_scale
+        return ttfb, [(max(0.0, offset * self.time_scale - ttfb), _bytes(chunk))
+                      for offset, chunk in interaction["chunks"]]
+
+    def replay(self, url, data):
+        """Answer a provider call from the cassette as a requests.Response, after the recorded delay."""
+        interaction = self.match(urlsplit(url).path, data)
+        ttfb, chunks = self.delays(interaction)
+        time.sleep(ttfb + (chunks[-1][0] if chunks else 0.0))
+        response = requests.Response()
+        response.status_code = interaction["status"]
+        response.headers = CaseInsensitiveDict(interaction["headers"])
+        response._content = b''.join(chunk for _, chunk in chunks)
+        response.url = url
+        response.elapsed = timedelta(seconds=ttfb)
+        return response
+
+RECORDER = CassetteRecorder(settings.PROVIDER_CASSETTE_PATH) if settings.PROVIDER_CASSETTE_MODE == 'record' else None
+if RECORDER is not None:
+    atexit.register(RECORDER.close)
+REPLAYER = (
+    Cassette.load(settings.PROVIDER_CASSETTE_PATH, settings.PROVIDER_REPLAY_TIME_SCALE)
+    if settings.PROVIDER_CASSETTE_MODE == 'replay' else None
+)
@@ -0,0 +1,190 @@
+import re
+import threading
+import time
+from .session import get_session
+from settings import settings
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+def _header(headers, name):
+    value = headers.get(name) if headers is not None else None
+    return value if isinstance(value, str) else None
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def parse_reset(value, now=None):
+    """
+    Convert a rate-limit reset header into seconds from now.
+
+    OpenAI sends durations such as "1s", "6m0s" or "20ms"; OpenRouter sends
+    an absolute epoch timestamp in milliseconds.
+    """
+    if value is None:
+        return None
+    now = time.time() if now is None else now
+    number = _number(value)
+    if number is not None:
+        if number > 1e12:
+            return max(0.0, number / 1000 - now)
+        if number > 1e9:
+            return max(0.0, number - now)
+        return max(0.0, number)
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+class _Bucket:
+    """Last known limit/remaining/reset for one rate-limit dimension of a key."""
+
+    def __init__(self):
+        self.limit = None
+        self.remaining = None
+        self.reset_at = None
+
+    def update(self, limit, remaining, reset_in, now):
+        if limit is not None:
+            self.limit = limit
+        if remaining is not None:
+            self.remaining = remaining
+        if reset_in is not None:
+            self.reset_at = now + reset_in
+
+    def headroom(self, now):
+        """Fraction of the bucket still available; unknown buckets count as full."""
+        if self.remaining is None or (self.reset_at is not None and now >= self.reset_at):
+            return 1.0
+        if not self.limit:
+            return 1.0 if self.remaining > 0 else 0.0
+        return max(0.0, min(1.0, self.remaining / self.limit))
+
+class KeyState:
+    def __init__(self, key):
+        self.key = key
+        self.requests = _Bucket()
+        self.tokens = _Bucket()
+        self.cooldown_until = 0.0
+        self.in_flight = 0
+
+    def headroom(self, now):
+        return min(self.requests.headroom(now), self.tokens.headroom(now))
+
+class KeyPool:
+    """
+    A set of API keys for one provider.
+
+    Each call goes out on the key with the most headroom according to the
+    provider's x-ratelimit-* headers, ties broken by the fewest requests in
+    flight. Keys that receive a 429 are cooled down and skipped until their
+    reset time, so aggregate throughput is the sum of all keys' limits.
+    """
+
+    def __init__(self, keys, cooldown=None):
+        self.keys = [KeyState(key) for key in (keys or [None])]
+        self.cooldown = settings.KEY_COOLDOWN_SECONDS if cooldown is None else cooldown
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def acquire(self):
+        with self._lock:
+            now = time.time()
+            available = [state for state in self.keys if state.cooldown_until <= now]
+            if available:
+                state = max(available, key=lambda s: (s.headroom(now), -s.in_flight))
+            else:
+                # Every key is cooling down; use the one that recovers first
+                state = min(self.keys, key=lambda s: s.cooldown_until)
+            state.in_flight += 1
+            if state.requests.remaining:
+                state.requests.remaining -= 1
+            return state.key
+
+    def release(self, key, headers=None):
+        with self._lock:
+            state = self._state(key)
+            state.in_flight = max(0, state.in_flight - 1)
+            if headers is None:
+                return
+            now = time.time()
+            state.requests.update(
+                _number(_header(headers, 'x-ratelimit-limit-requests') or _header(headers, 'x-ratelimit-limit')),
+                _number(_header(headers, 'x-ratelimit-remaining-requests') or _header(headers, 'x-ratelimit-remaining')),
+                parse_reset(_header(headers, 'x-ratelimit-reset-requests') or _header(headers, 'x-ratelimit-reset'), now),
+                now,
+            )
+            state.tokens.update(
+                _number(_header(headers, 'x-ratelimit-limit-tokens')),
+                _number(_header(headers, 'x-ratelimit-remaining-tokens')),
+                parse_reset(_header(headers, 'x-ratelimit-reset-tokens'), now),
+                now,
+            )
+
+    def cool_down(self, key, seconds=None):
+        with self._lock:
+            state = self._state(key)
+            state.cooldown_until = time.time() + (self.cooldown if seconds is None else seconds)
+
+    def status(self):
+        """Per-key headroom snapshot with the keys themselves masked."""
+        with self._lock:
+            now = time.time()
+            return [
+                {
+                    "key": f"...{state.key[-4:]}" if state.key else None,
+                    "headroom": round(state.headroom(now), 3),
+                    "in_flight": state.in_flight,
+                    "cooling_down_for": round(max(0.0, state.cooldown_until - now), 3),
+                }
+                for state in self.keys
+            ]
+
+    def post(self, url, data, **kwargs):
+        """
+        POST with the best available key, failing over to another key on 429.
+
+        The final response is returned unchecked; callers raise_for_status().
+        """
+        for attempt in range(len(self.keys)):
+            key = self.acquire()
+            try:
+                response = get_session().post(url, headers={"Authorization": f"Bearer {key}"}, json=data, **kwargs)
+            except Exception:
+                self.release(key)
+                raise
+            self.release(key, response.headers)
+            if response.status_code != 429:
+                return response
+            if attempt < len(self.keys) - 1:
+                # Free the connection of a streamed response before retrying with another key
+                response.close()
+            headers = response.headers
+            self.cool_down(key, parse_reset(
+                _header(headers, 'retry-after')
+                or _header(headers, 'x-ratelimit-reset-requests')
+                or _header(headers, 'x-ratelimit-reset')
+            ))
+        return response
+
+    def _state(self, key):
+        for state in self.keys:
+            if state.key == key:
+                return state
+        raise KeyError("Unknown API key")
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+def get_key_pool(provider, keys):
+    """Return the process-wide pool for a provider so all clients share key state."""
+    pool_id = (provider, tuple(keys or [None]))
+    with _POOLS_LOCK:
+        if pool_id not in _POOLS:
+            _POOLS[pool_id] = KeyPool(keys)
+        return _POOLS[pool_id]
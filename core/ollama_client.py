@@ -1,26 +1,79 @@
 import os
-import requests
+from .session import get_session
 from .base_client import BaseClient
+from settings import settings
+
+def _keep_alive_value(value):
+    """Ollama accepts durations ("10m") or plain seconds (-1 keeps the model loaded forever)."""
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+# OpenAI-style request fields and the Ollama option each one maps to
+OPTION_FIELDS = {"temperature": "temperature", "top_p": "top_p", "max_tokens": "num_predict", "seed": "seed",
+                 "stop": "stop"}
 
 class OllamaClient(BaseClient):
-    def __init__(self, host=None):
+    provider = "ollama"
+
+    def __init__(self, host=None, keep_alive=None, model_keep_alive=None):
         self.host = host or os.getenv('OLLAMA_HOST', 'http://localhost:11434')
         # Remove trailing slash if present to avoid double slashes in URLs
         self.host = self.host.rstrip('/')
+        self.keep_alive = keep_alive if keep_alive is not None else settings.OLLAMA_KEEP_ALIVE
+        self.model_keep_alive = (
+            model_keep_alive if model_keep_alive is not None else settings.OLLAMA_MODEL_KEEP_ALIVE
+        )
+
+    def keep_alive_for(self, model):
+        """Return the keep_alive policy for a model, falling back to the global default."""
+        return _keep_alive_value(self.model_keep_alive.get(model, self.keep_alive))
+
+    @staticmethod
+    def _with_options(data):
+        # Ollama ignores top-level sampling fields; they belong in "options", where the token limit is num_predict
+        options = dict(data.get("options") or {})
+        for field, option in OPTION_FIELDS.items():
+            if field in data:
+                options[option] = data.pop(field)
+        if options:
+            data["options"] = options
+        return data
+
+    def _with_keep_alive(self, data):
+        keep_alive = self.keep_alive_for(data.get("model"))
+        if keep_alive is not None:
+            data.setdefault("keep_alive", keep_alive)
+        return data
 
     def chat(self, messages, model="llama2", **kwargs):
         url = f"{self.host}/api/chat"
         data = {"model": model, "messages": messages}
         data.update(kwargs)
-        response = requests.post(url, json=data)
-        response.raise_for_status()
-        return response.json()
+        return self._post(url, self._with_keep_alive(self._with_options(data))).json()
 
     def embed(self, input, model="llama2", **kwargs):
-        url = f"{self.host}/api/embeddings"
+        # /api/embed accepts a single string or a list of strings
+        url = f"{self.host}/api/embed"
         data = {"model": model, "input": input}
         data.update(kwargs)
-        response = requests.post(url, json=data)
+        return self._post(url, self._with_keep_alive(data)).json()
+
+    def warm_up(self, model):
+        """
+        Load a model into memory without generating anything.
+
+        An empty /api/generate request makes Ollama load the model and keep it
+        resident for its keep_alive period. Embedding-only models reject
+        generate requests, so those are loaded through /api/embed instead.
+        """
+        data = self._with_keep_alive({"model": model})
+        response = get_session().post(f"{self.host}/api/generate", json=data)
+        if response.status_code == 400:
+            response = get_session().post(f"{self.host}/api/embed", json={**data, "input": []})
         response.raise_for_status()
         return response.json()
 
@@ -1,30 +1,32 @@
 import os
 import requests
 from .base_client import BaseClient
+from .key_pool import get_key_pool
+from settings import settings
 
 class OpenRouterClient(BaseClient):
-    def __init__(self, api_key=None):
-        self.api_key = api_key or os.getenv('OPENROUTER_API_KEY')
-        self.base_url = 'https://openrouter.ai/api/v1/'
+    provider = "openrouter"
+
+    def __init__(self, api_key=None, api_keys=None):
+        if api_key:
+            api_keys = [api_key]
+        self.api_keys = api_keys or settings.OPENROUTER_API_KEYS or [os.getenv('OPENROUTER_API_KEY')]
+        self.api_key = self.api_keys[0]
+        self.key_pool = get_key_pool('openrouter', self.api_keys)
+        self.base_url = settings.OPENROUTER_BASE_URL.rstrip('/') + '/'
 
     def chat(self, messages, model="openrouter/gpt-3.5-turbo", **kwargs):
         url = self.base_url + 'chat/completions'
-        headers = {"Authorization": f"Bearer {self.api_key}"}
         data = {"model": model, "messages": messages}
         data.update(kwargs)
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        return response.json()
+        return self._post(url, data).json()
 
     def embed(self, input, model="openrouter/text-embedding-ada-002", **kwargs):
         try:
             url = self.base_url + 'embeddings'
-            headers = {"Authorization": f"Bearer {self.api_key}"}
             data = {"model": model, "input": input}
             data.update(kwargs)
-            response = requests.post(url, headers=headers, json=data)
-            response.raise_for_status()
-            return response.json()
+            return self._post(url, data).json()
         except requests.exceptions.HTTPError as e:
             if e.response.status_code == 404:
                 # OpenRouter might not support embeddings at this endpoint
@@ -0,0 +1,26 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from settings import settings
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+def get_session():
+    """
+    Return the process-wide requests session used for every provider call.
+
+    Sharing one session keeps TCP/TLS connections to each provider alive
+    between requests; the pool is sized so concurrent calls up to
+    HTTP_POOL_MAXSIZE per host don't open and drop extra connections.
+    """
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=settings.HTTP_POOL_CONNECTIONS,
+                                  pool_maxsize=settings.HTTP_POOL_MAXSIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _SESSION = session
+        return _SESSION
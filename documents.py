@@ -0,0 +1,127 @@
+import contextvars
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from settings import settings
+
+INGESTED_CHUNKS = metrics.counter(
+    'smart_host_document_chunks_ingested_total', 'Document chunks embedded and indexed', ['collection'])
+
+# Embedding batches of one ingestion run overlap with chunking and writing the previous ones
+INGEST_EXECUTOR = ThreadPoolExecutor(max_workers=settings.DOCUMENT_INGEST_CONCURRENCY,
+                                     thread_name_prefix="document-ingest")
+
+def chunk_text(text, size=None, overlap=None):
+    """
+    Split text into chunks of at most `size` characters, each starting
+    `overlap` characters before the previous one ended. Chunks end on
+    whitespace when there is any in the second half of the window.
+    """
+    size = settings.DOCUMENT_CHUNK_SIZE if size is None else size
+    overlap = settings.DOCUMENT_CHUNK_OVERLAP if overlap is None else overlap
+    if size <= 0 or not 0 <= overlap < size:
+        raise ValueError("chunk_size must be positive and chunk_overlap between 0 and chunk_size")
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            split = max(text.rfind(' ', start + size // 2, end), text.rfind('\n', start + size // 2, end))
+            if split > 0:
+                end = split
+        chunk = text[start:end].strip()
+        if chunk:
+            yield chunk
+        if end >= len(text):
+            break
+        next_start = max(end - overlap, start + 1)
+        if overlap and not text[next_start - 1].isspace():
+            # Begin the overlap at a word boundary rather than mid-word
+            boundary = next((i for i in range(next_start, end) if text[i].isspace()), None)
+            if boundary is not None:
+                next_start = boundary + 1
+        start = next_start
+
+def iter_chunks(documents, size=None, overlap=None):
+    """Yield chunk dicts for a sequence of {"id", "text", "metadata"} documents."""
+    for document in documents:
+        document_id = document.get("id") or uuid.uuid4().hex
+        for index, text in enumerate(chunk_text(document["text"], size, overlap)):
+            yield {
+                "document_id": document_id,
+                "chunk_index": index,
+                "text": text,
+                "metadata": document.get("metadata") or {},
+            }
+
+def _batches(chunks, size):
+    batch = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def ingest_documents(router, store, documents, collection="default", model=None,
+                     chunk_size=None, chunk_overlap=None):
+    """
+    Chunk, embed and index documents into `store`, returning a summary.
+
+    Chunks are embedded in batches of DOCUMENT_INGEST_BATCH_SIZE with up to
+    DOCUMENT_INGEST_CONCURRENCY batches in flight; each batch is written as
+    soon as it and every batch before it are done, so memory stays bounded
+    by the pipeline depth rather than the size of the upload.
+    """
+    existing = store.collection_embedding_model(collection)
+    if existing and tuple(existing) != (router.provider, model):
+        raise ValueError(
+            f"Collection {collection} was embedded with {existing[0]}/{existing[1]}; "
+            f"use the same provider and model to add documents"
+        )
+    document_ids = []
+    # Re-ingesting a document replaces its previous chunks; the old ones are only deleted once
+    # the first new batch is embedded, in the same transaction that writes it
+    to_replace = set()
+    def tracked(documents):
+        for document in documents:
+            if document.get("id"):
+                to_replace.add(document["id"])
+            document = dict(document, id=document.get("id") or uuid.uuid4().hex)
+            document_ids.append(document["id"])
+            yield document
+
+    chunk_count = 0
+    pending = deque()
+    def write_oldest():
+        batch, future = pending.popleft()
+        embeddings = future.result()
+        replace = {chunk["document_id"] for chunk in batch} & to_replace
+        store.add_document_chunks(collection, batch, embeddings, router.provider, model, replace=replace)
+        to_replace.difference_update(replace)
+        INGESTED_CHUNKS.labels(collection).inc(len(batch))
+        return len(batch)
+
+    try:
+        for batch in _batches(iter_chunks(tracked(documents), chunk_size, chunk_overlap),
+                              settings.DOCUMENT_INGEST_BATCH_SIZE):
+            texts = [chunk["text"] for chunk in batch]
+            pending.append((batch, INGEST_EXECUTOR.submit(contextvars.copy_context().run, router.embed_matrix, texts, model)))
+            if len(pending) >= settings.DOCUMENT_INGEST_CONCURRENCY:
+                chunk_count += write_oldest()
+        while pending:
+            chunk_count += write_oldest()
+        # Documents re-ingested with no text left have nothing to write, only old chunks to drop
+        for document_id in to_replace:
+            store.delete_document(collection, document_id)
+    finally:
+        # Don't leave embedding calls running for an ingestion that already failed
+        for _, future in pending:
+            future.cancel()
+    return {"collection": collection, "document_ids": document_ids, "chunks": chunk_count}
+
+def format_context(chunks):
+    """Render retrieved chunks as a system message for chat."""
+    passages = "\n\n".join(f"[{i}] {chunk['text']}" for i, chunk in enumerate(chunks, 1))
+    return {"role": "system", "content": f"Use the following retrieved passages if they are relevant:\n\n{passages}"}
@@ -0,0 +1,90 @@
+import base64
+import io
+import numpy as np
+
+# Output formats for /embed besides the provider's plain JSON floats
+ENCODING_FORMATS = ("float", "base64", "float16", "int8", "binary", "npy")
+
+def _decode_vector(value):
+    if isinstance(value, str):
+        # OpenAI-style base64 of little-endian float32, decoded without per-float objects
+        return np.frombuffer(base64.b64decode(value), dtype='<f4')
+    return np.asarray(value, dtype=np.float32)
+
+def extract_embeddings(response):
+    """
+    Pull the vectors out of a provider embedding response as float32 arrays.
+
+    Handles the OpenAI/OpenRouter shape ({"data": [{"index", "embedding"}]},
+    with float lists or base64 strings) and both Ollama shapes
+    ({"embeddings": [...]} and {"embedding": [...]}).
+    """
+    if "data" in response:
+        items = sorted(response["data"], key=lambda item: item.get("index", 0))
+        return [_decode_vector(item["embedding"]) for item in items]
+    if "embeddings" in response:
+        return [_decode_vector(vector) for vector in response["embeddings"]]
+    if "embedding" in response:
+        return [_decode_vector(response["embedding"])]
+    raise ValueError("Unrecognised embedding response")
+
+def embedding_response(vectors, model):
+    """Build an OpenAI-style embedding response so every provider looks the same to callers."""
+    return {
+        "object": "list",
+        "data": [
+            {"object": "embedding", "index": i, "embedding": np.asarray(vector).tolist()}
+            for i, vector in enumerate(vectors)
+        ],
+        "model": model,
+    }
+
+def _base64_rows(matrix):
+    raw = matrix.tobytes()
+    row_size = matrix.shape[1] * matrix.itemsize if matrix.ndim == 2 else 0
+    return [base64.b64encode(raw[i * row_size:(i + 1) * row_size]).decode('ascii') for i in range(len(matrix))]
+
+def quantize_int8(matrix):
+    """Symmetric per-vector int8 quantization; returns (codes, scales) with vector ~= codes * scale."""
+    scales = np.abs(matrix).max(axis=1, initial=0.0) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+def encode_embeddings(matrix, encoding_format, model):
+    """
+    Encode an (n, dim) float32 matrix as a JSON-ready dict with base64 rows.
+
+    "base64" rows are little-endian float32 (OpenAI compatible), "float16"
+    rows are half precision, and "int8" rows carry the scale needed to
+    reconstruct each vector.
+    """
+    if encoding_format == "base64":
+        rows = _base64_rows(matrix.astype('<f4', copy=False))
+        scales = None
+    elif encoding_format == "float16":
+        rows = _base64_rows(matrix.astype('<f2'))
+        scales = None
+    elif encoding_format == "int8":
+        codes, scales = quantize_int8(matrix)
+        rows = _base64_rows(codes)
+    else:
+        raise ValueError(f"Unsupported encoding_format: {encoding_format}")
+    data = []
+    for i, row in enumerate(rows):
+        item = {"object": "embedding", "index": i, "embedding": row}
+        if scales is not None:
+            item["scale"] = float(scales[i])
+        data.append(item)
+    return {"object": "list", "data": data, "model": model, "encoding_format": encoding_format}
+
+def embeddings_to_bytes(matrix, encoding_format):
+    """Serialize the matrix as raw little-endian float32 ("binary") or a .npy file ("npy")."""
+    matrix = matrix.astype('<f4', copy=False)
+    if encoding_format == "binary":
+        return matrix.tobytes()
+    if encoding_format == "npy":
+        buffer = io.BytesIO()
+        np.save(buffer, matrix, allow_pickle=False)
+        return buffer.getvalue()
+    raise ValueError(f"Unsupported encoding_format: {encoding_format}")
@@ -0,0 +1,211 @@
+import base64
+import contextvars
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from core.session import get_session
+from overload import ServerOverloaded
+from router import Router
+from settings import settings
+from tracing import current_span, end_trace, format_traceparent, start_trace
+from utils import log_error, log_request, log_response
+
+JOBS_FINISHED = metrics.counter('smart_host_image_jobs_total', 'Image generation jobs by final state', ['state'])
+JOBS_ACTIVE = metrics.gauge('smart_host_image_jobs_queued', 'Image jobs waiting for or running on a worker')
+
+# Decode base64 in slices of this many characters (a multiple of 4) so the decoded image is never fully in memory
+DECODE_SLICE = 64 * 1024
+DOWNLOAD_CHUNK = 64 * 1024
+
+MEDIA_TYPES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png', '.png'),
+    (b'\xff\xd8\xff', 'image/jpeg', '.jpg'),
+    (b'GIF8', 'image/gif', '.gif'),
+)
+
+def sniff_media_type(head):
+    """Return (media_type, extension) for the first bytes of an image."""
+    for magic, media_type, extension in MEDIA_TYPES:
+        if head.startswith(magic):
+            return media_type, extension
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp', '.webp'
+    return 'application/octet-stream', '.bin'
+
+class ImageStore:
+    """
+    Content-addressed directory of generated images.
+
+    Each image is written to a temporary file while its sha256 is computed,
+    then moved to <root>/<hash[:2]>/<hash><ext>, so identical images are
+    stored once and a file is never visible half-written.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or settings.IMAGE_STORE_DIR
+
+    def _store(self, chunks):
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        head = b''
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    if len(head) < 16:
+                        head += chunk[:16]
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            sha256 = digest.hexdigest()
+            media_type, extension = sniff_media_type(head)
+            directory = os.path.join(self.root, sha256[:2])
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, sha256 + extension)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return {"sha256": sha256, "path": path, "media_type": media_type, "size": size}
+
+    def store_base64(self, data):
+        return self._store(
+            base64.b64decode(data[start:start + DECODE_SLICE]) for start in range(0, len(data), DECODE_SLICE)
+        )
+
+    def store_url(self, url):
+        with get_session().get(url, stream=True) as response:
+            response.raise_for_status()
+            return self._store(response.iter_content(DOWNLOAD_CHUNK))
+
+class ImageJob:
+    def __init__(self, provider, prompt, params=None, tenant=None):
+        self.id = uuid.uuid4().hex
+        self.provider = provider
+        self.prompt = prompt
+        self.params = params or {}
+        self.tenant = tenant
+        self.state = "queued"
+        self.files = []
+        self.error = None
+        self.created_at = time.time()
+        self.completed_at = None
+        self.done = threading.Event()
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback):
+        """Call `callback(job)` once the job finishes (immediately if it already has)."""
+        with self._lock:
+            if not self.done.is_set():
+                self._listeners.append(callback)
+                return
+        callback(self)
+
+    def finish(self, state, error=None):
+        with self._lock:
+            self.state = state
+            self.error = error
+            self.completed_at = time.time()
+            self.done.set()
+            listeners, self._listeners = self._listeners, []
+        for callback in listeners:
+            callback(self)
+
+    def status(self):
+        return {
+            "id": self.id,
+            "state": self.state,
+            "provider": self.provider,
+            "created_at": self.created_at,
+            "completed_at": self.completed_at,
+            "files": [
+                {"index": i, "sha256": f["sha256"], "media_type": f["media_type"], "size": f["size"],
+                 "url": f"/image/{self.id}?index={i}"}
+                for i, f in enumerate(self.files)
+            ],
+            "error": self.error,
+        }
+
+class ImageJobQueue:
+    """
+    Runs image generations on a fixed pool of worker threads.
+
+    Submitting returns at once; results are written to the ImageStore and the
+    job's listeners are notified. Finished jobs are forgotten after `ttl`
+    seconds, while their files stay in the store.
+    """
+
+    def __init__(self, store=None, workers=None, max_queued=None, ttl=None):
+        self.store = store or ImageStore()
+        self.max_queued = settings.IMAGE_MAX_QUEUED if max_queued is None else max_queued
+        self.ttl = settings.IMAGE_JOB_TTL if ttl is None else ttl
+        self.jobs = {}
+        self.active = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers or settings.IMAGE_WORKERS,
+                                            thread_name_prefix="image-worker")
+
+    def _expire(self, now):
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.completed_at is not None and now - job.completed_at > self.ttl]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def submit(self, provider, prompt, params=None, tenant=None):
+        with self._lock:
+            self._expire(time.time())
+            if self.active >= self.max_queued:
+                raise ServerOverloaded(f"Image queue is full ({self.active} jobs), retry later")
+            job = ImageJob(provider, prompt, params, tenant)
+            self.jobs[job.id] = job
+            self.active += 1
+            JOBS_ACTIVE.labels().set(self.active)
+        # The job's trace continues the submitting request's, which has usually ended by the time it runs
+        self._executor.submit(contextvars.copy_context().run, self._run, job)
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def _save(self, response):
+        """Write every image in a provider response to the store, returning its file records."""
+        files = []
+        for item in (response or {}).get("data", []):
+            if item.get("b64_json"):
+                files.append(self.store.store_base64(item["b64_json"]))
+            elif item.get("url"):
+                files.append(self.store.store_url(item["url"]))
+        return files
+
+    def _run(self, job):
+        start_time = time.time()
+        job.state = "running"
+        parent = current_span()
+        root, handle = start_trace("image_job", format_traceparent(parent) if parent else None, {"job_id": job.id})
+        try:
+            log_request(job.provider, "image_job", {"job_id": job.id, "prompt_length": len(job.prompt)})
+            response = Router(job.provider, tenant=job.tenant).image(job.prompt, **job.params)
+            job.files = self._save(response)
+            if not job.files:
+                raise ValueError("Provider response contained no images")
+            job.finish("succeeded")
+            log_response(job.provider, "image_job", 200, time.time() - start_time)
+        except Exception as e:
+            log_error(e, {"job_id": job.id, "provider": job.provider})
+            job.finish("failed", str(e))
+        finally:
+            end_trace(root, handle)
+            JOBS_FINISHED.labels(job.state).inc()
+            with self._lock:
+                self.active -= 1
+                JOBS_ACTIVE.labels().set(self.active)
+
+IMAGE_QUEUE = ImageJobQueue()
@@ -0,0 +1,241 @@
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import metrics
+from ratelimit import RateLimitExceeded
+from router import Router
+from settings import settings
+from utils import log_error, log_request, log_response
+
+JOB_LINES = metrics.counter('smart_host_job_lines_total', 'Batch job lines processed by result', ['status'])
+
+def run_request(request):
+    """
+    Run one job line through the Router.
+
+    A line is a /chat or /embed request body plus an optional "endpoint"
+    ("chat" or "embed", inferred from "messages" when absent) and "tenant".
+    """
+    request = dict(request)
+    endpoint = request.pop("endpoint", "chat" if "messages" in request else "embed")
+    router = Router(request.pop("provider"), tenant=request.pop("tenant", None))
+    if endpoint == "chat":
+        # Offline work yields to interactive requests when the provider is rate limited
+        request.setdefault("priority", settings.JOBS_PRIORITY)
+        return router.chat(request.pop("messages"), **request)
+    if endpoint == "embed":
+        return router.embed(request.pop("input"), **request)
+    raise ValueError(f"Unknown endpoint: {endpoint}")
+
+class JobRunner:
+    """
+    Streams a JSONL file of requests through `execute` and appends one result
+    line per request to an output JSONL file.
+
+    Up to `concurrency` lines run at once. After every completed line the
+    output is flushed and a checkpoint (the output size, the count of leading
+    lines that are done and the few done lines beyond it) is written next to
+    the output, so a crashed or cancelled job resumes where it stopped. Reading
+    ahead is bounded, so memory use doesn't depend on the size of the file.
+    """
+
+    def __init__(self, input_path, output_path, concurrency=None, execute=run_request, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.input_path = input_path
+        self.output_path = output_path
+        self.checkpoint_path = output_path + '.checkpoint'
+        self.concurrency = min(concurrency or settings.JOBS_CONCURRENCY, settings.JOBS_MAX_CONCURRENCY)
+        self.lookahead = self.concurrency * 64
+        self.execute = execute
+        self.state = "pending"
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+        self.error = None
+        self._cancelled = threading.Event()
+        # Lines [0, watermark) are done, plus the line numbers in `done` past it
+        self.watermark = 0
+        self.done = set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def status(self):
+        return {
+            "id": self.id,
+            "state": self.state,
+            "input_path": self.input_path,
+            "output_path": self.output_path,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "resumed_past": self.skipped,
+            "error": self.error,
+        }
+
+    def check_resumable(self):
+        """
+        Return the checkpoint the output resumes from, or None for a fresh
+        output. Raises ValueError for output this job must not touch: results
+        without a checkpoint, or a checkpoint for a different input file.
+        """
+        if not os.path.exists(self.output_path):
+            return None
+        if not os.path.exists(self.checkpoint_path):
+            if os.path.getsize(self.output_path):
+                raise ValueError(f"{self.output_path} already has results but no checkpoint to resume from")
+            return None
+        with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if os.path.abspath(checkpoint["input_path"]) != os.path.abspath(self.input_path):
+            raise ValueError(f"{self.output_path} holds results for {checkpoint['input_path']}, not {self.input_path}")
+        return checkpoint
+
+    def _load_checkpoint(self):
+        checkpoint = self.check_resumable()
+        if checkpoint is None:
+            return 0
+        self.watermark = checkpoint["watermark"]
+        self.done = set(checkpoint["done"])
+        self.skipped = self.watermark + len(self.done)
+        return checkpoint["output_bytes"]
+
+    def _save_checkpoint(self, output):
+        checkpoint = {
+            "input_path": os.path.abspath(self.input_path),
+            "watermark": self.watermark,
+            "done": sorted(self.done),
+            "output_bytes": output.tell(),
+        }
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _run_line(self, line_number, line):
+        attempts = 0
+        while True:
+            try:
+                request = json.loads(line)
+                return {"line": line_number, "id": request.get("id"), "status": "success",
+                        "response": self.execute({k: v for k, v in request.items() if k != "id"})}
+            except RateLimitExceeded as e:
+                # Offline lines wait out the limit instead of failing
+                attempts += 1
+                # The wait ends early, with the line recorded as failed, if the job is cancelled
+                if attempts > settings.JOBS_MAX_RETRIES or self._cancelled.wait(e.retry_after):
+                    return {"line": line_number, "status": "error",
+                            "error": {"message": str(e), "type": type(e).__name__}}
+            except Exception as e:
+                return {"line": line_number, "status": "error",
+                        "error": {"message": str(e), "type": type(e).__name__}}
+
+    def _mark_done(self, line_number, output):
+        self.done.add(line_number)
+        while self.watermark in self.done:
+            self.done.remove(self.watermark)
+            self.watermark += 1
+        self._save_checkpoint(output)
+
+    def _complete(self, result, output):
+        output.write(json.dumps(result) + '\n')
+        output.flush()
+        if result["status"] == "success":
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        JOB_LINES.labels(result["status"]).inc()
+        self._mark_done(result["line"], output)
+
+    def run(self):
+        start_time = time.time()
+        self.state = "running"
+        log_request("jobs", "job.run", {"job_id": self.id, "input_path": self.input_path})
+        try:
+            output_bytes = self._load_checkpoint()
+            mode = 'r+' if output_bytes else 'w'
+            with open(self.input_path, 'r', encoding='utf-8') as source, \
+                    open(self.output_path, mode, encoding='utf-8') as output, \
+                    ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"job-{self.id[:8]}") as pool:
+                # Anything written after the last checkpoint is redone
+                output.seek(output_bytes)
+                output.truncate()
+                pending = set()
+                for line_number, line in enumerate(source):
+                    if self._cancelled.is_set():
+                        break
+                    if line_number < self.watermark or line_number in self.done:
+                        continue
+                    if not line.strip():
+                        self._mark_done(line_number, output)
+                        continue
+                    while pending and (len(pending) >= self.concurrency
+                                       or line_number - self.watermark >= self.lookahead):
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            self._complete(future.result(), output)
+                    pending.add(pool.submit(self._run_line, line_number, line))
+                for future in pending:
+                    self._complete(future.result(), output)
+            self.state = "cancelled" if self._cancelled.is_set() else "completed"
+            log_response("jobs", "job.run", 200, time.time() - start_time)
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            log_error(e, {"job_id": self.id, "input_path": self.input_path})
+        return self.status()
+
+JOBS = {}
+_JOBS_LOCK = threading.Lock()
+ACTIVE_STATES = ("pending", "running")
+
+def resolve_job_path(path):
+    """Resolve a job file path inside JOBS_DIR, rejecting paths that escape it."""
+    root = os.path.realpath(settings.JOBS_DIR)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"Job paths must stay inside {settings.JOBS_DIR}")
+    return resolved
+
+def _prune_jobs():
+    # Finished jobs are kept for status lookups, oldest dropped first; active ones are never dropped
+    finished = [job_id for job_id, job in JOBS.items() if job.state not in ACTIVE_STATES]
+    for job_id in finished[:max(0, len(finished) - settings.JOBS_HISTORY)]:
+        del JOBS[job_id]
+
+def start_job(input_path, output_path, concurrency=None):
+    """Run a job in a background thread and return its runner."""
+    with _JOBS_LOCK:
+        running = [job for job in JOBS.values() if job.output_path == output_path and job.state in ACTIVE_STATES]
+        if running:
+            raise ValueError(f"Job {running[0].id} is already writing to {output_path}")
+        runner = JobRunner(input_path, output_path, concurrency)
+        runner.check_resumable()
+        # Claimed before the thread starts, so a second request for the same output is turned away
+        runner.state = "running"
+        JOBS[runner.id] = runner
+        _prune_jobs()
+    threading.Thread(target=runner.run, name=f"job-{runner.id[:8]}", daemon=True).start()
+    return runner
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a JSONL file of chat/embed requests through Smart-Host")
+    parser.add_argument("input", help="JSONL file with one request per line")
+    parser.add_argument("output", help="JSONL file results are appended to; re-running resumes from its checkpoint")
+    parser.add_argument("--concurrency", type=int, default=None, help="Lines run at once (default: JOBS_CONCURRENCY)")
+    args = parser.parse_args(argv)
+    runner = JobRunner(args.input, args.output, args.concurrency)
+    try:
+        status = runner.run()
+    except KeyboardInterrupt:
+        # Lines already written are checkpointed; re-running the command resumes
+        runner.state = "cancelled"
+        status = runner.status()
+    print(json.dumps(status))
+    return 0 if status["state"] == "completed" else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
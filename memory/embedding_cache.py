@@ -0,0 +1,186 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import metrics
+from settings import settings
+
+EMBEDDING_CACHE_REQUESTS = metrics.counter(
+    'smart_host_embedding_cache_requests_total', 'Embedding cache lookups per input text by result', ['result'])
+
+# Memory-tier hits whose last_used is written to SQLite at once, so disk eviction sees them as recent
+TOUCH_FLUSH_BATCH = 256
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class EmbeddingCache:
+    """
+    Content-addressed cache of embedding vectors keyed by (provider, model, sha256(text)).
+
+    Vectors are stored as float32 BLOBs in a memory-mapped SQLite file with
+    an in-process LRU in front. When the file grows past max_bytes the least
+    recently used vectors are evicted. Hits served from the LRU refresh
+    their row's last_used in batches, and always before an eviction.
+    """
+
+    def __init__(self, db_path=None, max_entries=None, max_bytes=None):
+        self.db_path = db_path or settings.EMBEDDING_CACHE_PATH
+        self.max_entries = settings.EMBEDDING_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.max_bytes = settings.EMBEDDING_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self._entries = OrderedDict()
+        # Keys served from memory since the last flush, with when they were last used
+        self._touched = {}
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._initialized = False
+        self._stored_bytes = 0
+
+    def _get_conn(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute(f'PRAGMA mmap_size={settings.EMBEDDING_CACHE_MMAP_BYTES}')
+        return conn
+
+    def _init_db(self):
+        if self._initialized:
+            return
+        with self._db_lock, self._get_conn() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    key TEXT PRIMARY KEY,
+                    dim INTEGER NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_used ON embedding_cache(last_used)')
+            conn.commit()
+            self._stored_bytes = self._total_bytes(conn)
+        self._initialized = True
+
+    @staticmethod
+    def _total_bytes(conn):
+        return conn.execute('SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embedding_cache').fetchone()[0]
+
+    @staticmethod
+    def _key(provider, model, text):
+        return f"{provider}|{model or ''}|{text_hash(text)}"
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _flush_touched(self, conn):
+        """Write the last_used of vectors served from memory; callers hold _db_lock and commit."""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        if touched:
+            conn.executemany('UPDATE embedding_cache SET last_used=? WHERE key=?',
+                             [(used, key) for key, used in touched.items()])
+
+    def get_many(self, provider, model, texts):
+        """Return a list aligned with texts holding a float32 array for each hit and None for each miss."""
+        self._init_db()
+        keys = [self._key(provider, model, text) for text in texts]
+        results = [None] * len(texts)
+        pending = {}
+        now = time.time()
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    self._touched[key] = now
+                    results[i] = vector
+                else:
+                    pending.setdefault(key, []).append(i)
+            flush = len(self._touched) >= TOUCH_FLUSH_BATCH
+        if pending:
+            rows = []
+            with self._get_conn() as conn:
+                pending_keys = list(pending)
+                for start in range(0, len(pending_keys), 500):
+                    chunk = pending_keys[start:start + 500]
+                    placeholders = ','.join('?' * len(chunk))
+                    rows.extend(conn.execute(
+                        f'SELECT key, vector FROM embedding_cache WHERE key IN ({placeholders})', chunk
+                    ).fetchall())
+                if rows or flush:
+                    with self._db_lock:
+                        conn.executemany('UPDATE embedding_cache SET last_used=? WHERE key=?',
+                                         [(now, key) for key, _ in rows])
+                        self._flush_touched(conn)
+                        conn.commit()
+            for key, blob in rows:
+                vector = np.frombuffer(blob, dtype=np.float32)
+                self._remember(key, vector)
+                for i in pending[key]:
+                    results[i] = vector
+        elif flush:
+            with self._db_lock, self._get_conn() as conn:
+                self._flush_touched(conn)
+                conn.commit()
+        hits = sum(1 for vector in results if vector is not None)
+        EMBEDDING_CACHE_REQUESTS.labels('hit').inc(hits)
+        EMBEDDING_CACHE_REQUESTS.labels('miss').inc(len(texts) - hits)
+        return results
+
+    def put_many(self, provider, model, texts, vectors):
+        self._init_db()
+        now = time.time()
+        rows = []
+        for text, values in zip(texts, vectors):
+            key = self._key(provider, model, text)
+            vector = np.asarray(values, dtype=np.float32)
+            self._remember(key, vector)
+            rows.append((key, len(vector), vector.tobytes(), now))
+        with self._db_lock, self._get_conn() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO embedding_cache (key, dim, vector, last_used) VALUES (?, ?, ?, ?)', rows
+            )
+            # Recent memory hits must not look stale to the eviction below
+            self._flush_touched(conn)
+            conn.commit()
+            # Replacing an existing key over-counts; the real total is taken before evicting
+            self._stored_bytes += sum(len(row[2]) for row in rows)
+            self._evict(conn)
+
+    def _evict(self, conn):
+        """Drop least recently used vectors until the stored bytes fit within max_bytes."""
+        if not self.max_bytes or self._stored_bytes <= self.max_bytes:
+            return
+        total = self._stored_bytes = self._total_bytes(conn)
+        if total <= self.max_bytes:
+            return
+        # Free a little extra headroom so eviction doesn't run on every insert
+        to_free = total - int(self.max_bytes * 0.9)
+        freed = 0
+        victims = []
+        for key, size in conn.execute('SELECT key, LENGTH(vector) FROM embedding_cache ORDER BY last_used ASC'):
+            victims.append((key,))
+            freed += size
+            if freed >= to_free:
+                break
+        conn.executemany('DELETE FROM embedding_cache WHERE key=?', victims)
+        conn.commit()
+        self._stored_bytes = total - freed
+        with self._lock:
+            for (key,) in victims:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        self._init_db()
+        with self._lock:
+            self._entries.clear()
+            self._touched.clear()
+        with self._db_lock, self._get_conn() as conn:
+            conn.execute('DELETE FROM embedding_cache')
+            conn.commit()
+            self._stored_bytes = 0
+
+EMBEDDING_CACHE = EmbeddingCache()
@@ -0,0 +1,63 @@
+import threading
+from collections import OrderedDict
+from settings import settings
+
+class SessionMemory:
+    """
+    A per-session view over a memory store for long-lived connections.
+
+    The first turn of a conversation loads its entries (and the user's)
+    from the store; later turns answer query() from that copy, and writes
+    go to the store and the copy alike. Writes made to the same conversation
+    outside the session aren't seen until a new session starts, but any
+    delete through the store drops the whole copy. At most `max_entries`
+    conversations and users are kept, least recently used dropped first.
+    """
+
+    def __init__(self, store, max_entries=None):
+        self.store = store
+        self.max_entries = max_entries or settings.WS_SESSION_MEMORY_MAX_ENTRIES
+        self._entries = OrderedDict()
+        self._generation = store.memory_generation
+        self._lock = threading.Lock()
+
+    def _sync(self):
+        # Memory deleted since the copy was loaded must not be served from it
+        generation = self.store.memory_generation
+        with self._lock:
+            if generation != self._generation:
+                self._entries.clear()
+                self._generation = generation
+        return generation
+
+    def _load(self, id, memory_type):
+        key = (memory_type, id)
+        generation = self._sync()
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        entries = self.store.entries(id, memory_type=memory_type) if id is not None else []
+        with self._lock:
+            if self.store.memory_generation != generation:
+                # A delete raced with the read; answer from it this once without keeping it
+                return entries
+            entries = self._entries.setdefault(key, entries)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return entries
+
+    def query(self, id, include_user_memory=True, user_id=None, top_k=5):
+        results = list(self._load(id, 'conversation'))
+        if include_user_memory and user_id:
+            results.extend(self._load(user_id, 'user'))
+        results.sort(key=lambda x: x.get('metadata', {}).get('timestamp', 0))
+        return results[-top_k:] if results else []
+
+    def add(self, id, vector, metadata=None, memory_type='conversation', user_id=None):
+        self.store.add(id, vector, metadata=metadata, memory_type=memory_type, user_id=user_id)
+        with self._lock:
+            cached = self._entries.get((memory_type, id))
+            if cached is not None:
+                cached.append({"vector": vector, "metadata": metadata or {}})
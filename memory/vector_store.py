@@ -3,6 +3,25 @@ import sqlite3
 import threading
 import json
 import time
+from functools import wraps
+import numpy as np
+import metrics
+
+STORE_LATENCY = metrics.histogram(
+    'smart_host_memory_store_duration_seconds', 'Time spent in SQLiteVectorStore operations', ['operation'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+
+def _timed(method):
+    """Record a store method's duration under its name."""
+    observe = STORE_LATENCY.labels(method.__name__).observe
+    @wraps(method)
+    def timed(*args, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            observe(time.perf_counter() - start_time)
+    return timed
 
 class VectorStore:
     def __init__(self):
@@ -108,6 +127,12 @@ class SQLiteVectorStore(VectorStore):
     def __init__(self, db_path='memory_store.sqlite3'):
         self.db_path = db_path
         self._lock = threading.Lock()
+        # Normalized embedding matrices per collection, rebuilt after writes
+        self._document_index = {}
+        # Bumped on every write to a collection, so a rebuild that raced with a write isn't cached
+        self._document_generation = {}
+        # Bumped on every memory delete, so SessionMemory copies know to reload
+        self.memory_generation = 0
         self._init_db()
 
     def _init_db(self):
@@ -134,11 +159,28 @@ class SQLiteVectorStore(VectorStore):
                     metadata TEXT
                 )
             ''')
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS document_chunks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    collection TEXT NOT NULL,
+                    document_id TEXT NOT NULL,
+                    chunk_index INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    metadata TEXT,
+                    provider TEXT NOT NULL,
+                    model TEXT,
+                    dim INTEGER NOT NULL,
+                    embedding BLOB NOT NULL
+                )
+            ''')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_document_chunks_collection ON document_chunks(collection)')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_document_chunks_document ON document_chunks(collection, document_id)')
             conn.commit()
 
     def _get_conn(self):
         return sqlite3.connect(self.db_path, check_same_thread=False)
 
+    @_timed
     def add(self, id, vector, metadata=None, memory_type='conversation', user_id=None):
         if metadata is None:
             metadata = {}
@@ -157,6 +199,7 @@ class SQLiteVectorStore(VectorStore):
                           (id, user_id, vector, role, timestamp, meta_json))
             conn.commit()
 
+    @_timed
     def query(self, id, include_user_memory=True, user_id=None, top_k=5):
         results = []
         with self._lock, self._get_conn() as conn:
@@ -174,26 +217,131 @@ class SQLiteVectorStore(VectorStore):
         results.sort(key=lambda x: x.get('metadata', {}).get('timestamp', 0))
         return results[-top_k:] if results else []
 
+    @_timed
+    def entries(self, id, memory_type='conversation'):
+        """Every entry of one conversation (by chat_id) or user, oldest first."""
+        table, column = ('user_memory', 'user_id') if memory_type == 'user' else ('conversation_memory', 'chat_id')
+        with self._lock, self._get_conn() as conn:
+            rows = conn.execute(f'SELECT vector, metadata FROM {table} WHERE {column}=? ORDER BY timestamp ASC',
+                                (id,)).fetchall()
+        return [{"vector": row[0], "metadata": json.loads(row[1]) if row[1] else {}} for row in rows]
+
     def delete_conversation(self, conversation_id):
         with self._lock, self._get_conn() as conn:
             c = conn.cursor()
             c.execute('DELETE FROM conversation_memory WHERE chat_id=?', (conversation_id,))
             conn.commit()
+            self.memory_generation += 1
 
     def delete_user_memory(self, user_id):
         with self._lock, self._get_conn() as conn:
             c = conn.cursor()
             c.execute('DELETE FROM user_memory WHERE user_id=?', (user_id,))
             conn.commit()
+            self.memory_generation += 1
 
     def delete_all_user_memories(self):
         with self._lock, self._get_conn() as conn:
             c = conn.cursor()
             c.execute('DELETE FROM user_memory')
             conn.commit()
+            self.memory_generation += 1
 
     def delete_all_conversation_memories(self):
         with self._lock, self._get_conn() as conn:
             c = conn.cursor()
             c.execute('DELETE FROM conversation_memory')
             conn.commit()
+            self.memory_generation += 1
+
+    @_timed
+    def add_document_chunks(self, collection, chunks, embeddings, provider, model=None, replace=()):
+        """
+        Store embedded document chunks, replacing the old chunks of the documents in `replace`.
+
+        Args:
+            collection: Name of the document collection
+            chunks: List of dicts with document_id, chunk_index, text and optional metadata
+            embeddings: (len(chunks), dim) float32 matrix, one row per chunk
+            provider: Embedding provider, reused to embed search queries
+            model: Embedding model, reused to embed search queries
+            replace: Document ids whose existing chunks are deleted in the same transaction
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        rows = [
+            (collection, chunk['document_id'], chunk['chunk_index'], chunk['text'],
+             json.dumps(chunk.get('metadata') or {}), provider, model, embeddings.shape[1], vector.tobytes())
+            for chunk, vector in zip(chunks, embeddings)
+        ]
+        with self._lock, self._get_conn() as conn:
+            conn.executemany('DELETE FROM document_chunks WHERE collection=? AND document_id=?',
+                             [(collection, document_id) for document_id in replace])
+            conn.executemany('''INSERT INTO document_chunks
+                                  (collection, document_id, chunk_index, text, metadata, provider, model, dim, embedding)
+                                  VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+            conn.commit()
+            self._invalidate_document_index(collection)
+
+    def collection_embedding_model(self, collection):
+        """Return the (provider, model) a collection was embedded with, or None if it is empty."""
+        with self._lock, self._get_conn() as conn:
+            row = conn.execute('SELECT provider, model FROM document_chunks WHERE collection=? LIMIT 1',
+                               (collection,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def _invalidate_document_index(self, collection):
+        # Callers hold self._lock
+        self._document_generation[collection] = self._document_generation.get(collection, 0) + 1
+        self._document_index.pop(collection, None)
+
+    def _load_document_index(self, collection):
+        index = self._document_index.get(collection)
+        if index is not None:
+            return index
+        with self._lock, self._get_conn() as conn:
+            generation = self._document_generation.get(collection, 0)
+            rows = conn.execute('''SELECT document_id, chunk_index, text, metadata, dim, embedding
+                                    FROM document_chunks WHERE collection=? ORDER BY id''', (collection,)).fetchall()
+        if rows:
+            matrix = np.frombuffer(b''.join(row[5] for row in rows), dtype=np.float32).reshape(len(rows), rows[0][4])
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix = matrix / norms
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        index = ([row[:4] for row in rows], matrix)
+        with self._lock:
+            # A write since the rows were read makes this index stale; use it once but don't keep it
+            if self._document_generation.get(collection, 0) == generation:
+                self._document_index[collection] = index
+        return index
+
+    @_timed
+    def search_documents(self, collection, query_vector, top_k=5):
+        """Return the top_k chunks in a collection by cosine similarity to query_vector."""
+        chunks, matrix = self._load_document_index(collection)
+        if not chunks:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = matrix @ query
+        top_k = min(top_k, len(chunks))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return [
+            {
+                "document_id": chunks[i][0],
+                "chunk_index": chunks[i][1],
+                "text": chunks[i][2],
+                "metadata": json.loads(chunks[i][3]) if chunks[i][3] else {},
+                "score": float(scores[i]),
+            }
+            for i in best
+        ]
+
+    @_timed
+    def delete_document(self, collection, document_id):
+        with self._lock, self._get_conn() as conn:
+            conn.execute('DELETE FROM document_chunks WHERE collection=? AND document_id=?', (collection, document_id))
+            conn.commit()
+            self._invalidate_document_index(collection)
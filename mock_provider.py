@@ -0,0 +1,296 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from core.cassette import Cassette
+
+WORDS = ("the quick brown fox jumps over the lazy dog while a smart host routes every request to "
+         "the right model and keeps the conversation in memory").split()
+
+# A 1x1 transparent PNG, returned for every generated image
+PIXEL_PNG = base64.b64encode(bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)).decode()
+
+class LatencyModel:
+    """
+    Samples response latencies in seconds from a distribution spec:
+    "fixed:S", "uniform:LOW,HIGH", "normal:MEAN,STD", "exponential:MEAN"
+    or "lognormal:MEDIAN,SIGMA" (long-tailed, like real providers).
+    """
+
+    KINDS = ("fixed", "uniform", "normal", "exponential", "lognormal")
+
+    def __init__(self, spec="fixed:0"):
+        kind, _, params = spec.partition(":")
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution: {kind}")
+        self.spec = spec
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",") if p] or [0.0]
+
+    def sample(self, rng=random):
+        p = self.params
+        if self.kind == "fixed":
+            value = p[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(p[0], p[1])
+        elif self.kind == "normal":
+            value = rng.gauss(p[0], p[1])
+        elif self.kind == "exponential":
+            value = rng.expovariate(1 / p[0]) if p[0] > 0 else 0.0
+        else:
+            value = p[0] * rng.lognormvariate(0, p[1])
+        return max(0.0, value)
+
+class MockConfig:
+    def __init__(self, latency="fixed:0", token_rate=0, completion_tokens=20, embedding_dim=1536,
+                 error_rate=0.0, rate_limit_rate=0.0, rpm=0, retry_after=1, seed=None, cassette=None):
+        # Time to the first token, then completion tokens at token_rate per second (0: all at once)
+        self.latency = latency if isinstance(latency, LatencyModel) else LatencyModel(latency)
+        self.token_rate = token_rate
+        self.completion_tokens = completion_tokens
+        self.embedding_dim = embedding_dim
+        # Fraction of requests answered with a 500 or a 429, and a hard requests-per-minute budget
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rpm = rpm
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        # Recorded traffic served in place of generated responses, for the paths it covers
+        self.cassette = cassette
+
+class _MinuteWindow:
+    """Counts requests in the current minute for the --rpm budget."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def admit(self, limit):
+        with self._lock:
+            now = time.monotonic()
+            if now - self.started >= 60:
+                self.started, self.count = now, 0
+            if self.count >= limit:
+                return False, 60 - (now - self.started), 0
+            self.count += 1
+            return True, 60 - (now - self.started), limit - self.count
+
+def embedding_vector(text, dim):
+    """A deterministic unit vector per text, so caches and similarity search behave realistically."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+def prompt_tokens(messages):
+    return sum(len(str(m.get("content", ""))) for m in messages) // 4 + 1
+
+def create_app(config=None):
+    config = config or MockConfig()
+    window = _MinuteWindow()
+    app = FastAPI(title="Smart-Host mock provider")
+    app.state.config = config
+    app.state.requests = 0
+
+    if config.cassette is not None:
+        @app.middleware("http")
+        async def replay_cassette(request: Request, call_next):
+            if request.method != "POST" or request.url.path not in config.cassette.paths:
+                return await call_next(request)
+            interaction = config.cassette.match(request.url.path, await request.json())
+            ttfb, chunks = config.cassette.delays(interaction)
+            await asyncio.sleep(ttfb)
+
+            async def body():
+                # Chunks go out at their recorded offsets, so streamed responses keep their pacing
+                start = time.monotonic()
+                for offset, chunk in chunks:
+                    delay = offset - (time.monotonic() - start)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    yield chunk
+            headers = {name: value for name, value in interaction["headers"].items() if name != "content-type"}
+            return StreamingResponse(body(), status_code=interaction["status"], headers=headers,
+                                     media_type=interaction["headers"].get("content-type"))
+
+    @app.middleware("http")
+    async def inject_failures(request: Request, call_next):
+        app.state.requests += 1
+        headers = {}
+        if config.rpm:
+            admitted, reset_in, remaining = window.admit(config.rpm)
+            headers = {"x-ratelimit-limit-requests": str(config.rpm),
+                       "x-ratelimit-remaining-requests": str(remaining),
+                       "x-ratelimit-reset-requests": f"{reset_in:.0f}s"}
+            if not admitted:
+                return rate_limited(reset_in, headers)
+        roll = config.rng.random()
+        if roll < config.rate_limit_rate:
+            return rate_limited(config.retry_after, headers)
+        if roll < config.rate_limit_rate + config.error_rate:
+            return JSONResponse(status_code=500, content={"error": {"message": "Injected failure", "type": "server_error"}})
+        response = await call_next(request)
+        response.headers.update(headers)
+        return response
+
+    def rate_limited(retry_after, headers):
+        return JSONResponse(
+            status_code=429,
+            content={"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+            headers={**headers, "Retry-After": str(max(1, round(retry_after)))}
+        )
+
+    async def generate(n_tokens):
+        """Yield completion tokens, the first after the sampled latency, the rest at token_rate."""
+        await asyncio.sleep(config.latency.sample(config.rng))
+        for i in range(n_tokens):
+            if i and config.token_rate:
+                await asyncio.sleep(1 / config.token_rate)
+            yield WORDS[i % len(WORDS)] + ("" if i == n_tokens - 1 else " ")
+
+    async def full_completion(n_tokens):
+        return "".join([token async for token in generate(n_tokens)])
+
+    def completion_tokens(data):
+        return min(config.completion_tokens, data.get("max_tokens") or config.completion_tokens)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        data = await request.json()
+        model = data.get("model", "mock")
+        n_tokens = completion_tokens(data)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        usage = {"prompt_tokens": prompt_tokens(data.get("messages", [])), "completion_tokens": n_tokens}
+        usage["total_tokens"] = usage["prompt_tokens"] + n_tokens
+
+        if data.get("stream"):
+            async def events():
+                async for token in generate(n_tokens):
+                    chunk = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                             "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                final = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                         "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": await full_completion(n_tokens)},
+                         "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        data = await request.json()
+        texts = data["input"] if isinstance(data["input"], list) else [data["input"]]
+        await asyncio.sleep(config.latency.sample(config.rng))
+        items = []
+        for index, text in enumerate(texts):
+            vector = embedding_vector(text, config.embedding_dim)
+            if data.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.tobytes()).decode()
+            else:
+                embedding = vector.tolist()
+            items.append({"object": "embedding", "index": index, "embedding": embedding})
+        tokens = sum(len(text) for text in texts) // 4 + 1
+        return {"object": "list", "data": items, "model": data.get("model", "mock"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    @app.post("/v1/images/generations")
+    async def images(request: Request):
+        data = await request.json()
+        await asyncio.sleep(config.latency.sample(config.rng))
+        return {"created": int(time.time()), "data": [{"b64_json": PIXEL_PNG} for _ in range(data.get("n", 1))]}
+
+    @app.post("/api/chat")
+    async def ollama_chat(request: Request):
+        data = await request.json()
+        model = data.get("model", "mock")
+        n_tokens = (data.get("options") or {}).get("num_predict") or config.completion_tokens
+
+        def message(content, done):
+            return {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                    "message": {"role": "assistant", "content": content}, "done": done}
+
+        # Like Ollama itself, /api/chat streams NDJSON unless told not to
+        if data.get("stream", True):
+            async def lines():
+                async for token in generate(n_tokens):
+                    yield json.dumps(message(token, False)) + "\n"
+                yield json.dumps({**message("", True), "eval_count": n_tokens}) + "\n"
+            return StreamingResponse(lines(), media_type="application/x-ndjson")
+        return {**message(await full_completion(n_tokens), True), "eval_count": n_tokens,
+                "prompt_eval_count": prompt_tokens(data.get("messages", []))}
+
+    @app.post("/api/embed")
+    async def ollama_embed(request: Request):
+        data = await request.json()
+        texts = data.get("input") or []
+        texts = texts if isinstance(texts, list) else [texts]
+        await asyncio.sleep(config.latency.sample(config.rng))
+        return {"model": data.get("model", "mock"),
+                "embeddings": [embedding_vector(t, config.embedding_dim).tolist() for t in texts]}
+
+    @app.post("/api/embeddings")
+    async def ollama_embeddings(request: Request):
+        # The legacy single-prompt endpoint
+        data = await request.json()
+        await asyncio.sleep(config.latency.sample(config.rng))
+        return {"embedding": embedding_vector(data.get("prompt", ""), config.embedding_dim).tolist()}
+
+    @app.post("/api/generate")
+    async def ollama_generate(request: Request):
+        data = await request.json()
+        # An empty prompt only loads the model, as Smart-Host's warm-up relies on
+        response = await full_completion(config.completion_tokens) if data.get("prompt") else ""
+        return {"model": data.get("model", "mock"), "response": response, "done": True}
+
+    return app
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a mock OpenAI/OpenRouter/Ollama API for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", default="fixed:0",
+                        help="Time to first token: fixed:S, uniform:LOW,HIGH, normal:MEAN,STD, "
+                             "exponential:MEAN or lognormal:MEDIAN,SIGMA (default: fixed:0)")
+    parser.add_argument("--token-rate", type=float, default=0,
+                        help="Completion tokens per second after the first (default: 0, all at once)")
+    parser.add_argument("--completion-tokens", type=int, default=20, help="Tokens per completion (default: 20)")
+    parser.add_argument("--embedding-dim", type=int, default=1536, help="Embedding dimensions (default: 1536)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests refused with 429")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute before every request gets 429")
+    parser.add_argument("--retry-after", type=float, default=1, help="Retry-After sent with injected 429s")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for latency and failure sampling")
+    parser.add_argument("--cassette", default=None,
+                        help="Serve recorded responses from this cassette (see PROVIDER_CASSETTE_MODE)")
+    parser.add_argument("--time-scale", type=float, default=1.0,
+                        help="Multiplier for the cassette's recorded delays (default: 1.0)")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+    config = MockConfig(args.latency, args.token_rate, args.completion_tokens, args.embedding_dim,
+                        args.error_rate, args.rate_limit_rate, args.rpm, args.retry_after, args.seed,
+                        Cassette.load(args.cassette, args.time_scale) if args.cassette else None)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
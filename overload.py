@@ -0,0 +1,60 @@
+import asyncio
+import anyio.to_thread
+import metrics
+from scheduling import total_in_flight
+from settings import settings
+
+LOOP_LAG = metrics.gauge('smart_host_event_loop_lag_seconds', 'Smoothed event-loop scheduling lag')
+THREADPOOL_UTILIZATION = metrics.gauge(
+    'smart_host_threadpool_utilization', 'Fraction of worker threads busy running sync handlers')
+SHED = metrics.counter('smart_host_overload_shed_total', 'Requests rejected by the overload detector', ['reason'])
+
+class ServerOverloaded(Exception):
+    """Raised (or rendered) when new work is shed; the API layer turns it into a 503."""
+
+class OverloadDetector:
+    """
+    Decides whether the server is too busy to take on new LLM work.
+
+    A background task on the event loop measures how late its own timer
+    wakes up (event-loop lag) and how many of AnyIO's worker threads are
+    borrowed by sync handlers. Together with the number of provider calls in
+    flight these are compared against configured thresholds.
+    """
+
+    def __init__(self, max_loop_lag=None, max_threadpool_utilization=None, max_in_flight=None,
+                 interval=None):
+        self.max_loop_lag = settings.OVERLOAD_MAX_LOOP_LAG if max_loop_lag is None else max_loop_lag
+        self.max_threadpool_utilization = (
+            settings.OVERLOAD_MAX_THREADPOOL_UTILIZATION
+            if max_threadpool_utilization is None else max_threadpool_utilization
+        )
+        self.max_in_flight = settings.OVERLOAD_MAX_IN_FLIGHT if max_in_flight is None else max_in_flight
+        self.interval = settings.OVERLOAD_CHECK_INTERVAL if interval is None else interval
+        self.loop_lag = 0.0
+        self.threadpool_utilization = 0.0
+
+    async def monitor(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - scheduled - self.interval)
+            # Smooth out one-off hiccups such as a GC pause
+            self.loop_lag = 0.7 * self.loop_lag + 0.3 * lag
+            limiter = anyio.to_thread.current_default_thread_limiter()
+            self.threadpool_utilization = limiter.borrowed_tokens / limiter.total_tokens
+            LOOP_LAG.labels().set(self.loop_lag)
+            THREADPOOL_UTILIZATION.labels().set(self.threadpool_utilization)
+
+    def overload_reason(self):
+        """Return the first threshold crossed, or None when there's spare capacity."""
+        if self.max_loop_lag and self.loop_lag > self.max_loop_lag:
+            return "event_loop_lag"
+        if self.max_threadpool_utilization and self.threadpool_utilization >= self.max_threadpool_utilization:
+            return "threadpool_saturated"
+        if self.max_in_flight and total_in_flight() >= self.max_in_flight:
+            return "upstream_in_flight"
+        return None
+
+OVERLOAD_DETECTOR = OverloadDetector()
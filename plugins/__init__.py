@@ -10,7 +10,8 @@ for fname in os.listdir(plugin_dir):
         mod_name = f"plugins.{fname[:-3]}"
         mod = importlib.import_module(mod_name)
         for name, obj in inspect.getmembers(mod):
-            if inspect.isfunction(obj):
+            # Only functions defined in the plugin, not helpers it imports (such as the @tool decorator)
+            if inspect.isfunction(obj) and obj.__module__ == mod_name:
                 PLUGIN_REGISTRY[name] = obj
 
 def list_tools():
@@ -0,0 +1,224 @@
+import asyncio
+import contextvars
+import cProfile
+import functools
+import hmac
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, defaultdict
+from fastapi.routing import APIRoute
+from settings import settings
+
+PROFILE_MODES = ("cprofile", "sample")
+
+# Deeper cProfile call paths are cut off when rebuilding stacks
+MAX_STACK_DEPTH = 64
+
+# Shorter sampling intervals would spend the profiled process's CPU walking stacks
+MIN_SAMPLE_INTERVAL = 0.001
+
+def admin_authorized(token):
+    """Whether `token` unlocks the debug facilities; they are off entirely while ADMIN_TOKEN is unset."""
+    return bool(settings.ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, settings.ADMIN_TOKEN)
+
+def _frame_label(filename, line, name):
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+def _frame_stack(frame):
+    labels = []
+    while frame is not None:
+        code = frame.f_code
+        labels.append(_frame_label(code.co_filename, code.co_firstlineno, code.co_name))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+def collapsed(counts):
+    """Render stack counts in the collapsed format read by flamegraph.pl, speedscope and friends."""
+    return ''.join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+class StackSampler:
+    """
+    Statistical profiler: every `interval` seconds it records the Python
+    stack of each thread (or only of `thread_ids`, when given). It walks
+    frames from outside the sampled threads, so they run at full speed.
+    """
+
+    def __init__(self, interval=None, thread_ids=None):
+        self.interval = max(interval or settings.PROFILE_SAMPLE_INTERVAL, MIN_SAMPLE_INTERVAL)
+        self.thread_ids = thread_ids
+        self.counts = Counter()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        watched = self.thread_ids
+        for ident, frame in sys._current_frames().items():
+            if ident == own or (watched is not None and ident not in watched):
+                continue
+            self.counts[f"{names.get(ident, 'thread')};{_frame_stack(frame)}"] += 1
+
+    def run(self, seconds):
+        """Sample for `seconds` on the calling thread and return collapsed stacks."""
+        deadline = time.monotonic() + seconds
+        while not self._stopped.is_set() and time.monotonic() < deadline:
+            self.sample()
+            self._stopped.wait(self.interval)
+        return collapsed(self.counts)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, args=(float('inf'),), name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+def cprofile_collapsed(stats):
+    """
+    Rebuild collapsed stacks from a pstats.Stats.
+
+    cProfile only keeps caller/callee pairs, so each path's share of a
+    function's time is estimated from the time spent along each edge.
+    Values are self time in microseconds.
+    """
+    entries = stats.stats
+    callees = defaultdict(dict)
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            callees[caller][func] = edge[3]
+    counts = Counter()
+
+    def walk(func, path, on_path, share):
+        _, _, self_time, _, _ = entries[func]
+        path = path + [_frame_label(*func)]
+        self_us = int(self_time * share * 1e6)
+        if self_us:
+            counts[';'.join(path)] += self_us
+        if len(path) >= MAX_STACK_DEPTH:
+            return
+        for callee, edge_time in callees.get(func, {}).items():
+            callee_time = entries[callee][3]
+            if callee in on_path or callee_time <= 0:
+                continue
+            callee_share = min(1.0, share * edge_time / callee_time)
+            if callee_share > 1e-4:
+                walk(callee, path, on_path | {callee}, callee_share)
+
+    for func, (_, _, _, _, callers) in entries.items():
+        if not callers:
+            walk(func, [], {func}, 1.0)
+    return collapsed(counts)
+
+class RequestProfile:
+    """
+    Profile of the work one request does on the worker threads it runs on.
+
+    Each piece of work passed to run() is profiled on its own thread, with
+    cProfile or by sampling that thread's stack, and the results are
+    merged into one set of collapsed stacks.
+    """
+
+    def __init__(self, mode):
+        self.id = uuid.uuid4().hex
+        self.mode = mode
+        self.created_at = time.time()
+        self._profiles = []
+        self._threads = set()
+        self._sampler = None
+        self._lock = threading.Lock()
+
+    def run(self, fn, *args, **kwargs):
+        ident = threading.get_ident()
+        with self._lock:
+            if ident in self._threads:
+                # Already being profiled further up this thread's stack
+                nested = True
+            else:
+                nested = False
+                self._threads.add(ident)
+                if self.mode == "sample":
+                    start = self._sampler is None
+                    if start:
+                        self._sampler = StackSampler()
+                    # The sampler reads this without the lock, so it is replaced rather than mutated
+                    self._sampler.thread_ids = frozenset(self._threads)
+                    if start:
+                        self._sampler.start()
+        if nested:
+            return fn(*args, **kwargs)
+        try:
+            if self.mode == "cprofile":
+                profiler = cProfile.Profile()
+                try:
+                    return profiler.runcall(fn, *args, **kwargs)
+                finally:
+                    with self._lock:
+                        self._profiles.append(profiler)
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._threads.discard(ident)
+                if self._sampler is not None:
+                    self._sampler.thread_ids = frozenset(self._threads)
+
+    def stop(self):
+        if self._sampler is not None:
+            self._sampler.stop()
+
+    def collapsed(self):
+        with self._lock:
+            profiles = list(self._profiles)
+        if self.mode == "sample":
+            return collapsed(self._sampler.counts) if self._sampler else ""
+        if not profiles:
+            return ""
+        stats = pstats.Stats(profiles[0])
+        for profiler in profiles[1:]:
+            stats.add(profiler)
+        return cprofile_collapsed(stats)
+
+_REQUEST_PROFILE = contextvars.ContextVar('request_profile', default=None)
+
+def set_request_profile(profile):
+    return _REQUEST_PROFILE.set(profile)
+
+def reset_request_profile(handle):
+    _REQUEST_PROFILE.reset(handle)
+
+def run_profiled(fn, *args, **kwargs):
+    """Call fn, profiling it if the current request asked to be profiled."""
+    profile = _REQUEST_PROFILE.get()
+    if profile is None:
+        return fn(*args, **kwargs)
+    return profile.run(fn, *args, **kwargs)
+
+# The most recent request profiles, by id
+PROFILES = OrderedDict()
+_PROFILES_LOCK = threading.Lock()
+
+def keep_profile(profile):
+    with _PROFILES_LOCK:
+        PROFILES[profile.id] = profile
+        while len(PROFILES) > settings.PROFILE_KEEP:
+            PROFILES.popitem(last=False)
+
+class ProfiledRoute(APIRoute):
+    """Route whose sync endpoint runs through run_profiled() on its worker thread."""
+
+    def __init__(self, path, endpoint, **kwargs):
+        if not asyncio.iscoroutinefunction(endpoint):
+            endpoint = _profiled(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+def _profiled(endpoint):
+    @functools.wraps(endpoint)
+    def profiled_endpoint(*args, **kwargs):
+        return run_profiled(endpoint, *args, **kwargs)
+    return profiled_endpoint
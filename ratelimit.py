@@ -0,0 +1,191 @@
+import functools
+import heapq
+import itertools
+import json
+import math
+import threading
+import time
+import metrics
+from cancellation import RequestCancelled, current_token
+from settings import settings
+
+QUEUE_DEPTH = metrics.gauge(
+    'smart_host_ratelimit_queue_depth', 'Requests waiting for rate-limit capacity', ['limiter'])
+QUEUE_WAIT = metrics.histogram(
+    'smart_host_ratelimit_wait_seconds', 'Time spent waiting for rate-limit capacity', ['limiter'])
+REJECTED = metrics.counter(
+    'smart_host_ratelimit_rejected_total', 'Requests shed by the rate limiter', ['limiter', 'reason'])
+
+class RateLimitExceeded(Exception):
+    """Raised when a request cannot be admitted; the API layer turns it into a 429."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """A bucket refilled continuously at `per_minute` units per minute."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.rate = self.capacity / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount, now):
+        """Seconds until `amount` units are available (requests larger than the bucket wait for a full one)."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def consume(self, amount, now):
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute buckets for one provider or model.
+
+    Requests that can't be admitted immediately wait in a bounded queue,
+    highest priority first and FIFO within a priority. A request is shed
+    with RateLimitExceeded when the queue is full or it can't be admitted
+    within max_wait seconds, and leaves the queue with RequestCancelled if
+    its caller goes away first.
+    """
+
+    def __init__(self, name, rpm=None, tpm=None, max_queue=None, max_wait=None):
+        self.name = name
+        self.buckets = {}
+        if rpm:
+            self.buckets['requests'] = TokenBucket(rpm)
+        if tpm:
+            self.buckets['tokens'] = TokenBucket(tpm)
+        self.max_queue = settings.RATE_LIMIT_MAX_QUEUE if max_queue is None else max_queue
+        self.max_wait = settings.RATE_LIMIT_MAX_WAIT if max_wait is None else max_wait
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def _delay(self, tokens, now):
+        delays = [0.0]
+        if 'requests' in self.buckets:
+            delays.append(self.buckets['requests'].delay(1, now))
+        if 'tokens' in self.buckets:
+            delays.append(self.buckets['tokens'].delay(tokens, now))
+        return max(delays)
+
+    def _consume(self, tokens, now):
+        if 'requests' in self.buckets:
+            self.buckets['requests'].consume(1, now)
+        if 'tokens' in self.buckets:
+            self.buckets['tokens'].consume(tokens, now)
+
+    def _retry_after(self, tokens, now):
+        # Rough time for the queue ahead of us to drain plus our own refill
+        per_request = 60.0 / self.buckets['requests'].capacity if 'requests' in self.buckets else 0.0
+        return max(1, math.ceil(self._delay(tokens, now) + len(self._waiters) * per_request))
+
+    def _shed(self, reason, tokens, now):
+        REJECTED.labels(self.name, reason).inc()
+        raise RateLimitExceeded(
+            f"Rate limit exceeded for {self.name} ({reason})",
+            retry_after=self._retry_after(tokens, now),
+        )
+
+    def acquire(self, tokens=0, priority=0):
+        """Block until the request fits in every bucket, or raise RateLimitExceeded."""
+        start = time.monotonic()
+        with self._cond:
+            if not self._waiters and self._delay(tokens, start) == 0:
+                self._consume(tokens, start)
+                QUEUE_WAIT.labels(self.name).observe(0.0)
+                return
+            if len(self._waiters) >= self.max_queue:
+                self._shed('queue_full', tokens, start)
+            if self._delay(tokens, start) > self.max_wait:
+                self._shed('max_wait', tokens, start)
+
+            entry = (-priority, next(self._sequence), tokens)
+            heapq.heappush(self._waiters, entry)
+            QUEUE_DEPTH.labels(self.name).set(len(self._waiters))
+            deadline = start + self.max_wait
+            token = current_token()
+            unregister = token.add_callback(self._wake) if token is not None else (lambda: None)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if token is not None and token.cancelled:
+                        self._withdraw(entry)
+                        raise RequestCancelled(token.reason, "queued")
+                    if self._waiters[0] is entry:
+                        delay = self._delay(tokens, now)
+                        if delay == 0:
+                            heapq.heappop(self._waiters)
+                            self._consume(tokens, now)
+                            QUEUE_WAIT.labels(self.name).observe(now - start)
+                            return
+                    else:
+                        delay = deadline - now
+                    if now >= deadline:
+                        self._withdraw(entry)
+                        self._shed('max_wait', tokens, now)
+                    self._cond.wait(min(delay, deadline - now))
+            finally:
+                unregister()
+                QUEUE_DEPTH.labels(self.name).set(len(self._waiters))
+                self._cond.notify_all()
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def _withdraw(self, entry):
+        self._waiters.remove(entry)
+        heapq.heapify(self._waiters)
+
+    def settle(self, estimated, actual):
+        """Correct the token bucket once the provider reports actual usage."""
+        if actual is None or 'tokens' not in self.buckets:
+            return
+        with self._cond:
+            self.buckets['tokens'].consume(actual - estimated, time.monotonic())
+
+def estimate_tokens(messages, max_tokens=None):
+    """Cheap prompt size estimate (about four characters per token) plus the completion budget."""
+    prompt_chars = sum(len(str(m.get('content', ''))) for m in messages or [])
+    return prompt_chars // 4 + (max_tokens or settings.RATE_LIMIT_DEFAULT_COMPLETION_TOKENS)
+
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+@functools.lru_cache(maxsize=4)
+def _parse_limits(raw):
+    try:
+        return json.loads(raw) if raw else {}
+    except ValueError:
+        return {}
+
+def get_rate_limiter(provider, model=None):
+    """
+    Return the limiter for provider/model, falling back to the provider-wide one.
+
+    Limits come from the RATE_LIMITS setting, e.g.
+    {"openai": {"rpm": 3500, "tpm": 90000}, "openai/gpt-4o": {"rpm": 500}}.
+    Returns None when no limit is configured.
+    """
+    limits = _parse_limits(settings.RATE_LIMITS)
+    for name in ([f"{provider}/{model}"] if model else []) + [provider]:
+        if name in limits:
+            with _LIMITERS_LOCK:
+                if name not in _LIMITERS:
+                    config = limits[name]
+                    _LIMITERS[name] = RateLimiter(
+                        name, rpm=config.get('rpm'), tpm=config.get('tpm'),
+                        max_queue=config.get('max_queue'), max_wait=config.get('max_wait'),
+                    )
+                return _LIMITERS[name]
+    return None
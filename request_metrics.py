@@ -0,0 +1,53 @@
+import contextvars
+import metrics
+from settings import settings
+
+# Per-operation metrics, recorded wherever log_response() is called
+REQUESTS = metrics.counter(
+    'smart_host_requests_total', 'Requests handled, by endpoint, provider, model and status',
+    ['endpoint', 'provider', 'model', 'status'])
+REQUEST_LATENCY = metrics.histogram(
+    'smart_host_request_duration_seconds', 'Time spent handling a request', ['endpoint', 'provider', 'model'])
+ERRORS = metrics.counter('smart_host_errors_total', 'Errors logged, by exception type', ['type'])
+
+def model_label(model):
+    """The `model` label for a request: its name if it is a configured model, otherwise "other"."""
+    if not model:
+        return "default"
+    # Model names come from clients, so unknown ones share a series instead of each adding one
+    if (model in settings.METRICS_MODELS or model in settings.OLLAMA_PRELOAD_MODELS
+            or model in settings.OLLAMA_KEEP_WARM_MODELS or model in settings.OLLAMA_MODEL_KEEP_ALIVE):
+        return model
+    return "other"
+
+# Per-route HTTP metrics, recorded by the API middleware
+HTTP_REQUESTS = metrics.counter(
+    'smart_host_http_requests_total', 'HTTP requests by route and status', ['method', 'route', 'status'])
+HTTP_LATENCY = metrics.histogram(
+    'smart_host_http_request_duration_seconds', 'HTTP request time, from the middleware to the response headers',
+    ['method', 'route'])
+HTTP_IN_FLIGHT = metrics.gauge(
+    'smart_host_http_requests_in_flight', 'HTTP requests currently being handled', ['route'])
+OVERHEAD = metrics.histogram(
+    'smart_host_request_overhead_seconds', 'HTTP request time not spent waiting on provider calls', ['route'])
+
+UPSTREAM_LATENCY = metrics.histogram(
+    'smart_host_upstream_duration_seconds', 'Time spent waiting on a provider HTTP call', ['provider', 'path'])
+
+# Seconds the current HTTP request has spent in provider calls; a one-item list shared with
+# the worker threads the request runs on, because they each get a copy of the context
+_UPSTREAM_TIME = contextvars.ContextVar('upstream_time', default=None)
+
+def begin_request():
+    """Start accounting upstream time for the current request; returns (handle, accumulator)."""
+    accumulator = [0.0]
+    return _UPSTREAM_TIME.set(accumulator), accumulator
+
+def end_request(handle):
+    _UPSTREAM_TIME.reset(handle)
+
+def observe_upstream(provider, path, seconds):
+    UPSTREAM_LATENCY.labels(provider, path).observe(seconds)
+    accumulator = _UPSTREAM_TIME.get()
+    if accumulator is not None:
+        accumulator[0] += seconds
@@ -1,10 +1,24 @@
 from core.openai_client import OpenAIClient
 from core.openrouter_client import OpenRouterClient
 from core.ollama_client import OllamaClient
+import contextvars
 import json
 import os
 import time
 from memory.vector_store import SQLiteVectorStore
+from memory.embedding_cache import EMBEDDING_CACHE
+from embeddings import extract_embeddings, embedding_response
+from documents import format_context
+import numpy as np
+from cache import RESPONSE_CACHE, cache_key
+from coalesce import CHAT_FLIGHTS, EMBED_FLIGHTS, coalescing_enabled
+from batching import MicroBatcher
+from cancellation import CANCELLED, RequestCancelled, check_cancelled, is_cancelled
+from concurrent.futures import ThreadPoolExecutor
+from settings import settings
+from ratelimit import get_rate_limiter, estimate_tokens
+from scheduling import get_scheduler
+from tracing import span
 from utils import log_error, log_request, log_response
 
 PROFILE_PATH = os.path.join(os.path.dirname(__file__), 'profiles', 'profiles.json')
@@ -13,9 +27,33 @@ with open(PROFILE_PATH, 'r', encoding='utf-8') as f:
 
 MEMORY_STORE = SQLiteVectorStore()
 
+# Providers whose embeddings API can return base64-encoded float32 vectors
+BASE64_EMBEDDING_PROVIDERS = ("openai", "openrouter")
+
+# Shared by every request so batched embeddings never exceed the configured fan-out
+EMBED_EXECUTOR = ThreadPoolExecutor(max_workers=settings.EMBED_MAX_CONCURRENT_BATCHES,
+                                    thread_name_prefix="embed-batch")
+EMBED_MICRO_BATCHER = MicroBatcher("embed", settings.EMBED_MICRO_BATCH_WINDOW_MS / 1000,
+                                   settings.EMBED_MICRO_BATCH_MAX_SIZE)
+
+def retrieve_documents(query, collection="default", top_k=5, tenant=None):
+    """
+    Return the top_k chunks of a document collection most similar to query.
+
+    The query is embedded with the provider and model the collection was
+    indexed with, whatever provider the caller chats with.
+    """
+    embedding_model = MEMORY_STORE.collection_embedding_model(collection)
+    if embedding_model is None:
+        return []
+    provider, model = embedding_model
+    query_vector = Router(provider, tenant=tenant).embed_matrix(query, model=model)[0]
+    return MEMORY_STORE.search_documents(collection, query_vector, top_k)
+
 class Router:
-    def __init__(self, provider):
+    def __init__(self, provider, tenant=None):
         self.provider = provider.lower()
+        self.tenant = tenant
         self.clients = {
             'openai': OpenAIClient(),
             'openrouter': OpenRouterClient(),
@@ -25,8 +63,112 @@ class Router:
             raise ValueError(f"Unknown provider: {self.provider}")
         self.client = self.clients[self.provider]
 
+    def _use_response_cache(self, cache, profile, kwargs):
+        """
+        Decide whether a chat may be answered from the response cache.
+
+        The cache must be enabled globally; then `cache=False` bypasses it,
+        `cache=True` opts in, and otherwise only deterministic requests
+        (temperature 0) or profiles marked "cacheable" are cached.
+        """
+        if not settings.RESPONSE_CACHE_ENABLED or cache is False:
+            return False
+        return self._is_deterministic(cache, profile, kwargs)
+
+    def _is_deterministic(self, cache, profile, kwargs):
+        """Whether any caller asking the same thing may get the same answer: greedy sampling, a cacheable profile or `cache=True`."""
+        return cache is True or kwargs.get("temperature") == 0 or bool(PROFILES.get(profile, {}).get("cacheable"))
+
+    def _call_chat(self, messages, model, priority, user_id, kwargs):
+        # Wait for client-side rate-limit capacity before going upstream
+        limiter = get_rate_limiter(self.provider, model)
+        estimated_tokens = estimate_tokens(messages, kwargs.get("max_tokens"))
+        if limiter:
+            with span("ratelimit.wait"):
+                limiter.acquire(estimated_tokens, priority=priority)
+            check_cancelled()
+        
+        # Call the client once this tenant's fair share of upstream slots allows it
+        with get_scheduler(self.provider).slot(self.tenant or user_id or "anonymous"):
+            # The caller may have given up while this request was queued
+            check_cancelled()
+            with span("provider", provider=self.provider, model=model or "default"):
+                if model:
+                    response = self.client.chat(messages, model=model, **kwargs)
+                else:
+                    response = self.client.chat(messages, **kwargs)
+        
+        if limiter and isinstance(response, dict):
+            limiter.settle(estimated_tokens, (response.get("usage") or {}).get("total_tokens"))
+        return response
+
+    def _remember(self, memory, messages, response, chat_id, user_id, save_to_user_memory):
+        """Store the user messages and, when given, the model response in memory."""
+        timestamp = time.time()
+        
+        for msg in messages:
+            if msg["role"] == "user":
+                if chat_id:
+                    # Save to conversation memory
+                    memory.add(
+                        chat_id, 
+                        msg["content"], 
+                        metadata={
+                            "type": "memory", 
+                            "role": "user",
+                            "timestamp": timestamp
+                        },
+                        memory_type="conversation",
+                        user_id=user_id
+                    )
+                
+                # Optionally save to user memory
+                if user_id and save_to_user_memory:
+                    memory.add(
+                        user_id, 
+                        msg["content"], 
+                        metadata={
+                            "type": "memory", 
+                            "role": "user",
+                            "timestamp": timestamp
+                        },
+                        memory_type="user"
+                    )
+        
+        if isinstance(response, dict) and "choices" in response:
+            for choice in response["choices"]:
+                content = choice.get("message", {}).get("content")
+                if content:
+                    if chat_id:
+                        # Save to conversation memory
+                        memory.add(
+                            chat_id, 
+                            content, 
+                            metadata={
+                                "type": "memory", 
+                                "role": "assistant",
+                                "timestamp": timestamp
+                            },
+                            memory_type="conversation",
+                            user_id=user_id
+                        )
+                    
+                    # Optionally save to user memory
+                    if user_id and save_to_user_memory:
+                        memory.add(
+                            user_id, 
+                            content, 
+                            metadata={
+                                "type": "memory", 
+                                "role": "assistant",
+                                "timestamp": timestamp
+                            },
+                            memory_type="user"
+                        )
+
     def chat(self, messages, model=None, profile=None, chat_id=None, user_id=None, 
-              include_user_memory=True, save_to_user_memory=False, **kwargs):
+              include_user_memory=True, save_to_user_memory=False, priority=0, cache=None,
+              retrieve_top_k=0, collection="default", session_memory=None, **kwargs):
         start_time = time.time()
         try:
             # Log internal operation
@@ -37,17 +179,23 @@ class Router:
                 "user_id": user_id,
                 "include_user_memory": include_user_memory,
                 "save_to_user_memory": save_to_user_memory,
+                "retrieve_top_k": retrieve_top_k,
                 "messages_count": len(messages) if messages else 0
             })
             
+            # Long-lived sessions pass a SessionMemory so context isn't re-read every turn
+            memory = session_memory or MEMORY_STORE
+            
             # Retrieve conversation-specific memory
             memory_entries = []
             if chat_id:
-                memory_entries = MEMORY_STORE.query(chat_id, include_user_memory=False, user_id=user_id)
+                with span("memory.query"):
+                    memory_entries = memory.query(chat_id, include_user_memory=False, user_id=user_id)
                 
             # Add user-specific memory if requested and available
             if user_id and include_user_memory:
-                user_memory = MEMORY_STORE.query(chat_id, include_user_memory=True, user_id=user_id)
+                with span("memory.query"):
+                    user_memory = memory.query(chat_id, include_user_memory=True, user_id=user_id)
                 # Prepend user memories before conversation memories
                 memory_entries = user_memory + memory_entries
                 
@@ -57,6 +205,14 @@ class Router:
                     mem_msg = {"role": "system", "content": entry["vector"]}
                     messages = [mem_msg] + messages
             
+            # Ground the conversation in the passages most similar to the latest user message
+            if retrieve_top_k:
+                query = next((m["content"] for m in reversed(messages) if m["role"] == "user"), None)
+                with span("retrieval", collection=collection):
+                    chunks = retrieve_documents(query, collection, retrieve_top_k, self.tenant) if query else []
+                if chunks:
+                    messages = [format_context(chunks)] + messages
+            
             # Inject profile system message
             if profile:
                 profile_data = PROFILES.get(profile)
@@ -66,80 +222,66 @@ class Router:
                 else:
                     log_error(ValueError(f"Profile not found: {profile}"), {"profile_name": profile})
             
-            # Call the client
-            if model:
-                response = self.client.chat(messages, model=model, **kwargs)
-            else:
-                response = self.client.chat(messages, **kwargs)
+            # Serve repeated deterministic requests from the cache, keyed on the final messages
+            response = None
+            response_cache_key = None
+            if self._use_response_cache(cache, profile, kwargs):
+                with span("cache.lookup"):
+                    response_cache_key = cache_key(self.provider, model, messages, kwargs)
+                    response = RESPONSE_CACHE.get(response_cache_key)
             
-            # Store user message and model response in memory
-            if chat_id or user_id:
-                timestamp = time.time()
-                
-                for msg in messages:
-                    if msg["role"] == "user":
-                        if chat_id:
-                            # Save to conversation memory
-                            MEMORY_STORE.add(
-                                chat_id, 
-                                msg["content"], 
-                                metadata={
-                                    "type": "memory", 
-                                    "role": "user",
-                                    "timestamp": timestamp
-                                },
-                                memory_type="conversation",
-                                user_id=user_id
-                            )
-                        
-                        # Optionally save to user memory
-                        if user_id and save_to_user_memory:
-                            MEMORY_STORE.add(
-                                user_id, 
-                                msg["content"], 
-                                metadata={
-                                    "type": "memory", 
-                                    "role": "user",
-                                    "timestamp": timestamp
-                                },
-                                memory_type="user"
-                            )
+            # Followers of a coalesced call leave persisting the exchange to its leader
+            persist = True
+            if response is None:
+                def call_upstream():
+                    result = self._call_chat(messages, model, priority, user_id, kwargs)
+                    if response_cache_key:
+                        RESPONSE_CACHE.set(response_cache_key, result)
+                    return result
                 
-                if isinstance(response, dict) and "choices" in response:
-                    for choice in response["choices"]:
-                        content = choice.get("message", {}).get("content")
-                        if content:
-                            if chat_id:
-                                # Save to conversation memory
-                                MEMORY_STORE.add(
-                                    chat_id, 
-                                    content, 
-                                    metadata={
-                                        "type": "memory", 
-                                        "role": "assistant",
-                                        "timestamp": timestamp
-                                    },
-                                    memory_type="conversation",
-                                    user_id=user_id
-                                )
-                            
-                            # Optionally save to user memory
-                            if user_id and save_to_user_memory:
-                                MEMORY_STORE.add(
-                                    user_id, 
-                                    content, 
-                                    metadata={
-                                        "type": "memory", 
-                                        "role": "assistant",
-                                        "timestamp": timestamp
-                                    },
-                                    memory_type="user"
-                                )
+                try:
+                    with span("upstream"):
+                        if coalescing_enabled("chat") and self._is_deterministic(cache, profile, kwargs):
+                            # Identical concurrent requests of one tenant, including their memory targets,
+                            # share one call; sampled requests each get their own completion
+                            flight_key = cache_key(self.provider, model, messages, kwargs,
+                                                   chat_id, user_id, save_to_user_memory, self.tenant)
+                            while True:
+                                try:
+                                    response, persist = CHAT_FLIGHTS.do(flight_key, call_upstream)
+                                    break
+                                except RequestCancelled:
+                                    # The flight's leader gave up; go again unless this caller did too
+                                    check_cancelled("upstream")
+                        else:
+                            response = call_upstream()
+                except RequestCancelled:
+                    if settings.CANCELLED_MEMORY_POLICY == "prompt" and (chat_id or user_id):
+                        with span("memory.write"):
+                            self._remember(memory, messages, None, chat_id, user_id, save_to_user_memory)
+                    raise
+            
+            # Store user message and model response in memory
+            if persist and (chat_id or user_id):
+                if is_cancelled():
+                    # Answered, but the caller is gone; the policy decides what is still worth keeping
+                    policy = settings.CANCELLED_MEMORY_POLICY
+                    if policy in ("prompt", "complete"):
+                        with span("memory.write"):
+                            self._remember(memory, messages, response if policy == "complete" else None,
+                                           chat_id, user_id, save_to_user_memory)
+                    check_cancelled("response")
+                with span("memory.write"):
+                    self._remember(memory, messages, response, chat_id, user_id, save_to_user_memory)
             
             # Log successful operation
-            log_response(self.provider, "router.chat", 200, time.time() - start_time)
+            log_response(self.provider, "router.chat", 200, time.time() - start_time, model)
             return response
             
+        except RequestCancelled as e:
+            CANCELLED.labels("chat", e.stage).inc()
+            log_response(self.provider, "router.chat", 499, time.time() - start_time, model)
+            raise
         except Exception as e:
             # Log the error
             log_error(e, {
@@ -152,6 +294,81 @@ class Router:
             # Re-raise the exception to be handled by the API layer
             raise
 
+    def _call_embed(self, input, model, kwargs):
+        # Wait for client-side rate-limit capacity before going upstream
+        limiter = get_rate_limiter(self.provider, model)
+        if limiter:
+            texts = input if isinstance(input, list) else [input]
+            with span("ratelimit.wait"):
+                limiter.acquire(sum(len(text) for text in texts) // 4)
+        
+        with get_scheduler(self.provider).slot(self.tenant or "anonymous"):
+            with span("provider", provider=self.provider, model=model or "default"):
+                if model:
+                    return self.client.embed(input, model=model, **kwargs)
+                return self.client.embed(input, **kwargs)
+
+    def _embed_upstream(self, input, model, kwargs):
+        # Call the client, sharing the call with identical concurrent requests
+        if coalescing_enabled("embed"):
+            flight_key = cache_key(self.provider, model, input, kwargs)
+            response, _ = EMBED_FLIGHTS.do(flight_key, lambda: self._call_embed(input, model, kwargs))
+            return response
+        return self._call_embed(input, model, kwargs)
+
+    def _embed_batches(self, texts, model, kwargs):
+        """Embed texts in provider-sized sub-batches, run concurrently, returning vectors in order."""
+        size = settings.EMBED_BATCH_SIZES.get(self.provider, 256)
+        batches = [texts[i:i + size] for i in range(0, len(texts), size)]
+        if self.provider in BASE64_EMBEDDING_PROVIDERS:
+            # Vectors are decoded straight from bytes instead of parsing one JSON float at a time
+            kwargs = {"encoding_format": "base64", **kwargs}
+        embed_batch = lambda batch: extract_embeddings(self._embed_upstream(batch, model, kwargs))
+        if len(batches) == 1:
+            return embed_batch(batches[0])
+        # Each batch runs in its own copy of the request's context, so its spans and upstream time are recorded
+        contexts = [contextvars.copy_context() for _ in batches]
+        vectors = EMBED_EXECUTOR.map(lambda context, batch: context.run(embed_batch, batch), contexts, batches)
+        return [vector for batch_vectors in vectors for vector in batch_vectors]
+
+    def _embed_unique(self, texts, model, kwargs):
+        """Embed distinct texts, serving cached vectors and sending only the misses upstream."""
+        if not settings.EMBEDDING_CACHE_ENABLED:
+            return self._embed_batches(texts, model, kwargs)
+        with span("embed.cache"):
+            vectors = EMBEDDING_CACHE.get_many(self.provider, model, texts)
+        missing = [text for text, vector in zip(texts, vectors) if vector is None]
+        if missing:
+            fresh = self._embed_batches(missing, model, kwargs)
+            EMBEDDING_CACHE.put_many(self.provider, model, missing, fresh)
+            fresh = iter(fresh)
+            vectors = [vector if vector is not None else next(fresh) for vector in vectors]
+        return vectors
+
+    def _embed_vectors(self, texts, model, kwargs):
+        # Each distinct text is embedded once, then fanned back out to its positions
+        unique = list(dict.fromkeys(texts))
+        by_text = dict(zip(unique, self._embed_unique(unique, model, kwargs)))
+        return [by_text[text] for text in texts]
+
+    def _embed_list(self, texts, model, kwargs):
+        return embedding_response(self._embed_vectors(texts, model, kwargs), model)
+
+    def embed_matrix(self, input, model=None, **kwargs):
+        """Embed a text or list of texts into an (n, dim) float32 matrix for binary encodings."""
+        start_time = time.time()
+        texts = input if isinstance(input, list) else [input]
+        try:
+            log_request(self.provider, "router.embed_matrix", {"model": model, "input_length": len(texts)})
+            vectors = self._embed_vectors(texts, model, kwargs)
+            # No texts, no provider call: the dimension is unknown, so the matrix is (0, 0)
+            matrix = np.vstack(vectors).astype(np.float32, copy=False) if vectors else np.zeros((0, 0), np.float32)
+            log_response(self.provider, "router.embed_matrix", 200, time.time() - start_time, model)
+            return matrix
+        except Exception as e:
+            log_error(e, {"provider": self.provider, "model": model, "input_length": len(texts)})
+            raise
+
     def embed(self, input, model=None, **kwargs):
         start_time = time.time()
         try:
@@ -161,11 +378,23 @@ class Router:
                 "input_length": len(input) if input else 0
             })
             
-            # Call the client
-            response = self.client.embed(input, model=model, **kwargs)
+            if isinstance(input, list):
+                response = self._embed_list(input, model, kwargs)
+            elif settings.EMBED_MICRO_BATCH_WINDOW_MS > 0:
+                # Merge concurrent single-text requests for the same model into one upstream call
+                batch_key = cache_key(self.provider, self.tenant, model, kwargs)
+                vector = EMBED_MICRO_BATCHER.submit(
+                    batch_key, input, lambda texts: self._embed_list(texts, model, kwargs)["data"]
+                )["embedding"]
+                response = embedding_response([vector], model)
+            elif settings.EMBEDDING_CACHE_ENABLED:
+                response = self._embed_list([input], model, kwargs)
+            else:
+                # Providers answer in their own shapes; callers always get the OpenAI one
+                response = embedding_response(extract_embeddings(self._embed_upstream(input, model, kwargs)), model)
             
             # Log successful operation
-            log_response(self.provider, "router.embed", 200, time.time() - start_time)
+            log_response(self.provider, "router.embed", 200, time.time() - start_time, model)
             return response
             
         except Exception as e:
@@ -187,7 +416,9 @@ class Router:
             })
             
             # Call the client
-            response = self.client.image(prompt, **kwargs)
+            with get_scheduler(self.provider).slot(self.tenant or "anonymous"):
+                with span("provider", provider=self.provider):
+                    response = self.client.image(prompt, **kwargs)
             
             # Log successful operation
             log_response(self.provider, "router.image", 200, time.time() - start_time)
@@ -0,0 +1,182 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import metrics
+from cancellation import RequestCancelled, current_token
+from settings import settings
+
+IN_FLIGHT = metrics.gauge(
+    'smart_host_upstream_in_flight', 'Provider calls currently in flight', ['provider'])
+WAITING = metrics.gauge(
+    'smart_host_scheduler_waiting', 'Requests waiting for an upstream slot', ['provider'])
+
+class _Ticket:
+    __slots__ = ('start', 'finish', 'granted')
+
+    def __init__(self, start, finish):
+        self.start = start
+        self.finish = finish
+        self.granted = False
+
+class _Tenant:
+    def __init__(self, weight, max_concurrency):
+        self.weight = weight
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.last_finish = 0.0
+        self.queue = deque()
+
+class FairScheduler:
+    """
+    Weighted fair queueing of a provider's concurrent upstream slots across tenants.
+
+    Every request gets a virtual finish tag of max(virtual_time, tenant's
+    last tag) + 1/weight. When a slot frees up it goes to the queued request
+    with the smallest tag among tenants below their own concurrency cap, so a
+    tenant sending a burst only delays its own requests. A request still
+    queued after max_wait seconds is shed with ServerOverloaded, and one
+    whose caller goes away leaves the queue with RequestCancelled.
+    """
+
+    def __init__(self, name, max_concurrency=None, weights=None, tenant_max_concurrency=None,
+                 default_tenant_max_concurrency=None, max_wait=None):
+        self.name = name
+        self.max_concurrency = max_concurrency or settings.UPSTREAM_MAX_CONCURRENCY
+        self.max_wait = settings.SCHEDULER_MAX_WAIT if max_wait is None else max_wait
+        self.weights = weights if weights is not None else settings.TENANT_WEIGHTS
+        self.tenant_max_concurrency = (
+            tenant_max_concurrency if tenant_max_concurrency is not None else settings.TENANT_MAX_CONCURRENCY
+        )
+        self.default_tenant_max_concurrency = (
+            default_tenant_max_concurrency or settings.DEFAULT_TENANT_MAX_CONCURRENCY or self.max_concurrency
+        )
+        self.in_flight = 0
+        self.waiting = 0
+        self.virtual_time = 0.0
+        self._tenants = {}
+        self._cond = threading.Condition()
+
+    def _tenant(self, tenant_id):
+        tenant = self._tenants.get(tenant_id)
+        if tenant is None:
+            tenant = _Tenant(
+                float(self.weights.get(tenant_id, 1)),
+                int(self.tenant_max_concurrency.get(tenant_id, self.default_tenant_max_concurrency)),
+            )
+            self._tenants[tenant_id] = tenant
+        return tenant
+
+    def _grant(self, tenant):
+        tenant.in_flight += 1
+        self.in_flight += 1
+        IN_FLIGHT.labels(self.name).set(self.in_flight)
+
+    def _dispatch(self):
+        granted = False
+        while self.in_flight < self.max_concurrency:
+            eligible = [
+                tenant for tenant in self._tenants.values()
+                if tenant.queue and tenant.in_flight < tenant.max_concurrency
+            ]
+            if not eligible:
+                break
+            tenant = min(eligible, key=lambda t: t.queue[0].finish)
+            ticket = tenant.queue.popleft()
+            self.virtual_time = max(self.virtual_time, ticket.start)
+            ticket.granted = True
+            self.waiting -= 1
+            self._grant(tenant)
+            granted = True
+        if granted:
+            WAITING.labels(self.name).set(self.waiting)
+            self._cond.notify_all()
+
+    def acquire(self, tenant_id):
+        with self._cond:
+            tenant = self._tenant(tenant_id)
+            start = max(self.virtual_time, tenant.last_finish)
+            tenant.last_finish = start + 1.0 / tenant.weight
+            if (self.waiting == 0 and self.in_flight < self.max_concurrency
+                    and tenant.in_flight < tenant.max_concurrency):
+                self.virtual_time = start
+                self._grant(tenant)
+                return
+            ticket = _Ticket(start, tenant.last_finish)
+            tenant.queue.append(ticket)
+            self.waiting += 1
+            WAITING.labels(self.name).set(self.waiting)
+            self._dispatch()
+            token = current_token()
+            unregister = token.add_callback(self._wake) if token is not None else (lambda: None)
+            deadline = time.monotonic() + self.max_wait
+            try:
+                while not ticket.granted:
+                    if token is not None and token.cancelled:
+                        self._withdraw(tenant_id, tenant, ticket)
+                        raise RequestCancelled(token.reason, "queued")
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._withdraw(tenant_id, tenant, ticket)
+                        # overload imports this module, so its names are only looked up here
+                        from overload import SHED, ServerOverloaded
+                        SHED.labels('scheduler_wait').inc()
+                        raise ServerOverloaded(
+                            f"No {self.name} upstream slot freed up within {self.max_wait:g}s, retry later")
+                    self._cond.wait(remaining)
+            finally:
+                unregister()
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def _withdraw(self, tenant_id, tenant, ticket):
+        # Drop a ticket that gave up waiting
+        tenant.queue.remove(ticket)
+        self.waiting -= 1
+        WAITING.labels(self.name).set(self.waiting)
+        if tenant.in_flight == 0 and not tenant.queue:
+            del self._tenants[tenant_id]
+
+    def release(self, tenant_id):
+        with self._cond:
+            tenant = self._tenants[tenant_id]
+            tenant.in_flight -= 1
+            self.in_flight -= 1
+            IN_FLIGHT.labels(self.name).set(self.in_flight)
+            if tenant.in_flight == 0 and not tenant.queue:
+                # Forget idle tenants; they lose at most one request's worth of tag on return
+                del self._tenants[tenant_id]
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, tenant_id):
+        self.acquire(tenant_id)
+        abandoned = None
+        try:
+            yield
+        except RequestCancelled as e:
+            abandoned = e.abandoned
+            raise
+        finally:
+            if abandoned is None:
+                self.release(tenant_id)
+            else:
+                # The abandoned provider call still occupies the upstream until it returns
+                abandoned.add_done_callback(lambda _: self.release(tenant_id))
+
+_SCHEDULERS = {}
+_SCHEDULERS_LOCK = threading.Lock()
+
+def get_scheduler(provider):
+    """Return the process-wide scheduler guarding a provider's upstream slots."""
+    with _SCHEDULERS_LOCK:
+        if provider not in _SCHEDULERS:
+            _SCHEDULERS[provider] = FairScheduler(provider)
+        return _SCHEDULERS[provider]
+
+def total_in_flight():
+    """Provider calls in flight across every scheduler."""
+    with _SCHEDULERS_LOCK:
+        return sum(scheduler.in_flight for scheduler in _SCHEDULERS.values())
@@ -3,13 +3,172 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+def _list(value):
+    """Parse a comma-separated environment value into a list of non-empty strings."""
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+def _mapping(value):
+    """Parse a comma-separated 'key=value' environment value into a dict."""
+    result = {}
+    for item in _list(value):
+        key, _, val = item.partition('=')
+        if key.strip() and val.strip():
+            result[key.strip()] = val.strip()
+    return result
+
+def _weights(value):
+    """Parse 'tenant=weight' pairs into floats, rejecting weights that aren't positive."""
+    result = {}
+    for key, val in _mapping(value).items():
+        weight = float(val)
+        if not weight > 0:
+            raise ValueError(f"TENANT_WEIGHTS: weight of '{key}' must be positive, got {val}")
+        result[key] = weight
+    return result
+
 class Settings:
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
     OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
+    # Comma-separated key pools; requests are spread across keys by rate-limit headroom
+    OPENAI_API_KEYS = _list(os.getenv('OPENAI_API_KEYS')) or _list(OPENAI_API_KEY)
+    OPENROUTER_API_KEYS = _list(os.getenv('OPENROUTER_API_KEYS')) or _list(OPENROUTER_API_KEY)
+    KEY_COOLDOWN_SECONDS = float(os.getenv('KEY_COOLDOWN_SECONDS', '20'))
     OLLAMA_HOST = os.getenv('OLLAMA_HOST', 'http://localhost:11434')
+    # Override to point the clients at a proxy or at mock_provider.py
+    OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1/')
+    OPENROUTER_BASE_URL = os.getenv('OPENROUTER_BASE_URL', 'https://openrouter.ai/api/v1/')
     API_HOST = os.getenv('API_HOST', '0.0.0.0')
     API_PORT = int(os.getenv('API_PORT', '8080'))
     DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').lower()
+    LOG_FILE = os.getenv('LOG_FILE', 'smart_host.log')
+    LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+    LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+    # Log records waiting for the background writer; beyond this new records are dropped
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    # Fraction of request and successful response records that are kept (errors are always logged)
+    LOG_SUCCESS_SAMPLE_RATE = float(os.getenv('LOG_SUCCESS_SAMPLE_RATE', '1.0'))
+
+    # Ollama model residency
+    OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE')
+    OLLAMA_MODEL_KEEP_ALIVE = _mapping(os.getenv('OLLAMA_MODEL_KEEP_ALIVE'))
+    OLLAMA_PRELOAD_MODELS = _list(os.getenv('OLLAMA_PRELOAD_MODELS'))
+    OLLAMA_KEEP_WARM_MODELS = _list(os.getenv('OLLAMA_KEEP_WARM_MODELS'))
+    OLLAMA_KEEP_WARM_INTERVAL = float(os.getenv('OLLAMA_KEEP_WARM_INTERVAL', '240'))
+
+    # Client-side rate limiting, e.g. {"openai": {"rpm": 3500, "tpm": 90000}}
+    RATE_LIMITS = os.getenv('RATE_LIMITS', '')
+    RATE_LIMIT_MAX_QUEUE = int(os.getenv('RATE_LIMIT_MAX_QUEUE', '100'))
+    RATE_LIMIT_MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', '30'))
+    RATE_LIMIT_DEFAULT_COMPLETION_TOKENS = int(os.getenv('RATE_LIMIT_DEFAULT_COMPLETION_TOKENS', '256'))
+
+    # Weighted fair scheduling of upstream slots per tenant (user_id or X-Tenant-ID)
+    UPSTREAM_MAX_CONCURRENCY = int(os.getenv('UPSTREAM_MAX_CONCURRENCY', '64'))
+    DEFAULT_TENANT_MAX_CONCURRENCY = int(os.getenv('DEFAULT_TENANT_MAX_CONCURRENCY', '0'))
+    TENANT_WEIGHTS = _weights(os.getenv('TENANT_WEIGHTS'))
+    TENANT_MAX_CONCURRENCY = _mapping(os.getenv('TENANT_MAX_CONCURRENCY'))
+    # Longest a request may queue for a slot before it is shed with a 503
+    SCHEDULER_MAX_WAIT = float(os.getenv('SCHEDULER_MAX_WAIT', '30'))
+
+    # Load shedding for LLM and retrieval endpoints when the server is saturated
+    OVERLOAD_MAX_LOOP_LAG = float(os.getenv('OVERLOAD_MAX_LOOP_LAG', '0.5'))
+    OVERLOAD_MAX_THREADPOOL_UTILIZATION = float(os.getenv('OVERLOAD_MAX_THREADPOOL_UTILIZATION', '0.95'))
+    OVERLOAD_MAX_IN_FLIGHT = int(os.getenv('OVERLOAD_MAX_IN_FLIGHT', '0'))
+    OVERLOAD_CHECK_INTERVAL = float(os.getenv('OVERLOAD_CHECK_INTERVAL', '0.1'))
+    OVERLOAD_RETRY_AFTER = int(os.getenv('OVERLOAD_RETRY_AFTER', '2'))
+    OVERLOAD_SHED_PATHS = _list(os.getenv('OVERLOAD_SHED_PATHS', '/chat,/chat/batch,/embed,/image,/documents,/search'))
+
+    # Exact-match response cache for deterministic chat requests
+    RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'False').lower() == 'true'
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1024'))
+    RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '3600'))
+    RESPONSE_CACHE_DB_PATH = os.getenv('RESPONSE_CACHE_DB_PATH', '')
+
+    # Endpoints whose identical concurrent requests share one upstream call
+    COALESCE_ENDPOINTS = _list(os.getenv('COALESCE_ENDPOINTS', 'chat,embed'))
+
+    # Content-addressed embedding cache for /embed
+    EMBEDDING_CACHE_ENABLED = os.getenv('EMBEDDING_CACHE_ENABLED', 'False').lower() == 'true'
+    EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', 'embedding_cache.sqlite3')
+    EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', '10000'))
+    EMBEDDING_CACHE_MAX_BYTES = int(os.getenv('EMBEDDING_CACHE_MAX_BYTES', str(1024 ** 3)))
+    EMBEDDING_CACHE_MMAP_BYTES = int(os.getenv('EMBEDDING_CACHE_MMAP_BYTES', str(256 * 1024 ** 2)))
+
+    # Batched embeddings: provider sub-batch sizes, concurrency and micro-batching of single texts
+    EMBED_BATCH_SIZES = {provider: int(size) for provider, size in _mapping(
+        os.getenv('EMBED_BATCH_SIZES', 'openai=2048,openrouter=2048,ollama=256')).items()}
+    EMBED_MAX_CONCURRENT_BATCHES = int(os.getenv('EMBED_MAX_CONCURRENT_BATCHES', '4'))
+    EMBED_MICRO_BATCH_WINDOW_MS = float(os.getenv('EMBED_MICRO_BATCH_WINDOW_MS', '0'))
+    EMBED_MICRO_BATCH_MAX_SIZE = int(os.getenv('EMBED_MICRO_BATCH_MAX_SIZE', '64'))
+
+    # Document ingestion and retrieval: chunking, embedding batch size and pipeline depth
+    DOCUMENT_CHUNK_SIZE = int(os.getenv('DOCUMENT_CHUNK_SIZE', '1000'))
+    DOCUMENT_CHUNK_OVERLAP = int(os.getenv('DOCUMENT_CHUNK_OVERLAP', '200'))
+    DOCUMENT_INGEST_BATCH_SIZE = int(os.getenv('DOCUMENT_INGEST_BATCH_SIZE', '256'))
+    DOCUMENT_INGEST_CONCURRENCY = int(os.getenv('DOCUMENT_INGEST_CONCURRENCY', '4'))
+
+    # Pooled keep-alive connections to providers and /chat/batch fan-out
+    HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '10'))
+    HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '64'))
+    CHAT_BATCH_MAX_CONCURRENCY = int(os.getenv('CHAT_BATCH_MAX_CONCURRENCY', '8'))
+    CHAT_BATCH_MAX_ITEMS = int(os.getenv('CHAT_BATCH_MAX_ITEMS', '1000'))
+
+    # Offline JSONL batch jobs (jobs.py and /jobs)
+    JOBS_DIR = os.getenv('JOBS_DIR', 'jobs')
+    JOBS_CONCURRENCY = int(os.getenv('JOBS_CONCURRENCY', '4'))
+    JOBS_MAX_CONCURRENCY = int(os.getenv('JOBS_MAX_CONCURRENCY', '32'))
+    JOBS_PRIORITY = int(os.getenv('JOBS_PRIORITY', '-1'))
+    JOBS_MAX_RETRIES = int(os.getenv('JOBS_MAX_RETRIES', '5'))
+    JOBS_HISTORY = int(os.getenv('JOBS_HISTORY', '100'))
+
+    # Asynchronous image generation jobs and their content-addressed result store
+    IMAGE_STORE_DIR = os.getenv('IMAGE_STORE_DIR', 'image_store')
+    IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', '4'))
+    IMAGE_MAX_QUEUED = int(os.getenv('IMAGE_MAX_QUEUED', '100'))
+    IMAGE_JOB_TTL = float(os.getenv('IMAGE_JOB_TTL', '3600'))
+
+    # Concurrent multiplexed requests allowed on one /ws_chat connection
+    WS_MAX_CONCURRENT_REQUESTS = int(os.getenv('WS_MAX_CONCURRENT_REQUESTS', '8'))
+    # Conversations and users whose memory one connection keeps cached
+    WS_SESSION_MEMORY_MAX_ENTRIES = int(os.getenv('WS_SESSION_MEMORY_MAX_ENTRIES', '32'))
+
+    # Cancelling abandoned requests: how often to check for disconnects, and what a
+    # cancelled chat still writes to memory (discard, prompt, or complete responses)
+    DISCONNECT_CHECK_INTERVAL = float(os.getenv('DISCONNECT_CHECK_INTERVAL', '0.25'))
+    CANCELLED_MEMORY_POLICY = os.getenv('CANCELLED_MEMORY_POLICY', 'discard').lower()
+
+    # Models reported by name in request metrics, besides the Ollama models configured above;
+    # any other model is counted as "other" so clients can't create unbounded series
+    METRICS_MODELS = _list(os.getenv('METRICS_MODELS'))
+
+    # Tracing: per-stage spans, a Server-Timing header, and optional export of sampled traces
+    TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'True').lower() == 'true'
+    TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '1.0'))
+    TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', '').lower()
+    TRACE_FILE = os.getenv('TRACE_FILE', 'traces.jsonl')
+    TRACE_OTLP_ENDPOINT = os.getenv('TRACE_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')
+    TRACE_SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'smart-host')
+
+    # Admin-only debug endpoints and per-request profiling; disabled while ADMIN_TOKEN is unset
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+    PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.005'))
+    PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '60'))
+    PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '20'))
+
+    # Provider cassettes: record upstream traffic (request/response pairs and chunk timing) to a
+    # gzip-compressed JSONL file, or replay it instead of calling providers ('off', 'record', 'replay')
+    PROVIDER_CASSETTE_MODE = os.getenv('PROVIDER_CASSETTE_MODE', 'off').lower()
+    PROVIDER_CASSETTE_PATH = os.getenv('PROVIDER_CASSETTE_PATH', 'provider_cassette.jsonl.gz')
+    PROVIDER_REPLAY_TIME_SCALE = float(os.getenv('PROVIDER_REPLAY_TIME_SCALE', '1.0'))
+
+    # Tool execution: async tools run on the event loop, sync tools in a thread pool and tools
+    # declared with @tool(mode="process") in worker processes; @tool(...) overrides the limits per tool
+    TOOL_TIMEOUT = float(os.getenv('TOOL_TIMEOUT', '30'))
+    TOOL_MAX_CONCURRENCY = int(os.getenv('TOOL_MAX_CONCURRENCY', '8'))
+    TOOL_MEMORY_LIMIT_MB = int(os.getenv('TOOL_MEMORY_LIMIT_MB', '512'))
+    TOOL_THREAD_WORKERS = int(os.getenv('TOOL_THREAD_WORKERS', '16'))
+    TOOL_PROCESS_WORKERS = int(os.getenv('TOOL_PROCESS_WORKERS', str(os.cpu_count() or 2)))
+    TOOL_CALLS_MAX_ITEMS = int(os.getenv('TOOL_CALLS_MAX_ITEMS', '32'))
 
 settings = Settings()
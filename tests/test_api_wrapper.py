@@ -32,12 +32,20 @@ def test_embed_route(monkeypatch):
     assert response.status_code == 200
     assert "data" in response.json()
 
-def test_image_route(monkeypatch):
+def test_image_route(monkeypatch, tmp_path):
+    import base64
     from router import Router
-    monkeypatch.setattr(Router, "image", lambda self, prompt: {"url": "http://example.com/image.png"})
+    from images import IMAGE_QUEUE, ImageStore
+    png = b"\x89PNG\r\n\x1a\n" + b"pixels"
+    monkeypatch.setattr(IMAGE_QUEUE, "store", ImageStore(str(tmp_path)))
+    monkeypatch.setattr(Router, "image", lambda self, prompt: {"data": [{"b64_json": base64.b64encode(png).decode()}]})
     response = client.post("/image", json={"provider": "openai", "prompt": "cat"})
+    assert response.status_code == 202
+    job_id = response.json()["job"]["id"]
+    assert IMAGE_QUEUE.get(job_id).done.wait(5)
+    response = client.get(f"/image/{job_id}")
     assert response.status_code == 200
-    assert "url" in response.json()
+    assert response.content == png and response.headers["content-type"] == "image/png"
 
 def test_tools_endpoint(monkeypatch):
     # Mock the list_tools function to return a fixed list including "add"
@@ -0,0 +1,68 @@
+import sys
+import os
+import threading
+from unittest.mock import MagicMock, patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from fastapi.testclient import TestClient
+from api_wrapper import app
+from batching import MicroBatcher
+from settings import settings
+
+client = TestClient(app)
+
+def fake_embed_recorder(sent):
+    def fake_embed(input, model=None, **kwargs):
+        sent.append(list(input))
+        return {"data": [{"index": i, "embedding": [float(len(text))]} for i, text in enumerate(input)]}
+    return fake_embed
+
+def test_list_input_is_deduplicated_and_split(monkeypatch):
+    from router import Router
+    monkeypatch.setattr(settings, "EMBED_BATCH_SIZES", {"openai": 2})
+    sent = []
+    router = Router("openai")
+    monkeypatch.setattr(router.client, "embed", fake_embed_recorder(sent))
+
+    response = router.embed(["a", "bbb", "a", "cc", "dddd", "bbb"], model="ada")
+    assert sorted(text for batch in sent for text in batch) == ["a", "bbb", "cc", "dddd"]
+    assert all(len(batch) <= 2 for batch in sent)
+    assert [item["embedding"] for item in response["data"]] == [[1.0], [3.0], [1.0], [2.0], [4.0], [3.0]]
+
+def test_micro_batcher_merges_concurrent_items():
+    batcher = MicroBatcher("test", window=0.2, max_size=3)
+    calls = []
+    results = {}
+
+    def run_batch(items):
+        calls.append(list(items))
+        return [item.upper() for item in items]
+
+    def submit(item):
+        results[item] = batcher.submit("key", item, run_batch)
+
+    threads = [threading.Thread(target=submit, args=(item,)) for item in ["x", "y", "z"]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == {"x": "X", "y": "Y", "z": "Z"}
+
+def test_embed_route_returns_openai_shape_for_every_input(monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_CACHE_ENABLED", False)
+    monkeypatch.setattr(settings, "EMBED_MICRO_BATCH_WINDOW_MS", 0)
+    upstream = MagicMock()
+
+    def ollama_embed(url, json=None, **kwargs):
+        upstream.json.return_value = {"embeddings": [[float(len(text))] for text in json["input"]]} \
+            if isinstance(json["input"], list) else {"embeddings": [[float(len(json["input"]))]]}
+        return upstream
+
+    with patch('requests.Session.post', side_effect=ollama_embed):
+        single = client.post("/embed", json={"provider": "ollama", "model": "m", "input": "abc"})
+        batch = client.post("/embed", json={"provider": "ollama", "model": "m", "input": ["one", "three"]})
+    assert single.status_code == batch.status_code == 200
+    assert single.json() == {"object": "list", "model": "m",
+                             "data": [{"object": "embedding", "index": 0, "embedding": [3.0]}]}
+    assert [item["embedding"] for item in batch.json()["data"]] == [[3.0], [5.0]]
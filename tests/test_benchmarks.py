@@ -0,0 +1,100 @@
+import sys
+import os
+import asyncio
+from argparse import Namespace
+from unittest.mock import MagicMock, patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import httpx
+from api_wrapper import app
+from benchmarks.load import run_scenario, server_overhead
+import benchmarks.memory_store as memory_store
+from benchmarks.memory_store import BACKENDS, WORKLOADS, Dataset, benchmark_backend, load, run_workload
+from benchmarks.stats import compare, distribution, percentile
+
+def test_percentile_interpolates():
+    values = [1, 2, 3, 4, 5]
+    assert percentile(values, 50) == 3
+    assert percentile(values, 100) == 5
+    assert percentile([10, 20], 50) == 15
+    assert percentile([], 50) is None
+
+def test_distribution_reports_milliseconds():
+    summary = distribution([0.001, 0.002, None, 0.003])
+    assert summary["p50"] == 2.0
+    assert summary["max"] == 3.0
+    assert distribution([None]) is None
+
+def test_compare_flags_regressions_only_beyond_tolerance():
+    baseline = {"scenarios": {"chat": {"throughput_rps": 100.0, "error_rate": 0.0,
+                                       "latency_ms": {"p50": 10.0, "p95": 20.0, "p99": 30.0}}}}
+    steady = {"scenarios": {"chat": {"throughput_rps": 95.0, "error_rate": 0.005,
+                                     "latency_ms": {"p50": 10.5, "p95": 21.0, "p99": 32.0}}}}
+    assert compare(steady, baseline) == []
+    slower = {"scenarios": {"chat": {"throughput_rps": 80.0, "error_rate": 0.05,
+                                     "latency_ms": {"p50": 10.0, "p95": 20.0, "p99": 40.0}}}}
+    regressions = compare(slower, baseline)
+    assert len(regressions) == 3
+    assert any("p99" in r for r in regressions)
+
+def test_server_overhead_subtracts_provider_time():
+    assert server_overhead("chat;dur=9.0, provider;dur=6.0, provider;dur=2.0, total;dur=10.0") == 0.002
+    assert server_overhead("") is None
+
+def test_run_scenario_in_process():
+    response_body = MagicMock()
+    response_body.json.return_value = {"choices": [{"message": {"role": "assistant", "content": "hi"}}]}
+    options = Namespace(url="http://testserver", concurrency=4, requests=12, warmup=2, duration=0, timeout=10,
+                        provider="openai", model=None, conversations=5)
+    with patch('requests.Session.post', return_value=response_body):
+        chat = asyncio.run(run_scenario("chat", options, transport=httpx.ASGITransport(app=app)))
+        tool = asyncio.run(run_scenario("call_tool", options, transport=httpx.ASGITransport(app=app)))
+    assert chat["requests"] == 12 and chat["errors"] == 0
+    assert chat["throughput_rps"] > 0
+    assert chat["latency_ms"]["p99"] >= chat["latency_ms"]["p50"]
+    assert chat["overhead_ms"] is not None
+    assert tool["requests"] == 12 and tool["error_rate"] == 0.0
+
+def test_memory_store_workloads_on_every_backend(tmp_path):
+    for name, backend_class in BACKENDS.items():
+        backend = backend_class(str(tmp_path / f"{name}.sqlite3"))
+        dataset = Dataset(rows=2000, users=20, chats=200, seed=1)
+        load(backend, dataset, batch_size=500)
+        hot = dataset.hot_chat(dataset.rng)
+        assert backend.query(dataset.chat_id(hot), dataset.user_id(int(dataset.chat_user[hot])))
+        for workload in WORKLOADS:
+            result = run_workload(backend, dataset, workload, ops=50, threads=4)
+            assert result["errors"] == 0
+            assert 0 < result["ops"] <= 50
+            assert result["ops_per_sec"] > 0 and result["latency_ms"]["p50"] is not None
+    assert backend.size_bytes() > 0
+
+def test_destructive_workloads_each_start_from_the_full_dataset(tmp_path, monkeypatch):
+    def conversation_rows(backend):
+        return sum(len(entries) for entries in backend.store.memory['conversation'].values())
+    seen = {}
+    run = memory_store.run_workload
+    def recording_run_workload(backend, dataset, workload, ops, threads, seed=0):
+        seen[workload] = conversation_rows(backend)
+        return run(backend, dataset, workload, ops, threads, seed)
+    monkeypatch.setattr(memory_store, "run_workload", recording_run_workload)
+    options = Namespace(threads=[2], rows=1000, users=5, chats=20, skew=1.1, user_fraction=0.2, text_size=50,
+                        seed=3, workloads=["delete_conversation", "delete_user_memory", "mixed"], ops=1000, keep=False)
+    benchmark_backend("memory", options, str(tmp_path))
+    assert seen["delete_conversation"] == seen["delete_user_memory"] == seen["mixed"] > 0
+    # Each run walks the deletable chats from the start again
+    dataset = Dataset(rows=500, users=5, chats=20, seed=1)
+    backend = BACKENDS["memory"]()
+    load(backend, dataset)
+    assert run_workload(backend, dataset, "delete_conversation", ops=100, threads=2)["ops"] == 20
+    assert run_workload(backend, dataset, "delete_conversation", ops=100, threads=2)["ops"] == 20
+
+def test_dataset_is_skewed():
+    dataset = Dataset(rows=10000, users=100, chats=1000, user_fraction=0.0, seed=2)
+    counts = {}
+    for conversation_rows, _ in dataset.batches():
+        for id, _, _, _ in conversation_rows:
+            counts[id] = counts.get(id, 0) + 1
+    sizes = sorted(counts.values(), reverse=True)
+    assert sum(sizes[:10]) > sum(sizes) / 3
+    assert sizes[len(sizes) // 2] < 10
@@ -0,0 +1,50 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from cache import ResponseCache, cache_key, RESPONSE_CACHE
+from settings import settings
+
+def test_cache_key_is_canonical():
+    assert cache_key("openai", {"a": 1, "b": 2}) == cache_key("openai", {"b": 2, "a": 1})
+    assert cache_key("openai", {"a": 1}) != cache_key("ollama", {"a": 1})
+
+def test_lru_evicts_and_disk_tier_survives(tmp_path):
+    db_path = str(tmp_path / "cache.sqlite3")
+    cache = ResponseCache(max_entries=1, ttl=60, db_path=db_path)
+    cache.set("first", {"answer": 1})
+    cache.set("second", {"answer": 2})
+    assert "first" not in cache._entries
+    assert cache.get("first") == {"answer": 1}
+
+    restarted = ResponseCache(max_entries=1, ttl=60, db_path=db_path)
+    assert restarted.get("second") == {"answer": 2}
+
+def test_expired_entries_are_misses():
+    cache = ResponseCache(max_entries=4, ttl=60, db_path="")
+    cache.set("stale", {"answer": 1}, ttl=-1)
+    assert cache.get("stale") is None
+
+def test_router_serves_deterministic_chat_from_cache(monkeypatch):
+    from router import Router
+    calls = []
+
+    def fake_chat(messages, **kwargs):
+        calls.append(messages)
+        return {"choices": [{"message": {"content": "Paris"}}]}
+
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(RESPONSE_CACHE, "db_path", "")
+    RESPONSE_CACHE.clear()
+    router = Router("openai")
+    monkeypatch.setattr(router.client, "chat", fake_chat)
+    messages = [{"role": "user", "content": "Capital of France?"}]
+
+    first = router.chat(messages, temperature=0)
+    second = router.chat(messages, temperature=0)
+    assert first == second
+    assert len(calls) == 1
+
+    router.chat(messages, temperature=0, cache=False)
+    router.chat(messages, temperature=0.7)
+    assert len(calls) == 3
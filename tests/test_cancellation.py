@@ -0,0 +1,142 @@
+import sys
+import os
+import asyncio
+import functools
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+from api_wrapper import cancel_on_disconnect, run_with_token
+from cancellation import CancelToken, RequestCancelled, run_cancellable
+from ratelimit import RateLimiter
+from router import Router
+from scheduling import FairScheduler
+from settings import settings
+
+class RecordingMemory:
+    def __init__(self):
+        self.added = []
+
+    def query(self, *args, **kwargs):
+        return []
+
+    def add(self, id, vector, metadata=None, memory_type='conversation', user_id=None):
+        self.added.append((metadata["role"], vector))
+
+def test_run_cancellable_abandons_call_and_closes_late_response():
+    token = CancelToken()
+    release = threading.Event()
+    late = type("Response", (), {"closed": False, "close": lambda self: setattr(self, "closed", True)})()
+    def slow_call():
+        release.wait(5)
+        return late
+
+    threading.Timer(0.05, token.cancel, args=("client disconnected",)).start()
+    start = time.time()
+    with pytest.raises(RequestCancelled) as excinfo:
+        run_with_token(token, run_cancellable, slow_call)
+    assert time.time() - start < 1
+    assert excinfo.value.stage == "upstream" and str(excinfo.value) == "client disconnected"
+    release.set()
+    deadline = time.time() + 2
+    while not late.closed and time.time() < deadline:
+        time.sleep(0.01)
+    assert late.closed
+
+def test_cancelled_waits_leave_scheduler_and_limiter_queues():
+    scheduler = FairScheduler("test", max_concurrency=1, weights={}, tenant_max_concurrency={}, max_wait=30)
+    scheduler.acquire("holder")
+    limiter = RateLimiter("test-cancel", rpm=6, max_queue=5, max_wait=30)
+    limiter.buckets['requests'].tokens = 0
+    for wait, args in ((scheduler.acquire, ("late",)), (limiter.acquire, ())):
+        token = CancelToken()
+        threading.Timer(0.05, token.cancel, args=("client disconnected",)).start()
+        start = time.time()
+        with pytest.raises(RequestCancelled) as excinfo:
+            run_with_token(token, wait, *args)
+        assert time.time() - start < 1
+        assert excinfo.value.stage == "queued"
+    assert scheduler.waiting == 0 and "late" not in scheduler._tenants
+    assert limiter._waiters == []
+
+def test_abandoned_call_keeps_its_scheduler_slot():
+    scheduler = FairScheduler("test", max_concurrency=1, weights={}, tenant_max_concurrency={})
+    token = CancelToken()
+    release = threading.Event()
+
+    def call_in_slot():
+        with scheduler.slot("tenant"):
+            run_cancellable(release.wait, 5)
+
+    threading.Timer(0.05, token.cancel).start()
+    with pytest.raises(RequestCancelled):
+        run_with_token(token, call_in_slot)
+    assert scheduler.in_flight == 1
+    release.set()
+    deadline = time.time() + 2
+    while scheduler.in_flight and time.time() < deadline:
+        time.sleep(0.01)
+    assert scheduler.in_flight == 0
+
+def test_run_cancellable_without_token_runs_inline():
+    assert run_cancellable(threading.current_thread) is threading.current_thread()
+
+@pytest.mark.parametrize("policy, expected", [
+    ("discard", []),
+    ("prompt", [("user", "hi")]),
+    ("complete", [("user", "hi"), ("assistant", "hello")]),
+])
+def test_cancelled_memory_policy(monkeypatch, policy, expected):
+    monkeypatch.setattr(settings, "CANCELLED_MEMORY_POLICY", policy)
+    monkeypatch.setattr(settings, "COALESCE_ENDPOINTS", [])
+    token = CancelToken()
+    def answered_after_disconnect(self, messages, model, priority, user_id, kwargs):
+        token.cancel("client disconnected")
+        return {"choices": [{"message": {"role": "assistant", "content": "hello"}}]}
+    monkeypatch.setattr(Router, "_call_chat", answered_after_disconnect)
+    memory = RecordingMemory()
+
+    with pytest.raises(RequestCancelled) as excinfo:
+        run_with_token(token, functools.partial(Router("openai").chat, [{"role": "user", "content": "hi"}],
+                                                chat_id="c1", session_memory=memory, cache=False))
+    assert excinfo.value.stage == "response"
+    assert memory.added == expected
+
+def test_follower_retries_when_coalesced_leader_is_cancelled(monkeypatch):
+    monkeypatch.setattr(settings, "COALESCE_ENDPOINTS", ["chat"])
+    leader_token = CancelToken()
+    leader_started = threading.Event()
+    calls = []
+    def call_chat(self, messages, model, priority, user_id, kwargs):
+        calls.append(threading.current_thread().name)
+        if len(calls) == 1:
+            leader_started.set()
+            # Hold the flight open until the follower has joined it, then give up
+            time.sleep(0.2)
+            leader_token.cancel("client disconnected")
+            raise RequestCancelled("client disconnected")
+        return {"choices": [{"message": {"role": "assistant", "content": "hello"}}]}
+    monkeypatch.setattr(Router, "_call_chat", call_chat)
+    messages = [{"role": "user", "content": "shared"}]
+
+    leader_chat = functools.partial(Router("openai").chat, messages, cache=False, temperature=0)
+    leader = threading.Thread(target=pytest.raises, args=(RequestCancelled, run_with_token, leader_token, leader_chat))
+    leader.start()
+    leader_started.wait(2)
+    response = Router("openai").chat(messages, cache=False, temperature=0)
+    leader.join()
+    assert response["choices"][0]["message"]["content"] == "hello"
+    assert len(calls) == 2
+
+def test_cancel_on_disconnect_cancels_token(monkeypatch):
+    monkeypatch.setattr(settings, "DISCONNECT_CHECK_INTERVAL", 0.01)
+    class FakeRequest:
+        polls = 0
+        async def is_disconnected(self):
+            self.polls += 1
+            return self.polls >= 3
+
+    token = CancelToken()
+    asyncio.run(asyncio.wait_for(cancel_on_disconnect(FakeRequest(), token), 1))
+    assert token.cancelled and token.reason == "client disconnected"
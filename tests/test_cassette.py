@@ -0,0 +1,90 @@
+import sys
+import os
+import io
+import json
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+import requests
+from fastapi.testclient import TestClient
+from core import cassette
+from core.cassette import Cassette, CassetteMiss, CassetteRecorder
+from core.openai_client import OpenAIClient
+from mock_provider import MockConfig, create_app
+
+COMPLETION = {"choices": [{"message": {"role": "assistant", "content": "Recorded héllo"}}]}
+
+def streamed_response(body, headers=None):
+    response = requests.Response()
+    response.status_code = 200
+    response.headers.update({"Content-Type": "application/json", "Set-Cookie": "secret", **(headers or {})})
+    response.raw = io.BytesIO(body)
+    return response
+
+def interaction(path, request, body, ttfb=0.0, offsets=(0.0,)):
+    cut = len(body) // len(offsets)
+    pieces = [body[i * cut:(i + 1) * cut if i < len(offsets) - 1 else None] for i in range(len(offsets))]
+    return {"provider": "openai", "method": "POST", "url": f"http://mock{path}", "path": path, "request": request,
+            "status": 200, "headers": {"content-type": "application/json"}, "ttfb": ttfb,
+            "chunks": [[offset, piece] for offset, piece in zip(offsets, pieces)]}
+
+def test_record_then_replay_through_a_client(tmp_path, monkeypatch):
+    path = str(tmp_path / "cassette.jsonl.gz")
+    recorder = CassetteRecorder(path)
+    monkeypatch.setattr(cassette, "RECORDER", recorder)
+    body = json.dumps(COMPLETION).encode()
+    with patch('requests.Session.post', return_value=streamed_response(body, {"x-ratelimit-remaining-requests": "9"})) \
+            as mock_post:
+        recorded = OpenAIClient(api_key="mock-key").chat([{"role": "user", "content": "hi"}], model="gpt-4o")
+    assert recorded == COMPLETION
+    assert mock_post.call_args.kwargs["stream"] is True
+    recorder.close()
+
+    replay = Cassette.load(path, time_scale=0)
+    [entry] = replay.interactions
+    assert entry["request"] == {"model": "gpt-4o", "messages": [{"role": "user", "content": "hi"}]}
+    assert entry["headers"] == {"content-type": "application/json", "x-ratelimit-remaining-requests": "9"}
+    assert "mock-key" not in json.dumps(entry)
+
+    monkeypatch.setattr(cassette, "RECORDER", None)
+    monkeypatch.setattr(cassette, "REPLAYER", replay)
+    with patch('requests.Session.post', side_effect=AssertionError("live call during replay")):
+        client = OpenAIClient(api_key="mock-key")
+        assert client.chat([{"role": "user", "content": "hi"}], model="gpt-4o") == COMPLETION
+        # A prompt never recorded still gets a recorded response for the same path
+        assert client.chat([{"role": "user", "content": "something else"}]) == COMPLETION
+        with pytest.raises(CassetteMiss):
+            client.embed("text")
+
+def test_replay_scales_recorded_timing():
+    request = {"model": "m", "messages": []}
+    recording = interaction("/v1/chat/completions", request, json.dumps(COMPLETION), ttfb=0.05, offsets=(0.05, 0.1))
+    for time_scale, low, high in ((1.0, 0.1, 0.5), (0.0, 0.0, 0.05)):
+        start = time.perf_counter()
+        response = Cassette([recording], time_scale).replay("http://mock/v1/chat/completions", request)
+        assert low <= time.perf_counter() - start < high
+        assert response.status_code == 200
+    assert response.json() == COMPLETION
+
+def test_exact_matches_replay_in_recorded_order():
+    first = interaction("/api/chat", {"q": 1}, '{"n": 1}')
+    second = interaction("/api/chat", {"q": 1}, '{"n": 2}')
+    other = interaction("/api/chat", {"q": 2}, '{"n": 3}')
+    replay = Cassette([first, other, second], time_scale=0)
+    assert [replay.replay("http://mock/api/chat", {"q": 1}).json()["n"] for _ in range(3)] == [1, 2, 1]
+    assert replay.replay("http://mock/api/chat", {"q": 2}).json()["n"] == 3
+
+def test_mock_provider_serves_a_cassette_with_chunk_pacing():
+    events = 'data: {"a": 1}\n\ndata: [DONE]\n\n'
+    recording = interaction("/v1/chat/completions", {"stream": True}, events, ttfb=0.0, offsets=(0.0, 0.1))
+    recording["headers"]["content-type"] = "text/event-stream"
+    client = TestClient(create_app(MockConfig(cassette=Cassette([recording]))))
+    start = time.perf_counter()
+    response = client.post("/v1/chat/completions", json={"stream": True})
+    assert time.perf_counter() - start >= 0.1
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text == "".join(piece for _, piece in recording["chunks"])
+    # Paths the cassette doesn't cover fall back to generated responses
+    assert client.post("/v1/embeddings", json={"input": "x"}).json()["data"]
@@ -0,0 +1,46 @@
+import sys
+import os
+import json
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from fastapi.testclient import TestClient
+from api_wrapper import app
+from router import Router
+
+client = TestClient(app)
+
+def batch(*prompts):
+    return [{"provider": "openai", "messages": [{"role": "user", "content": prompt}]} for prompt in prompts]
+
+def test_batch_returns_results_in_order_with_item_errors(monkeypatch):
+    lock = threading.Lock()
+    running = {"now": 0, "max": 0}
+    def mock_chat(self, messages, model=None, **kwargs):
+        with lock:
+            running["now"] += 1
+            running["max"] = max(running["max"], running["now"])
+        # Later items finish first so ordering can't be accidental
+        time.sleep(0.05 / len(messages[-1]["content"]))
+        with lock:
+            running["now"] -= 1
+        if messages[-1]["content"] == "boom":
+            raise RuntimeError("provider failed")
+        return {"choices": [{"message": {"content": messages[-1]["content"]}}]}
+    monkeypatch.setattr(Router, "chat", mock_chat)
+
+    response = client.post("/chat/batch", json={"requests": batch("a", "bb", "boom", "dddd"), "max_concurrency": 2})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["index"] for r in results] == [0, 1, 2, 3]
+    assert results[1]["response"]["choices"][0]["message"]["content"] == "bb"
+    assert results[2]["status"] == "error" and results[2]["error"]["message"] == "provider failed"
+    assert running["max"] <= 2
+
+def test_batch_streams_ndjson(monkeypatch):
+    monkeypatch.setattr(Router, "chat", lambda self, messages, **kwargs: {"echo": messages[-1]["content"]})
+    response = client.post("/chat/batch", json={"requests": batch("x", "y", "z"), "stream": True})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted((line["index"], line["response"]["echo"]) for line in lines) == [(0, "x"), (1, "y"), (2, "z")]
@@ -0,0 +1,72 @@
+import sys
+import os
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from coalesce import SingleFlight
+
+def run_concurrently(count, target):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(target())) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_single_flight_shares_one_call():
+    flights = SingleFlight("test")
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"value": 42}
+
+    results = run_concurrently(5, lambda: flights.do("key", slow))
+    assert len(calls) == 1
+    assert [result for result, _ in results] == [{"value": 42}] * 5
+    assert sum(1 for _, leader in results if leader) == 1
+
+def test_only_leader_persists_memory(monkeypatch):
+    import router as router_module
+    from router import Router
+    added = []
+    monkeypatch.setattr(router_module.MEMORY_STORE, "query", lambda *args, **kwargs: [])
+    monkeypatch.setattr(router_module.MEMORY_STORE, "add", lambda *args, **kwargs: added.append(args))
+
+    router = Router("openai")
+    upstream = []
+
+    def slow_chat(messages, **kwargs):
+        upstream.append(1)
+        time.sleep(0.1)
+        return {"choices": [{"message": {"content": "Hello!"}}]}
+
+    monkeypatch.setattr(router.client, "chat", slow_chat)
+    messages = [{"role": "user", "content": "Hi"}]
+    run_concurrently(4, lambda: router.chat(messages, chat_id="coalesce-test", temperature=0))
+    assert len(upstream) == 1
+    # One user message and one assistant reply, written once
+    assert len(added) == 2
+
+def test_sampled_chats_and_other_tenants_do_not_coalesce(monkeypatch):
+    from router import Router
+    upstream = []
+
+    def slow_call_chat(self, messages, model, priority, user_id, kwargs):
+        upstream.append(self.tenant)
+        time.sleep(0.1)
+        return {"choices": [{"message": {"content": "Hello!"}}]}
+
+    monkeypatch.setattr(Router, "_call_chat", slow_call_chat)
+    messages = [{"role": "user", "content": "Tell me a story"}]
+    run_concurrently(3, lambda: Router("openai").chat(messages, temperature=0.8))
+    assert len(upstream) == 3
+
+    upstream.clear()
+    tenants = iter(["a", "b", "a", "b"])
+    routers = [Router("openai", tenant=next(tenants)) for _ in range(4)]
+    run_concurrently(4, lambda: routers.pop().chat(messages, temperature=0))
+    assert sorted(upstream) == ["a", "b"]
@@ -7,7 +7,7 @@ from core.openrouter_client import OpenRouterClient
 from core.ollama_client import OllamaClient
 
 def test_openai_chat():
-    with patch('requests.post') as mock_post:
+    with patch('requests.Session.post') as mock_post:
         mock_response = MagicMock()
         mock_response.json.return_value = {
             "choices": [{"message": {"content": "Hello there!"}}]
@@ -21,7 +21,7 @@ def test_openai_chat():
         assert 'choices' in response
 
 def test_openrouter_chat():
-    with patch('requests.post') as mock_post:
+    with patch('requests.Session.post') as mock_post:
         mock_response = MagicMock()
         mock_response.json.return_value = {
             "choices": [{"message": {"content": "Hello from OpenRouter!"}}]
@@ -35,7 +35,7 @@ def test_openrouter_chat():
         assert 'choices' in response
 
 def test_ollama_chat():
-    with patch('requests.post') as mock_post:
+    with patch('requests.Session.post') as mock_post:
         mock_response = MagicMock()
         mock_response.json.return_value = {
             "message": {"content": "Hello from Ollama!"}
@@ -47,3 +47,41 @@ def test_ollama_chat():
             {"role": "user", "content": "Hello!"}
         ])
         assert 'message' in response
+
+def test_ollama_keep_alive_injected_per_model():
+    with patch('requests.Session.post') as mock_post:
+        mock_post.return_value = MagicMock()
+
+        client = OllamaClient(host="http://localhost:11434", keep_alive="5m",
+                              model_keep_alive={"llama2": "-1"})
+        client.chat([{"role": "user", "content": "Hello!"}], model="llama2")
+        assert mock_post.call_args.kwargs["json"]["keep_alive"] == -1
+
+        client.embed("text", model="nomic-embed-text")
+        assert mock_post.call_args.kwargs["json"]["keep_alive"] == "5m"
+
+        client.chat([{"role": "user", "content": "Hello!"}], model="llama2", keep_alive=0)
+        assert mock_post.call_args.kwargs["json"]["keep_alive"] == 0
+
+def test_ollama_sampling_fields_go_into_options():
+    with patch('requests.Session.post') as mock_post:
+        mock_post.return_value = MagicMock()
+
+        client = OllamaClient(host="http://localhost:11434")
+        client.chat([{"role": "user", "content": "Hello!"}], model="llama2", temperature=0, top_p=0.9,
+                    max_tokens=64, options={"num_ctx": 4096})
+        sent = mock_post.call_args.kwargs["json"]
+        assert sent["options"] == {"num_ctx": 4096, "temperature": 0, "top_p": 0.9, "num_predict": 64}
+        assert not {"temperature", "top_p", "max_tokens"} & set(sent)
+
+def test_ollama_warm_up_falls_back_to_embed():
+    with patch('requests.Session.post') as mock_post:
+        rejected = MagicMock(status_code=400)
+        loaded = MagicMock(status_code=200)
+        mock_post.side_effect = [rejected, loaded]
+
+        client = OllamaClient(host="http://localhost:11434", keep_alive="30m")
+        client.warm_up("nomic-embed-text")
+        assert mock_post.call_args_list[0].args[0].endswith("/api/generate")
+        assert mock_post.call_args_list[1].args[0].endswith("/api/embed")
+        assert mock_post.call_args.kwargs["json"]["keep_alive"] == "30m"
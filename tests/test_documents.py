@@ -0,0 +1,106 @@
+import sys
+import os
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from fastapi.testclient import TestClient
+import api_wrapper
+import router as router_module
+from documents import chunk_text, ingest_documents
+from memory.vector_store import SQLiteVectorStore
+from router import Router
+from settings import settings
+
+VOCABULARY = ["cats", "dogs", "rockets"]
+
+def fake_embed_matrix(self, input, model=None, **kwargs):
+    # One dimension per vocabulary word so similarity is easy to reason about
+    texts = input if isinstance(input, list) else [input]
+    return np.array([[text.count(word) + 0.01 for word in VOCABULARY] for text in texts], dtype=np.float32)
+
+def test_chunks_overlap_and_end_on_whitespace():
+    chunks = list(chunk_text("aaaa bbbb cccc dddd eeee", size=10, overlap=5))
+    assert chunks == ["aaaa bbbb", "bbbb cccc", "cccc dddd", "dddd eeee"]
+    with pytest.raises(ValueError):
+        list(chunk_text("text", size=10, overlap=10))
+
+def test_ingest_then_search_and_replace(tmp_path, monkeypatch):
+    monkeypatch.setattr(Router, "embed_matrix", fake_embed_matrix)
+    monkeypatch.setattr(settings, "DOCUMENT_INGEST_BATCH_SIZE", 2)
+    store = SQLiteVectorStore(str(tmp_path / "docs.sqlite3"))
+    documents = [
+        {"id": "pets", "text": "cats cats cats. dogs dogs.", "metadata": {"source": "a"}},
+        {"id": "space", "text": "rockets rockets rockets."},
+    ]
+    result = ingest_documents(Router("ollama"), store, documents, collection="kb", model="nomic",
+                              chunk_size=20, chunk_overlap=0)
+    assert result["document_ids"] == ["pets", "space"] and result["chunks"] == 4
+    assert store.collection_embedding_model("kb") == ("ollama", "nomic")
+
+    top = store.search_documents("kb", [0, 0, 1], top_k=2)
+    assert [hit["document_id"] for hit in top] == ["space", "space"]
+    assert top[0]["score"] >= top[1]["score"]
+
+    # Re-ingesting an id replaces its chunks instead of duplicating them
+    ingest_documents(Router("ollama"), store, [{"id": "space", "text": "cats"}], collection="kb", model="nomic")
+    top = store.search_documents("kb", [0, 0, 1], top_k=10)
+    assert len(top) == 3 and all(hit["document_id"] == "pets" or hit["text"] == "cats" for hit in top)
+
+    with pytest.raises(ValueError):
+        ingest_documents(Router("openai"), store, documents, collection="kb", model="ada")
+
+def test_documents_search_and_chat_retrieval(tmp_path, monkeypatch):
+    monkeypatch.setattr(Router, "embed_matrix", fake_embed_matrix)
+    store = SQLiteVectorStore(str(tmp_path / "docs.sqlite3"))
+    monkeypatch.setattr(router_module, "MEMORY_STORE", store)
+    monkeypatch.setattr(api_wrapper, "MEMORY_STORE", store)
+    client = TestClient(api_wrapper.app)
+
+    response = client.post("/documents", json={
+        "provider": "ollama", "documents": [{"id": "d1", "text": "dogs are loyal"}, {"id": "d2", "text": "rockets fly"}]
+    })
+    assert response.status_code == 200 and response.json()["chunks"] == 2
+
+    response = client.post("/search", json={"query": "rockets", "top_k": 1})
+    assert [hit["document_id"] for hit in response.json()["results"]] == ["d2"]
+
+    seen = {}
+    def fake_call_chat(self, messages, model, priority, user_id, kwargs):
+        seen["messages"] = messages
+        return {"choices": [{"message": {"role": "assistant", "content": "ok"}}]}
+    monkeypatch.setattr(Router, "_call_chat", fake_call_chat)
+    response = client.post("/chat", json={
+        "provider": "openai", "messages": [{"role": "user", "content": "tell me about dogs"}], "retrieve_top_k": 1
+    })
+    assert response.status_code == 200
+    assert seen["messages"][0]["role"] == "system" and "dogs are loyal" in seen["messages"][0]["content"]
+
+def test_failed_reingest_keeps_old_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(Router, "embed_matrix", fake_embed_matrix)
+    store = SQLiteVectorStore(str(tmp_path / "docs.sqlite3"))
+    ingest_documents(Router("ollama"), store, [{"id": "space", "text": "rockets"}], collection="kb", model="nomic")
+
+    def failing_embed_matrix(self, input, model=None, **kwargs):
+        raise RuntimeError("provider down")
+    monkeypatch.setattr(Router, "embed_matrix", failing_embed_matrix)
+    with pytest.raises(RuntimeError):
+        ingest_documents(Router("ollama"), store, [{"id": "space", "text": "cats"}], collection="kb", model="nomic")
+    assert [hit["text"] for hit in store.search_documents("kb", [0, 0, 1])] == ["rockets"]
+
+def test_index_read_before_a_write_is_not_cached(tmp_path, monkeypatch):
+    store = SQLiteVectorStore(str(tmp_path / "docs.sqlite3"))
+    chunk = {"document_id": "d", "chunk_index": 0, "text": "cats"}
+    store.add_document_chunks("kb", [chunk], [[1.0, 0.0]], "ollama")
+    original_get_conn = store._get_conn
+    def get_conn_with_concurrent_write():
+        # Simulate a write landing once the index's rows have been read but before it is cached
+        conn = original_get_conn()
+        conn.set_trace_callback(lambda statement: store._document_generation.update(kb=2))
+        monkeypatch.setattr(store, "_get_conn", original_get_conn)
+        return conn
+    monkeypatch.setattr(store, "_get_conn", get_conn_with_concurrent_write)
+    assert len(store.search_documents("kb", [1.0, 0.0])) == 1
+    assert "kb" not in store._document_index
+    store.search_documents("kb", [1.0, 0.0])
+    assert "kb" in store._document_index
@@ -0,0 +1,60 @@
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from memory.embedding_cache import EmbeddingCache
+from embeddings import extract_embeddings
+from settings import settings
+
+def test_vectors_round_trip_as_float32(tmp_path):
+    cache = EmbeddingCache(db_path=str(tmp_path / "emb.sqlite3"), max_entries=1, max_bytes=0)
+    cache.put_many("openai", "ada", ["a", "b"], [[0.5, 0.25], [1.0, 2.0]])
+    # "a" was pushed out of the LRU, so it comes back from SQLite
+    a, b, c = cache.get_many("openai", "ada", ["a", "b", "c"])
+    assert a.tolist() == [0.5, 0.25] and b.tolist() == [1.0, 2.0] and c is None
+    assert cache.get_many("openai", "other-model", ["a"]) == [None]
+
+def test_size_based_eviction_drops_least_recent(tmp_path):
+    # Each 4-dim vector is 16 bytes; allow room for about two
+    cache = EmbeddingCache(db_path=str(tmp_path / "emb.sqlite3"), max_entries=0, max_bytes=40)
+    for text in ["old", "mid", "new"]:
+        cache.put_many("openai", "ada", [text], [[1.0, 2.0, 3.0, 4.0]])
+    old, new = cache.get_many("openai", "ada", ["old", "new"])
+    assert old is None and new.tolist() == [1.0, 2.0, 3.0, 4.0]
+
+def test_memory_hits_keep_vectors_recent_on_disk(tmp_path):
+    cache = EmbeddingCache(db_path=str(tmp_path / "emb.sqlite3"), max_entries=10, max_bytes=40)
+    for text in ["hot", "cold"]:
+        cache.put_many("openai", "ada", [text], [[1.0, 2.0, 3.0, 4.0]])
+        time.sleep(0.01)
+    # Served from the in-memory LRU, so only the pending last_used update marks it as used
+    assert cache.get_many("openai", "ada", ["hot"])[0] is not None
+    time.sleep(0.01)
+    cache.put_many("openai", "ada", ["new"], [[1.0, 2.0, 3.0, 4.0]])
+    hot, cold = cache.get_many("openai", "ada", ["hot", "cold"])
+    assert hot is not None and cold is None
+
+def test_extract_embeddings_shapes():
+    as_lists = lambda vectors: [vector.tolist() for vector in vectors]
+    assert as_lists(extract_embeddings({"data": [{"index": 1, "embedding": [2]}, {"index": 0, "embedding": [1]}]})) == [[1], [2]]
+    assert as_lists(extract_embeddings({"embeddings": [[1], [2]]})) == [[1], [2]]
+    assert as_lists(extract_embeddings({"embedding": [1]})) == [[1]]
+
+def test_router_sends_only_misses_upstream(tmp_path, monkeypatch):
+    import router as router_module
+    from router import Router
+    monkeypatch.setattr(settings, "EMBEDDING_CACHE_ENABLED", True)
+    monkeypatch.setattr(router_module, "EMBEDDING_CACHE", EmbeddingCache(db_path=str(tmp_path / "emb.sqlite3")))
+    sent = []
+
+    def fake_embed(input, model=None, **kwargs):
+        sent.append(input)
+        return {"data": [{"index": i, "embedding": [float(len(text))]} for i, text in enumerate(input)]}
+
+    router = Router("openai")
+    monkeypatch.setattr(router.client, "embed", fake_embed)
+    router.embed(["one", "three"], model="ada")
+    response = router.embed(["three", "sixsix", "one", "sixsix"], model="ada")
+    assert sent[-1] == ["sixsix"]
+    assert [item["embedding"] for item in response["data"]] == [[5.0], [6.0], [3.0], [6.0]]
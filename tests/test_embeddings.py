@@ -0,0 +1,47 @@
+import base64
+import io
+import sys
+import os
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from fastapi.testclient import TestClient
+from api_wrapper import app
+from embeddings import encode_embeddings, extract_embeddings
+
+client = TestClient(app)
+MATRIX = np.array([[0.5, -1.0, 0.25], [2.0, 0.0, -0.125]], dtype=np.float32)
+
+def test_base64_response_decodes_without_float_lists():
+    encoded = encode_embeddings(MATRIX, "base64", "ada")
+    vectors = extract_embeddings(encoded)
+    assert np.array_equal(np.vstack(vectors), MATRIX)
+
+def test_float16_and_int8_round_trip():
+    half = encode_embeddings(MATRIX, "float16", "ada")["data"][0]["embedding"]
+    assert np.allclose(np.frombuffer(base64.b64decode(half), dtype='<f2'), MATRIX[0])
+
+    item = encode_embeddings(MATRIX, "int8", "ada")["data"][1]
+    codes = np.frombuffer(base64.b64decode(item["embedding"]), dtype=np.int8)
+    assert np.allclose(codes * item["scale"], MATRIX[1], atol=item["scale"])
+
+def test_embed_route_binary_formats(monkeypatch):
+    from router import Router
+    monkeypatch.setattr(Router, "embed_matrix", lambda self, input, model=None: MATRIX)
+
+    response = client.post("/embed", json={"provider": "openai", "input": ["a", "b"], "encoding_format": "binary"})
+    assert response.headers["content-type"] == "application/octet-stream"
+    assert response.headers["X-Embedding-Shape"] == "2,3"
+    assert np.array_equal(np.frombuffer(response.content, dtype='<f4').reshape(2, 3), MATRIX)
+
+    response = client.post("/embed", json={"provider": "openai", "input": ["a", "b"], "encoding_format": "npy"})
+    assert np.array_equal(np.load(io.BytesIO(response.content)), MATRIX)
+
+def test_empty_input_encodes_to_no_rows():
+    for encoding_format in ("float", "base64", "float16", "int8"):
+        response = client.post("/embed", json={"provider": "openai", "input": [], "encoding_format": encoding_format})
+        assert response.status_code == 200 and response.json()["data"] == []
+    for encoding_format in ("binary", "npy"):
+        response = client.post("/embed", json={"provider": "openai", "input": [], "encoding_format": encoding_format})
+        assert response.status_code == 200 and response.headers["X-Embedding-Shape"] == "0,0"
+    assert np.load(io.BytesIO(response.content)).shape == (0, 0)
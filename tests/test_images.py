@@ -0,0 +1,52 @@
+import sys
+import os
+import base64
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from fastapi.testclient import TestClient
+from api_wrapper import app
+from images import IMAGE_QUEUE, ImageStore, ImageJobQueue
+from router import Router
+
+client = TestClient(app)
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 600
+
+def test_store_is_content_addressed(tmp_path):
+    store = ImageStore(str(tmp_path))
+    first = store.store_base64(base64.b64encode(PNG).decode())
+    second = store.store_base64(base64.b64encode(PNG).decode())
+    assert first["path"] == second["path"] and first["path"].endswith(".png")
+    assert first["size"] == len(PNG) and open(first["path"], "rb").read() == PNG
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".part")] == []
+
+def test_failed_job_and_full_queue(tmp_path, monkeypatch):
+    release = threading.Event()
+    def slow_failure(self, prompt):
+        release.wait(5)
+        raise RuntimeError("content policy")
+    monkeypatch.setattr(Router, "image", slow_failure)
+    queue = ImageJobQueue(store=ImageStore(str(tmp_path)), workers=1, max_queued=1)
+    monkeypatch.setattr("api_wrapper.IMAGE_QUEUE", queue)
+
+    job_id = client.post("/image", json={"provider": "openai", "prompt": "cat"}).json()["job"]["id"]
+    assert client.get(f"/image/{job_id}").status_code == 202
+    assert client.post("/image", json={"provider": "openai", "prompt": "dog"}).status_code == 503
+    release.set()
+    assert queue.get(job_id).done.wait(5)
+    response = client.get(f"/image/{job_id}")
+    assert response.status_code == 502 and response.json()["job"]["error"] == "content policy"
+
+def test_websocket_notifies_when_done(tmp_path, monkeypatch):
+    release = threading.Event()
+    def generate(self, prompt):
+        release.wait(5)
+        return {"data": [{"b64_json": base64.b64encode(PNG).decode()}]}
+    monkeypatch.setattr(Router, "image", generate)
+    monkeypatch.setattr(IMAGE_QUEUE, "store", ImageStore(str(tmp_path)))
+
+    job_id = client.post("/image", json={"provider": "openai", "prompt": "cat"}).json()["job"]["id"]
+    with client.websocket_connect(f"/ws/image/{job_id}") as websocket:
+        release.set()
+        status = websocket.receive_json()
+    assert status["state"] == "succeeded" and status["files"][0]["media_type"] == "image/png"
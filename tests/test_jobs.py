@@ -0,0 +1,118 @@
+import sys
+import os
+import json
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+import jobs
+from jobs import JobRunner, start_job
+from ratelimit import RateLimitExceeded
+from settings import settings
+
+def write_lines(path, requests):
+    path.write_text("".join(json.dumps(request) + "\n" for request in requests))
+
+def read_results(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+def test_job_writes_one_result_per_line(tmp_path):
+    source, output = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    write_lines(source, [{"id": f"r{i}", "provider": "openai", "messages": [{"role": "user", "content": str(i)}]}
+                         for i in range(20)] + [{"provider": "openai", "input": "boom"}])
+    def execute(request):
+        if request.get("input") == "boom":
+            raise RuntimeError("failed")
+        return {"echo": request["messages"][0]["content"]}
+
+    status = JobRunner(str(source), str(output), concurrency=4, execute=execute).run()
+    assert status["state"] == "completed" and status["succeeded"] == 20 and status["failed"] == 1
+    results = {result["line"]: result for result in read_results(output)}
+    assert results[3]["id"] == "r3" and results[3]["response"] == {"echo": "3"}
+    assert results[20]["status"] == "error"
+
+def test_job_resumes_without_redoing_completed_lines(tmp_path):
+    source, output = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    write_lines(source, [{"provider": "openai", "messages": [{"role": "user", "content": str(i)}]} for i in range(10)])
+    calls = []
+    lock = threading.Lock()
+    runner = None
+    def execute(request):
+        with lock:
+            calls.append(request["messages"][0]["content"])
+            if len(calls) == 4:
+                runner.cancel()
+        return {"ok": True}
+
+    runner = JobRunner(str(source), str(output), concurrency=1, execute=execute)
+    assert runner.run()["state"] == "cancelled"
+    first_run = list(calls)
+
+    resumed = JobRunner(str(source), str(output), concurrency=2, execute=execute).run()
+    assert resumed["state"] == "completed" and resumed["resumed_past"] == len(first_run)
+    assert sorted(calls, key=int) == [str(i) for i in range(10)]
+    assert sorted(result["line"] for result in read_results(output)) == list(range(10))
+
+def test_rate_limited_lines_are_retried(tmp_path):
+    source, output = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    write_lines(source, [{"provider": "openai", "input": "text"}])
+    attempts = []
+    def execute(request):
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RateLimitExceeded("slow down", retry_after=0)
+        return {"data": []}
+
+    assert JobRunner(str(source), str(output), execute=execute).run()["succeeded"] == 1
+    assert len(attempts) == 3
+
+def test_existing_output_is_only_resumed_for_its_own_input(tmp_path):
+    source, other, output = tmp_path / "in.jsonl", tmp_path / "other.jsonl", tmp_path / "out.jsonl"
+    write_lines(source, [{"provider": "openai", "input": "text"}])
+    write_lines(other, [{"provider": "openai", "input": "other"}])
+    output.write_text('{"line": 0, "status": "success"}\n')
+    refused = JobRunner(str(source), str(output), execute=lambda request: {}).run()
+    assert refused["state"] == "failed" and "no checkpoint" in refused["error"]
+    assert output.read_text() == '{"line": 0, "status": "success"}\n'
+
+    output.unlink()
+    assert JobRunner(str(source), str(output), execute=lambda request: {}).run()["state"] == "completed"
+    mismatched = JobRunner(str(other), str(output), execute=lambda request: {}).run()
+    assert mismatched["state"] == "failed" and "other.jsonl" in mismatched["error"]
+    assert len(read_results(output)) == 1
+
+def test_start_job_claims_its_output_and_prunes_finished_jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "JOBS_HISTORY", 2)
+    monkeypatch.setattr(jobs, "JOBS", {})
+    started = []
+    monkeypatch.setattr(jobs.threading.Thread, "start", lambda thread: started.append(thread))
+    source = tmp_path / "in.jsonl"
+    write_lines(source, [{"provider": "openai", "input": "text"}])
+
+    runner = start_job(str(source), str(tmp_path / "out.jsonl"))
+    assert runner.status()["state"] == "running"
+    with pytest.raises(ValueError):
+        start_job(str(source), str(tmp_path / "out.jsonl"))
+
+    for i in range(4):
+        start_job(str(source), str(tmp_path / f"out{i}.jsonl")).state = "completed"
+    start_job(str(source), str(tmp_path / "last.jsonl"))
+    assert len(started) == 6
+    assert [job.state for job in jobs.JOBS.values()] == ["running", "completed", "completed", "running"]
+
+def test_concurrency_is_capped_and_cancel_cuts_retry_waits(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "JOBS_MAX_CONCURRENCY", 8)
+    source, output = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    write_lines(source, [{"provider": "openai", "input": "text"}])
+    runner = None
+    def execute(request):
+        runner.cancel()
+        raise RateLimitExceeded("slow down", retry_after=30)
+
+    runner = JobRunner(str(source), str(output), concurrency=100000, execute=execute)
+    assert runner.concurrency == 8 and runner.lookahead == 8 * 64
+    start = time.monotonic()
+    status = runner.run()
+    assert time.monotonic() - start < 5
+    assert status["state"] == "cancelled" and status["failed"] == 1
@@ -0,0 +1,42 @@
+import sys
+import os
+import time
+from unittest.mock import MagicMock, patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from core.key_pool import KeyPool, parse_reset
+from core.openai_client import OpenAIClient
+
+def make_response(status_code=200, headers=None):
+    response = MagicMock(status_code=status_code, headers=headers or {})
+    response.json.return_value = {"choices": [{"message": {"content": "ok"}}]}
+    return response
+
+def test_parse_reset_formats():
+    assert parse_reset("1s") == 1
+    assert parse_reset("6m0s") == 360
+    assert abs(parse_reset("20ms") - 0.02) < 1e-9
+    now = time.time()
+    assert abs(parse_reset(str(int((now + 30) * 1000)), now) - 30) < 1
+
+def test_pool_prefers_key_with_most_headroom():
+    pool = KeyPool(["key-a", "key-b"])
+    pool.release(pool.acquire(), {
+        "x-ratelimit-limit-requests": "100",
+        "x-ratelimit-remaining-requests": "5",
+        "x-ratelimit-reset-requests": "30s",
+    })
+    assert pool.acquire() == "key-b"
+
+def test_pool_fails_over_on_429():
+    pool = KeyPool(["key-a", "key-b"], cooldown=60)
+    limited = make_response(429, {"retry-after": "10"})
+    with patch('requests.Session.post', side_effect=[limited, make_response()]) as mock_post:
+        client = OpenAIClient(api_keys=["key-a", "key-b"])
+        client.key_pool = pool
+        response = client.chat([{"role": "user", "content": "Hi"}])
+    assert response["choices"][0]["message"]["content"] == "ok"
+    used = [call.kwargs["headers"]["Authorization"] for call in mock_post.call_args_list]
+    assert used[0] != used[1]
+    cooling = [state for state in pool.status() if state["cooling_down_for"] > 0]
+    assert len(cooling) == 1
@@ -0,0 +1,63 @@
+import sys
+import os
+import json
+import logging
+import queue
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import utils
+from utils import BackgroundQueueHandler, JsonFormatter, log_request, log_response
+from settings import settings
+
+def capture(monkeypatch):
+    """Route the smart_host logger into a local queue instead of the background writer."""
+    records = queue.Queue()
+    handler = BackgroundQueueHandler(records, 0)
+    monkeypatch.setattr(utils.logger, "handlers", [handler])
+    monkeypatch.setattr(utils.logger, "propagate", False)
+    monkeypatch.setattr(utils.logger, "isEnabledFor", lambda level: level >= logging.INFO)
+    return records
+
+def drain(records):
+    return [records.get_nowait() for _ in range(records.qsize())]
+
+def test_records_are_structured_and_formatted_lazily(monkeypatch):
+    records = capture(monkeypatch)
+    log_request("openai", "chat", {"model": "gpt-4", "api_key": "secret"})
+    record, = drain(records)
+    # Nothing is rendered on the caller's thread
+    assert record.msg == "Request to %s/%s" and record.args == ("openai", "chat")
+
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "Request to openai/chat"
+    assert entry["request"] == {"model": "gpt-4", "api_key": "[REDACTED]"}
+    assert entry["level"] == "INFO"
+
+def test_success_sampling_keeps_failures(monkeypatch):
+    records = capture(monkeypatch)
+    monkeypatch.setattr(settings, "LOG_SUCCESS_SAMPLE_RATE", 0.0)
+    log_request("openai", "chat", {"model": "gpt-4"})
+    log_response("openai", "chat", 200, 0.1)
+    log_response("openai", "chat", 500, 0.1)
+    record, = drain(records)
+    assert record.levelno == logging.WARNING and record.fields["status_code"] == 500
+
+def test_full_queue_drops_instead_of_blocking():
+    records = queue.Queue()
+    handler = BackgroundQueueHandler(records, 2)
+    before = utils.LOG_RECORDS_DROPPED.labels().value
+    for i in range(5):
+        handler.emit(logging.makeLogRecord({"msg": f"record {i}"}))
+    assert records.qsize() == 2
+    assert utils.LOG_RECORDS_DROPPED.labels().value == before + 3
+
+def test_queued_tracebacks_reach_the_json_output(monkeypatch):
+    records = capture(monkeypatch)
+    try:
+        raise ValueError("broken")
+    except ValueError:
+        utils.logger.error("failed", exc_info=True)
+    record, = drain(records)
+    assert record.exc_info is None
+    entry = json.loads(JsonFormatter().format(record))
+    assert "ValueError: broken" in entry["exception"]
@@ -0,0 +1,78 @@
+import sys
+import os
+import json
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+import requests
+from fastapi.testclient import TestClient
+from core.openai_client import OpenAIClient
+from embeddings import extract_embeddings
+from mock_provider import LatencyModel, MockConfig, create_app
+
+def mock_client(**config):
+    return TestClient(create_app(MockConfig(**config)))
+
+def test_latency_models():
+    assert LatencyModel("fixed:0.25").sample() == 0.25
+    assert all(0.1 <= LatencyModel("uniform:0.1,0.2").sample() <= 0.2 for _ in range(100))
+    assert LatencyModel("normal:0,1").sample() >= 0
+    with pytest.raises(ValueError):
+        LatencyModel("bimodal:1,2")
+
+def test_chat_completion_and_sse_stream():
+    client = mock_client(completion_tokens=5)
+    body = {"model": "gpt-mock", "messages": [{"role": "user", "content": "hi"}]}
+    response = client.post("/v1/chat/completions", json=body).json()
+    assert len(response["choices"][0]["message"]["content"].split()) == 5
+    assert response["usage"]["completion_tokens"] == 5
+
+    streamed = client.post("/v1/chat/completions", json={**body, "stream": True})
+    assert streamed.headers["content-type"].startswith("text/event-stream")
+    events = [line[len("data: "):] for line in streamed.text.split("\n\n") if line]
+    assert events[-1] == "[DONE]"
+    tokens = [json.loads(e)["choices"][0]["delta"].get("content", "") for e in events[:-1]]
+    assert "".join(tokens) == response["choices"][0]["message"]["content"]
+
+def test_token_rate_paces_completion():
+    client = mock_client(completion_tokens=6, token_rate=100, latency="fixed:0.05")
+    start = time.time()
+    client.post("/v1/chat/completions", json={"messages": []})
+    assert time.time() - start >= 0.05 + 5 / 100
+
+def test_embeddings_are_deterministic_in_both_encodings():
+    client = mock_client(embedding_dim=8)
+    plain = client.post("/v1/embeddings", json={"input": ["a", "b"]}).json()
+    encoded = client.post("/v1/embeddings", json={"input": ["a", "b"], "encoding_format": "base64"}).json()
+    assert len(plain["data"][0]["embedding"]) == 8
+    for a, b in zip(extract_embeddings(plain), extract_embeddings(encoded)):
+        assert a == pytest.approx(b, abs=1e-6)
+
+def test_ollama_routes():
+    client = mock_client(completion_tokens=3, embedding_dim=4)
+    response = client.post("/api/chat", json={"model": "llama2", "messages": [], "stream": False}).json()
+    assert response["done"] and len(response["message"]["content"].split()) == 3
+    streamed = [json.loads(line) for line in client.post("/api/chat", json={"messages": []}).text.splitlines()]
+    assert streamed[-1]["done"] and len(streamed) == 4
+    assert len(client.post("/api/embed", json={"input": ["x", "y"]}).json()["embeddings"]) == 2
+    assert len(client.post("/api/embeddings", json={"prompt": "x"}).json()["embedding"]) == 4
+
+def test_injected_429s_and_rpm_budget():
+    limited = mock_client(rate_limit_rate=1.0, retry_after=3).post("/v1/chat/completions", json={"messages": []})
+    assert limited.status_code == 429 and limited.headers["Retry-After"] == "3"
+
+    client = mock_client(rpm=2)
+    statuses = [client.post("/v1/embeddings", json={"input": "x"}).status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+
+def test_openai_client_pointed_at_mock_via_base_url(monkeypatch):
+    client = mock_client(completion_tokens=4)
+    monkeypatch.setattr("settings.settings.OPENAI_BASE_URL", "http://mock/v1")
+    def post_to_mock(self, url, json=None, **kwargs):
+        assert url == "http://mock/v1/chat/completions"
+        return client.post(url[len("http://mock"):], json=json)
+    with patch.object(requests.Session, "post", post_to_mock):
+        response = OpenAIClient(api_key="mock-key").chat([{"role": "user", "content": "hi"}])
+    assert response["object"] == "chat.completion"
@@ -0,0 +1,26 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from fastapi.testclient import TestClient
+from api_wrapper import app
+from overload import OVERLOAD_DETECTOR
+
+client = TestClient(app)
+
+def test_overload_sheds_llm_routes_only(monkeypatch):
+    monkeypatch.setattr(OVERLOAD_DETECTOR, "loop_lag", OVERLOAD_DETECTOR.max_loop_lag + 1)
+
+    response = client.post("/chat", json={"provider": "openai", "messages": [{"role": "user", "content": "Hi"}]})
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+    assert client.post("/embed", json={"provider": "openai", "input": "x"}).status_code == 503
+
+    assert client.get("/health").status_code == 200
+    assert client.delete("/memory/conversation/overload-test").status_code == 200
+
+def test_threadpool_saturation_detected(monkeypatch):
+    monkeypatch.setattr(OVERLOAD_DETECTOR, "threadpool_utilization", 1.0)
+    assert OVERLOAD_DETECTOR.overload_reason() == "threadpool_saturated"
+    monkeypatch.setattr(OVERLOAD_DETECTOR, "threadpool_utilization", 0.0)
+    assert OVERLOAD_DETECTOR.overload_reason() is None
@@ -0,0 +1,90 @@
+import sys
+import os
+import cProfile
+import pstats
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+from fastapi.testclient import TestClient
+from api_wrapper import app
+from profiling import StackSampler, cprofile_collapsed
+from router import Router
+from settings import settings
+
+client = TestClient(app)
+
+ADMIN = {"X-Admin-Token": "sekrit"}
+
+@pytest.fixture
+def admin_token(monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "sekrit")
+
+def busy_leaf(n):
+    return sum(i * i for i in range(n))
+
+def busy_parent():
+    return busy_leaf(200000) + busy_leaf(100000)
+
+def parse(collapsed):
+    return {line.rsplit(" ", 1)[0]: int(line.rsplit(" ", 1)[1]) for line in collapsed.splitlines()}
+
+def test_cprofile_stacks_attribute_time_to_call_paths():
+    profiler = cProfile.Profile()
+    profiler.runcall(busy_parent)
+    stacks = parse(cprofile_collapsed(pstats.Stats(profiler)))
+    leaf = [stack.split(";") for stack in stacks if "<genexpr>" in stack]
+    assert leaf and all(frames[0].startswith("busy_parent") and frames[1].startswith("busy_leaf") for frames in leaf)
+
+def test_sampler_only_watches_given_threads():
+    stop = threading.Event()
+    worker = threading.Thread(target=stop.wait, name="watched-worker")
+    worker.start()
+    try:
+        sampler = StackSampler(interval=0.001, thread_ids=frozenset({worker.ident}))
+        stacks = parse(sampler.run(0.05))
+    finally:
+        stop.set()
+        worker.join()
+    assert stacks and all(stack.startswith("watched-worker;") for stack in stacks)
+
+def test_sampler_interval_has_a_floor():
+    for interval in (-1, 1e-9, 0.0005):
+        assert StackSampler(interval=interval).interval >= 0.001
+    sampler = StackSampler(interval=1e-9)
+    sampler.run(0.05)
+    assert sum(sampler.counts.values()) <= 50 * threading.active_count()
+
+def test_debug_endpoints_are_hidden_without_admin_token(monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", None)
+    assert client.get("/debug/profile?seconds=0").status_code == 404
+
+def test_debug_profile_requires_the_admin_token(admin_token):
+    assert client.get("/debug/profile?seconds=0", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    response = client.get("/debug/profile?seconds=0.05&interval=0.005", headers=ADMIN)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert any(line.rsplit(" ", 1)[1].isdigit() for line in response.text.splitlines())
+
+@pytest.mark.parametrize("mode", ["cprofile", "sample"])
+def test_request_profile_captures_the_handler(admin_token, monkeypatch, mode):
+    def slow_chat(self, messages, **kwargs):
+        deadline = time.time() + 0.1
+        while time.time() < deadline:
+            busy_leaf(1000)
+        return {"choices": [{"message": {"role": "assistant", "content": "hi"}}]}
+    monkeypatch.setattr(Router, "chat", slow_chat)
+
+    response = client.post("/chat", json={"provider": "openai", "messages": [{"role": "user", "content": "hi"}]},
+                           headers={"X-Profile": mode, **ADMIN})
+    assert response.status_code == 200
+    profile = client.get(f"/debug/profiles/{response.headers['X-Profile-Id']}", headers=ADMIN)
+    assert profile.status_code == 200
+    assert "slow_chat" in profile.text
+
+def test_profile_header_is_ignored_without_admin_token(admin_token, monkeypatch):
+    monkeypatch.setattr(Router, "chat", lambda self, messages, **kwargs: {"choices": []})
+    response = client.post("/chat", json={"provider": "openai", "messages": [{"role": "user", "content": "hi"}]},
+                           headers={"X-Profile": "cprofile"})
+    assert "X-Profile-Id" not in response.headers
@@ -0,0 +1,61 @@
+import sys
+import os
+import threading
+import time
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from fastapi.testclient import TestClient
+from api_wrapper import app
+from ratelimit import RateLimiter, RateLimitExceeded
+
+client = TestClient(app)
+
+def test_limiter_admits_within_budget():
+    limiter = RateLimiter("test-budget", rpm=60, tpm=1000, max_queue=5, max_wait=1)
+    limiter.acquire(100)
+    with pytest.raises(RateLimitExceeded):
+        # A full token bucket takes a minute to refill, far beyond max_wait
+        limiter.acquire(1000)
+
+def test_limiter_sheds_when_queue_full():
+    limiter = RateLimiter("test-queue", rpm=60, max_queue=0, max_wait=5)
+    limiter.buckets['requests'].tokens = 0
+    with pytest.raises(RateLimitExceeded) as excinfo:
+        limiter.acquire()
+    assert excinfo.value.retry_after >= 1
+
+def test_limiter_serves_higher_priority_first():
+    # One request every 100ms and an empty bucket, so both requests must queue
+    limiter = RateLimiter("test-priority", rpm=600, max_queue=10, max_wait=5)
+    limiter.buckets['requests'].tokens = 0
+    order = []
+
+    def worker(name, priority):
+        limiter.acquire(priority=priority)
+        order.append(name)
+
+    low = threading.Thread(target=worker, args=("low", 0))
+    high = threading.Thread(target=worker, args=("high", 5))
+    low.start()
+    time.sleep(0.02)
+    high.start()
+    low.join()
+    high.join()
+    assert order == ["high", "low"]
+
+def test_chat_returns_429_with_retry_after(monkeypatch):
+    from router import Router
+
+    def limited_chat(self, messages, **kwargs):
+        raise RateLimitExceeded("Rate limit exceeded for openai (queue_full)", retry_after=3)
+
+    monkeypatch.setattr(Router, "chat", limited_chat)
+    response = client.post("/chat", json={"provider": "openai", "messages": [{"role": "user", "content": "Hi"}]})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "3"
+
+def test_metrics_exports_queue_metrics():
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert "smart_host_ratelimit_wait_seconds" in response.text
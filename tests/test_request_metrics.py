@@ -0,0 +1,79 @@
+import sys
+import os
+import time
+from unittest.mock import MagicMock, patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from fastapi.testclient import TestClient
+from api_wrapper import app
+from request_metrics import HTTP_REQUESTS, OVERHEAD, REQUESTS, UPSTREAM_LATENCY
+import metrics
+from settings import settings
+from utils import log_response
+
+client = TestClient(app)
+
+def test_histogram_counts_values_on_a_bound_in_that_bucket():
+    histogram = metrics.Histogram("test_bounds", "bucket edges", buckets=(1, 2))
+    child = histogram.labels()
+    for value in (0.5, 1, 1.5, 3):
+        child.observe(value)
+    assert child.counts == [2, 1] and child.count == 4
+
+def test_chat_records_request_upstream_and_overhead_metrics(monkeypatch):
+    def slow_post(*args, **kwargs):
+        time.sleep(0.05)
+        response = MagicMock()
+        response.json.return_value = {"choices": [{"message": {"role": "assistant", "content": "hi"}}]}
+        return response
+
+    monkeypatch.setattr(settings, "METRICS_MODELS", ["gpt-metrics"])
+    requests_before = REQUESTS.labels("chat", "openai", "gpt-metrics", 200).value
+    http_before = HTTP_REQUESTS.labels("POST", "/chat", 200).value
+    upstream = UPSTREAM_LATENCY.labels("openai", "/v1/chat/completions")
+    upstream_before = (upstream.count, upstream.sum)
+    overhead = OVERHEAD.labels("/chat")
+    overhead_before = (overhead.count, overhead.sum)
+
+    with patch('requests.Session.post', side_effect=slow_post):
+        response = client.post("/chat", json={"provider": "openai", "model": "gpt-metrics",
+                                              "messages": [{"role": "user", "content": "hello"}]})
+    assert response.status_code == 200
+
+    assert REQUESTS.labels("chat", "openai", "gpt-metrics", 200).value == requests_before + 1
+    assert HTTP_REQUESTS.labels("POST", "/chat", 200).value == http_before + 1
+    assert upstream.count == upstream_before[0] + 1 and upstream.sum - upstream_before[1] >= 0.05
+    # The provider's 50ms isn't counted as Smart-Host overhead
+    assert overhead.count == overhead_before[0] + 1 and overhead.sum - overhead_before[1] < 0.05
+
+    text = client.get("/metrics").text
+    assert 'smart_host_http_requests_in_flight{route="/chat"} 0' in text
+
+def test_embed_sub_batches_count_as_upstream_time(monkeypatch):
+    monkeypatch.setattr(settings, "EMBED_BATCH_SIZES", {"openai": 2})
+    def slow_embedding(url, json=None, **kwargs):
+        time.sleep(0.1)
+        response = MagicMock()
+        response.json.return_value = {"data": [{"index": i, "embedding": [1.0]} for i in range(len(json["input"]))]}
+        return response
+
+    overhead = OVERHEAD.labels("/embed")
+    overhead_before = (overhead.count, overhead.sum)
+    with patch('requests.Session.post', side_effect=slow_embedding) as post:
+        response = client.post("/embed", json={"provider": "openai", "input": ["a", "b", "c", "d", "e"]})
+    assert response.status_code == 200 and post.call_count == 3
+    # The sub-batches' provider time is subtracted even though it was spent on other threads
+    assert overhead.count == overhead_before[0] + 1 and overhead.sum - overhead_before[1] < 0.1
+
+def test_routes_with_ids_are_labelled_by_template():
+    client.get("/jobs/does-not-exist")
+    assert HTTP_REQUESTS.labels("GET", "/jobs/{job_id}", 404).value >= 1
+
+def test_unconfigured_models_share_one_series(monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_MODELS", ["gpt-known"])
+    before = {model: REQUESTS.labels("label-test", "openai", model, 200).value for model in ("gpt-known", "other")}
+    for model in ("gpt-known", "client-made-up-1", "client-made-up-2"):
+        log_response("openai", "label-test", 200, 0.01, model)
+    assert REQUESTS.labels("label-test", "openai", "gpt-known", 200).value == before["gpt-known"] + 1
+    assert REQUESTS.labels("label-test", "openai", "other", 200).value == before["other"] + 2
+    assert not any("client-made-up" in str(key) for key in REQUESTS._children)
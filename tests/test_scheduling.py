@@ -0,0 +1,84 @@
+import sys
+import os
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+from overload import ServerOverloaded
+from scheduling import FairScheduler
+from settings import _weights
+
+def run_queued(scheduler, tenants):
+    """Queue one request per tenant name, in order, then return the order they were served."""
+    order = []
+
+    def worker(tenant):
+        with scheduler.slot(tenant):
+            order.append(tenant)
+
+    threads = []
+    for tenant in tenants:
+        thread = threading.Thread(target=worker, args=(tenant,))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.02)
+    return order, threads
+
+def test_light_tenant_not_starved_by_burst():
+    scheduler = FairScheduler("test", max_concurrency=1, weights={}, tenant_max_concurrency={})
+    scheduler.acquire("holder")
+    order, threads = run_queued(scheduler, ["heavy", "heavy", "heavy", "light"])
+    scheduler.release("holder")
+    for thread in threads:
+        thread.join()
+    assert order.index("light") <= 1
+
+def test_weights_favour_heavier_tenant():
+    scheduler = FairScheduler("test", max_concurrency=1, weights={"gold": 3}, tenant_max_concurrency={})
+    scheduler.acquire("holder")
+    order, threads = run_queued(scheduler, ["basic", "basic", "basic", "gold", "gold", "gold"])
+    scheduler.release("holder")
+    for thread in threads:
+        thread.join()
+    assert order[:4].count("gold") == 3
+
+def test_tenant_concurrency_cap():
+    scheduler = FairScheduler("test", max_concurrency=4, weights={}, tenant_max_concurrency={"noisy": 1})
+    scheduler.acquire("noisy")
+    blocked = threading.Thread(target=scheduler.acquire, args=("noisy",))
+    blocked.start()
+    blocked.join(0.05)
+    assert blocked.is_alive()
+    scheduler.acquire("quiet")
+    assert scheduler.in_flight == 2
+    scheduler.release("noisy")
+    blocked.join(1)
+    assert not blocked.is_alive()
+
+def test_request_shed_after_max_wait():
+    scheduler = FairScheduler("test", max_concurrency=1, weights={}, tenant_max_concurrency={}, max_wait=0.05)
+    scheduler.acquire("holder")
+    with pytest.raises(ServerOverloaded):
+        scheduler.acquire("late")
+    assert scheduler.waiting == 0 and "late" not in scheduler._tenants
+    scheduler.release("holder")
+    scheduler.acquire("next")
+    assert scheduler.in_flight == 1
+
+def test_tenant_weights_must_be_positive():
+    assert _weights("acme=3,trial=0.5") == {"acme": 3.0, "trial": 0.5}
+    with pytest.raises(ValueError):
+        _weights("acme=0")
+
+def test_chat_returns_503_when_no_slot_frees_up(monkeypatch):
+    import router
+    from fastapi.testclient import TestClient
+    from api_wrapper import app
+
+    scheduler = FairScheduler("openai", max_concurrency=1, weights={}, tenant_max_concurrency={}, max_wait=0.05)
+    scheduler.acquire("holder")
+    monkeypatch.setattr(router, "get_scheduler", lambda provider: scheduler)
+    response = TestClient(app).post("/chat", json={"provider": "openai", "messages": [{"role": "user", "content": "Hi"}]})
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
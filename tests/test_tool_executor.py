@@ -0,0 +1,147 @@
+import sys
+import os
+import asyncio
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
+import plugins
+from tool_executor import ToolExecutor, ToolNotFound, ToolTimeout, tool
+
+# Process tools are pickled by reference, so they live at module level
+
+@tool(mode="process", timeout=10)
+def square(x):
+    return x * x
+
+@tool(mode="process", timeout=10)
+def worker_pid():
+    return os.getpid()
+
+@tool(mode="process", timeout=0.5)
+def spin():
+    while True:
+        pass
+
+@tool(mode="process", timeout=10, memory_limit_mb=64)
+def allocate(mb):
+    return len(bytearray(mb * 1024 * 1024))
+
+@tool(mode="process", timeout=10)
+def nap(seconds):
+    time.sleep(seconds)
+    return seconds
+
+@tool(mode="process", timeout=0.3)
+def touch(path):
+    open(path, "w").close()
+
+@tool(timeout=0.2, max_concurrency=1)
+def slow(seconds):
+    time.sleep(seconds)
+    return seconds
+
+ORDER = []
+
+@tool(timeout=5, max_concurrency=1)
+async def in_order(i):
+    ORDER.append(i)
+    await asyncio.sleep(0.01)
+
+async def async_echo(value):
+    await asyncio.sleep(0)
+    return {"value": value, "thread": threading.current_thread().name}
+
+def thread_name():
+    return threading.current_thread().name
+
+@pytest.fixture
+def executor(monkeypatch):
+    for fn in (square, worker_pid, spin, allocate, nap, touch, slow, in_order, async_echo, thread_name):
+        monkeypatch.setitem(plugins.PLUGIN_REGISTRY, fn.__name__, fn)
+    executor = ToolExecutor(thread_workers=4, process_workers=1)
+    yield executor
+    executor.shutdown()
+
+def test_modes_follow_the_function_and_its_declaration(executor):
+    assert executor.spec("async_echo").mode == "async"
+    assert executor.spec("thread_name").mode == "thread"
+    assert executor.spec("square").mode == "process"
+    assert executor.spec("slow").max_concurrency == 1
+    with pytest.raises(ToolNotFound):
+        executor.spec("missing")
+
+def test_async_and_thread_tools(executor):
+    async def run():
+        echoed = await executor.call("async_echo", ["hi"])
+        worker = await executor.call("thread_name")
+        return echoed, worker, threading.current_thread().name
+    echoed, worker, loop_thread = asyncio.run(run())
+    assert echoed == {"value": "hi", "thread": loop_thread}
+    assert worker.startswith("tool")
+
+def test_thread_tool_timeout_holds_its_slot_until_it_returns(executor):
+    async def run():
+        with pytest.raises(ToolTimeout):
+            await executor.call("slow", [0.5])
+        # The abandoned call still occupies the only slot, so the next one times out waiting
+        with pytest.raises(ToolTimeout):
+            await executor.call("slow", [0.01])
+        await asyncio.sleep(0.4)
+        return await executor.call("slow", [0.01])
+    assert asyncio.run(run()) == 0.01
+
+def test_waiting_calls_get_slots_in_arrival_order(executor):
+    ORDER.clear()
+    async def run():
+        await asyncio.gather(*(executor.call("in_order", [i]) for i in range(6)))
+    asyncio.run(run())
+    assert ORDER == list(range(6))
+
+def test_process_call_that_times_out_while_queued_never_runs(executor, tmp_path):
+    marker = tmp_path / "ran"
+    async def run():
+        busy = asyncio.ensure_future(executor.call("nap", [1.0]))
+        await asyncio.sleep(0.1)
+        # The only worker is busy, so this call times out before it starts
+        with pytest.raises(ToolTimeout):
+            await executor.call("touch", [str(marker)])
+        assert await busy == 1.0
+        # Once free, the worker skips the abandoned call and stays alive
+        return await executor.call("square", [3])
+    assert asyncio.run(run()) == 9
+    assert not marker.exists()
+
+def test_process_tools_run_in_a_worker_with_timeout_and_memory_cap(executor):
+    async def run():
+        assert await executor.call("square", [7]) == 49
+        first_pid = await executor.call("worker_pid")
+        assert first_pid != os.getpid()
+        with pytest.raises(ToolTimeout):
+            await executor.call("spin")
+        # The stuck worker was killed and replaced
+        assert await executor.call("worker_pid") != first_pid
+        assert await executor.call("allocate", [8]) == 8 * 1024 * 1024
+        if sys.platform.startswith("linux"):
+            with pytest.raises(MemoryError):
+                await executor.call("allocate", [512])
+    asyncio.run(run())
+
+def test_call_tools_endpoint_runs_calls_in_parallel(executor, monkeypatch):
+    from fastapi.testclient import TestClient
+    import api_wrapper
+    monkeypatch.setattr(api_wrapper, "TOOL_EXECUTOR", executor)
+    monkeypatch.setitem(plugins.PLUGIN_REGISTRY, "nap", tool(timeout=5)(lambda: time.sleep(0.2) or "rested"))
+    client = TestClient(api_wrapper.app)
+    start = time.perf_counter()
+    response = client.post("/call_tools", json={"calls": [
+        {"name": "nap"}, {"name": "nap"}, {"name": "nap"}, {"name": "add", "args": [2, 3]}, {"name": "missing"},
+    ]})
+    assert time.perf_counter() - start < 0.5
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["status"] for r in results] == ["success"] * 4 + ["error"]
+    assert results[3]["result"] == 5
+    assert results[4]["status_code"] == 404
+    assert client.post("/call_tool", json={"name": "missing"}).status_code == 404
@@ -0,0 +1,98 @@
+import sys
+import os
+import json
+from unittest.mock import MagicMock, patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from fastapi.testclient import TestClient
+from api_wrapper import app
+import tracing
+from images import ImageJobQueue, ImageStore
+from router import Router
+from settings import settings
+from tracing import SpanExporter, end_trace, parse_traceparent, span, start_trace
+
+client = TestClient(app)
+
+def test_parse_traceparent():
+    header = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+    assert parse_traceparent(header) == ("4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7", True)
+    assert parse_traceparent("00-" + "0" * 32 + "-00f067aa0ba902b7-01") is None
+    assert parse_traceparent("garbage") is None
+    assert parse_traceparent(None) is None
+
+def test_spans_nest_and_fold_into_server_timing():
+    root, handle = start_trace("POST /chat")
+    with span("memory.query"):
+        pass
+    with span("upstream") as upstream:
+        with span("provider"):
+            pass
+    with span("memory.query"):
+        pass
+    end_trace(root, handle)
+
+    spans = {s.name: s for s in root.trace.spans}
+    assert spans["provider"].parent_id == upstream.span_id
+    assert upstream.parent_id == root.span_id
+    timing = root.trace.server_timing(root)
+    assert [entry.split(";")[0] for entry in timing.split(", ")] == ["memory.query", "upstream", "provider", "total"]
+
+def test_span_outside_a_trace_is_a_noop():
+    with span("orphan") as orphan:
+        assert orphan is None
+
+def test_chat_continues_incoming_trace_and_reports_stages():
+    response_body = MagicMock()
+    response_body.json.return_value = {"choices": [{"message": {"role": "assistant", "content": "hi"}}]}
+    trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+    with patch('requests.Session.post', return_value=response_body):
+        response = client.post("/chat", json={"provider": "openai", "messages": [{"role": "user", "content": "hi"}]},
+                               headers={"traceparent": f"00-{trace_id}-00f067aa0ba902b7-01"})
+    assert response.status_code == 200
+    assert response.headers["traceparent"].startswith(f"00-{trace_id}-")
+    stages = [entry.split(";")[0] for entry in response.headers["Server-Timing"].split(", ")]
+    assert {"chat", "upstream", "provider", "total"} <= set(stages)
+
+def embedding_post(url, json=None, **kwargs):
+    response = MagicMock()
+    response.json.return_value = {"data": [{"index": i, "embedding": [1.0, 0.0]} for i in range(len(json["input"]))]}
+    return response
+
+def test_embed_sub_batches_report_their_provider_calls(monkeypatch):
+    monkeypatch.setattr(settings, "EMBED_BATCH_SIZES", {"openai": 2})
+    with patch('requests.Session.post', side_effect=embedding_post) as post:
+        response = client.post("/embed", json={"provider": "openai", "input": ["a", "b", "c", "d"]})
+    assert response.status_code == 200 and post.call_count == 2
+    stages = [entry.split(";")[0] for entry in response.headers["Server-Timing"].split(", ")]
+    assert {"provider", "total"} <= set(stages)
+
+def test_image_job_continues_the_submitting_trace(tmp_path, monkeypatch):
+    exported = []
+    monkeypatch.setattr(tracing, "EXPORTER", MagicMock(export=exported.extend))
+    def traced_image(self, prompt, **kwargs):
+        with span("provider"):
+            return {"data": [{"b64_json": "aW1hZ2U="}]}
+    monkeypatch.setattr(Router, "image", traced_image)
+    queue = ImageJobQueue(store=ImageStore(str(tmp_path)), workers=1)
+
+    root, handle = start_trace("POST /image")
+    job = queue.submit("openai", "cat")
+    end_trace(root, handle)
+    assert job.done.wait(5) and job.state == "succeeded"
+    queue._executor.shutdown(wait=True)
+    spans = {s.name: s for s in exported if s.trace.trace_id == root.trace.trace_id}
+    assert spans["image_job"].parent_id == root.span_id
+    assert spans["provider"].parent_id == spans["image_job"].span_id
+
+def test_file_exporter_writes_one_span_per_line(tmp_path):
+    root, handle = start_trace("GET /health")
+    with span("stage", answer=42):
+        pass
+    end_trace(root, handle)
+
+    path = tmp_path / "traces.jsonl"
+    SpanExporter("file", path=str(path)).write(root.trace.spans)
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [r["name"] for r in records] == ["stage", "GET /health"]
+    assert records[0]["attributes"] == {"answer": 42} and records[0]["trace_id"] == root.trace.trace_id
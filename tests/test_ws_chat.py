@@ -0,0 +1,92 @@
+import sys
+import os
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from fastapi.testclient import TestClient
+from api_wrapper import app
+from core.openai_client import OpenAIClient
+from memory.session_memory import SessionMemory
+from memory.vector_store import SQLiteVectorStore
+from router import Router
+
+client = TestClient(app)
+
+def message(request_id, content):
+    return {"id": request_id, "provider": "openai", "messages": [{"role": "user", "content": content}]}
+
+def test_requests_are_multiplexed_and_tagged(monkeypatch):
+    first_may_finish = threading.Event()
+    def mock_chat(self, messages, **kwargs):
+        if messages[-1]["content"] == "slow":
+            first_may_finish.wait(5)
+        return {"choices": [{"message": {"content": messages[-1]["content"] * 3}}]}
+    monkeypatch.setattr(Router, "chat", mock_chat)
+
+    with client.websocket_connect("/ws_chat") as websocket:
+        websocket.send_json(message("a", "slow"))
+        websocket.send_json(message("b", "fast"))
+        # "b" completes while "a" is still running
+        assert websocket.receive_json() == {"id": "b", "type": "chunk", "content": "fastfastfast"}
+        assert websocket.receive_json()["type"] == "end"
+        first_may_finish.set()
+        assert websocket.receive_json() == {"id": "a", "type": "chunk", "content": "slowslowslow"}
+        assert websocket.receive_json() == {"id": "a", "type": "end", "usage": None}
+
+def test_cancel_frame_aborts_upstream_call(monkeypatch):
+    started = threading.Event()
+    released = threading.Event()
+    def blocking_send(self, url, data):
+        started.set()
+        released.wait(5)
+        raise AssertionError("abandoned call should not be read")
+    monkeypatch.setattr(OpenAIClient, "_send", blocking_send)
+
+    with client.websocket_connect("/ws_chat") as websocket:
+        websocket.send_json(message(7, "hello"))
+        assert started.wait(5)
+        websocket.send_json({"type": "cancel", "id": 7})
+        assert websocket.receive_json() == {"id": 7, "type": "cancelled"}
+    released.set()
+
+def test_legacy_protocol_still_streams_text(monkeypatch):
+    monkeypatch.setattr(Router, "chat", lambda self, messages, **kwargs: {"choices": [{"message": {"content": "hi"}}]})
+    with client.websocket_connect("/ws_chat") as websocket:
+        websocket.send_json({"provider": "openai", "messages": [{"role": "user", "content": "hello"}]})
+        assert websocket.receive_text() == "hi"
+        assert websocket.receive_text() == "[END]"
+
+def test_session_memory_reads_the_store_once(tmp_path):
+    store = SQLiteVectorStore(str(tmp_path / "memory.sqlite3"))
+    store.add("chat-1", "earlier", metadata={"type": "memory", "timestamp": 1})
+    reads = []
+    entries = store.entries
+    store.entries = lambda *args, **kwargs: reads.append(args) or entries(*args, **kwargs)
+
+    session = SessionMemory(store)
+    assert [e["vector"] for e in session.query("chat-1", include_user_memory=False)] == ["earlier"]
+    session.add("chat-1", "later", metadata={"type": "memory", "timestamp": 2})
+    assert [e["vector"] for e in session.query("chat-1", include_user_memory=False)] == ["earlier", "later"]
+    assert len(reads) == 1
+    assert [e["vector"] for e in store.query("chat-1", include_user_memory=False)] == ["earlier", "later"]
+
+def test_session_memory_forgets_memory_deleted_mid_session(tmp_path, monkeypatch):
+    import api_wrapper
+    store = SQLiteVectorStore(str(tmp_path / "memory.sqlite3"))
+    monkeypatch.setattr(api_wrapper, "MEMORY_STORE", store)
+    store.add("chat-1", "chat fact", metadata={"timestamp": 1})
+    store.add("u1", "user fact", metadata={"timestamp": 2}, memory_type="user", user_id="u1")
+
+    session = SessionMemory(store)
+    assert [e["vector"] for e in session.query("chat-1", user_id="u1")] == ["chat fact", "user fact"]
+    assert client.delete("/memory/user/u1").status_code == 200
+    assert [e["vector"] for e in session.query("chat-1", user_id="u1")] == ["chat fact"]
+    assert client.delete("/memory/conversation/chat-1").status_code == 200
+    assert session.query("chat-1", user_id="u1") == []
+
+def test_session_memory_keeps_the_most_recently_used_entries(tmp_path):
+    store = SQLiteVectorStore(str(tmp_path / "memory.sqlite3"))
+    session = SessionMemory(store, max_entries=2)
+    for chat_id in ("a", "b", "a", "c"):
+        session.query(chat_id, include_user_memory=False)
+    assert list(session._entries) == [("conversation", "a"), ("conversation", "c")]
@@ -0,0 +1,360 @@
+import asyncio
+import atexit
+import contextvars
+import functools
+import inspect
+import itertools
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from settings import settings
+from tracing import span
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; process tools then run without a memory cap
+    resource = None
+
+TOOL_CALLS = metrics.counter(
+    'smart_host_tool_calls_total', 'Tool calls by tool, execution mode and outcome', ['tool', 'mode', 'outcome'])
+TOOL_LATENCY = metrics.histogram(
+    'smart_host_tool_duration_seconds', 'Tool call duration, including time waiting for a slot', ['tool', 'mode'])
+
+TOOL_MODES = ("async", "thread", "process")
+
+class ToolNotFound(ValueError):
+    pass
+
+class ToolTimeout(TimeoutError):
+    pass
+
+def tool(mode=None, timeout=None, max_concurrency=None, memory_limit_mb=None):
+    """
+    Declare how a plugin function is executed.
+
+    mode: "async", "thread" or "process" (for CPU-bound tools). By default
+    coroutine functions run on the event loop and everything else in the
+    thread pool. The other options override TOOL_TIMEOUT,
+    TOOL_MAX_CONCURRENCY and TOOL_MEMORY_LIMIT_MB for this tool; the memory
+    cap is only enforced for process tools.
+    """
+    if mode is not None and mode not in TOOL_MODES:
+        raise ValueError(f"Unknown tool mode: {mode}")
+
+    def decorate(fn):
+        fn.tool_options = {"mode": mode, "timeout": timeout, "max_concurrency": max_concurrency,
+                           "memory_limit_mb": memory_limit_mb}
+        return fn
+    return decorate
+
+class ToolSpec:
+    """A tool's function and its effective execution options."""
+
+    def __init__(self, name, fn):
+        options = getattr(fn, 'tool_options', {})
+        self.name = name
+        self.fn = fn
+        self.mode = options.get("mode") or ("async" if inspect.iscoroutinefunction(fn) else "thread")
+        self.timeout = options.get("timeout") or settings.TOOL_TIMEOUT
+        self.max_concurrency = options.get("max_concurrency") or settings.TOOL_MAX_CONCURRENCY
+        self.memory_limit_mb = options.get("memory_limit_mb") or settings.TOOL_MEMORY_LIMIT_MB
+        self.slots = _Slots(self.max_concurrency)
+
+class _Waiter:
+    """A call queued for a slot, woken on its own event loop."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.granted = False
+
+    def grant(self):
+        def wake():
+            if not self.future.done():
+                self.future.set_result(None)
+        self.loop.call_soon_threadsafe(wake)
+
+class _Slots:
+    """
+    A tool's concurrency limit, handed out first come, first served.
+
+    Slots are released from worker threads and the process pool's result
+    thread as well as from event loops, so a freed slot goes straight to
+    the longest-waiting call, whichever loop it is waiting on.
+    """
+
+    def __init__(self, limit):
+        self._free = limit
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    async def acquire(self, timeout):
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                return _Slot(self)
+            waiter = _Waiter(asyncio.get_running_loop())
+            self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+        except BaseException:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._waiters.remove(waiter)
+            if granted:
+                # The slot arrived as the wait ended; pass it on
+                self.release()
+            raise
+        return _Slot(self)
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self._free += 1
+                return
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+        try:
+            waiter.grant()
+        except RuntimeError:
+            # The waiter's loop has closed
+            self.release()
+
+class _Slot:
+    """One acquired concurrency slot of a tool, released exactly once by whichever path finishes first."""
+
+    def __init__(self, slots):
+        self._slots = slots
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self, *_):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._slots.release()
+
+# Shared with the parent: calls abandoned before a worker picked them up, the worker pid running
+# each call, and the lock that keeps a worker from switching calls while the parent kills it
+_CANCELLED = None
+_RUNNING = None
+_STATE_LOCK = None
+
+def _init_worker(cancelled, running, state_lock):
+    global _CANCELLED, _RUNNING, _STATE_LOCK
+    _CANCELLED, _RUNNING, _STATE_LOCK = cancelled, running, state_lock
+    # Workers leave Ctrl-C to the server, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _address_space():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+
+def _run_in_worker(call_id, fn, args, kwargs, memory_limit_mb):
+    with _STATE_LOCK:
+        if _CANCELLED.pop(call_id, False):
+            # Timed out while queued; nobody is waiting for the result
+            return None
+        _RUNNING[call_id] = os.getpid()
+    try:
+        return _run_capped(fn, args, kwargs, memory_limit_mb)
+    finally:
+        with _STATE_LOCK:
+            _RUNNING.pop(call_id, None)
+
+def _run_capped(fn, args, kwargs, memory_limit_mb):
+    if resource is None or not memory_limit_mb:
+        return fn(*args, **kwargs)
+    # Cap what this call can allocate on top of what the worker already uses, then lift the cap again
+    previous = resource.getrlimit(resource.RLIMIT_AS)
+    try:
+        limit = _address_space() + memory_limit_mb * 1024 * 1024
+    except OSError:
+        return fn(*args, **kwargs)
+    if previous[1] != resource.RLIM_INFINITY:
+        limit = min(limit, previous[1])
+    resource.setrlimit(resource.RLIMIT_AS, (limit, previous[1]))
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        resource.setrlimit(resource.RLIMIT_AS, previous)
+
+class ToolExecutor:
+    """
+    Runs plugin tools off the request path, each with a timeout and a cap on concurrent calls.
+
+    Async tools run on the event loop, sync tools in a thread pool, and
+    tools declared with @tool(mode="process") in a pool of worker
+    processes, so CPU-bound work doesn't hold the GIL the server needs. A
+    timed-out thread can't be stopped, so its slot stays taken until it
+    returns; a timed-out process call is skipped if it is still queued, or
+    has its worker killed and replaced if it has started. Calls waiting for
+    a slot get one in the order they arrived.
+    """
+
+    def __init__(self, thread_workers=None, process_workers=None):
+        self.thread_workers = thread_workers or settings.TOOL_THREAD_WORKERS
+        self.process_workers = process_workers or settings.TOOL_PROCESS_WORKERS
+        self._threads = ThreadPoolExecutor(max_workers=self.thread_workers, thread_name_prefix="tool")
+        self._processes = None
+        self._manager = None
+        self._specs = {}
+        self._call_ids = itertools.count()
+        # Process calls in flight
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def spec(self, name):
+        from plugins import PLUGIN_REGISTRY
+        fn = PLUGIN_REGISTRY.get(name)
+        if fn is None:
+            raise ToolNotFound(f"Tool '{name}' not found.")
+        with self._lock:
+            spec = self._specs.get(name)
+            if spec is None or spec.fn is not fn:
+                spec = self._specs[name] = ToolSpec(name, fn)
+            return spec
+
+    async def call(self, name, args=(), kwargs=None):
+        """Run a tool and return its result; raises ToolTimeout once its timeout (including queueing) passes."""
+        spec = self.spec(name)
+        kwargs = kwargs or {}
+        start_time = time.perf_counter()
+        deadline = start_time + spec.timeout
+        outcome = "error"
+        try:
+            with span("tool", tool=name, mode=spec.mode):
+                slot = await self._acquire(spec, deadline)
+                if spec.mode == "async":
+                    try:
+                        result = await asyncio.wait_for(spec.fn(*args, **kwargs), self._remaining(spec, deadline))
+                    finally:
+                        slot.release()
+                elif spec.mode == "thread":
+                    result = await self._run_thread(spec, slot, deadline, args, kwargs)
+                else:
+                    result = await self._run_process(spec, slot, deadline, args, kwargs)
+            outcome = "success"
+            return result
+        except (ToolTimeout, asyncio.TimeoutError):
+            outcome = "timeout"
+            raise ToolTimeout(f"Tool '{name}' did not finish within {spec.timeout}s")
+        finally:
+            TOOL_CALLS.labels(name, spec.mode, outcome).inc()
+            TOOL_LATENCY.labels(name, spec.mode).observe(time.perf_counter() - start_time)
+
+    def _remaining(self, spec, deadline):
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            raise ToolTimeout(f"Tool '{spec.name}' did not finish within {spec.timeout}s")
+        return remaining
+
+    async def _acquire(self, spec, deadline):
+        return await spec.slots.acquire(self._remaining(spec, deadline))
+
+    async def _run_thread(self, spec, slot, deadline, args, kwargs):
+        try:
+            future = self._threads.submit(
+                functools.partial(contextvars.copy_context().run, spec.fn, *args, **kwargs))
+        except BaseException:
+            slot.release()
+            raise
+        future.add_done_callback(slot.release)
+        return await asyncio.wait_for(asyncio.wrap_future(future), self._remaining(spec, deadline))
+
+    def _pool(self):
+        with self._lock:
+            if self._processes is None:
+                # Spawned rather than forked: forking a threaded server can copy held locks into the child
+                context = multiprocessing.get_context("spawn")
+                self._manager = context.Manager()
+                self._cancelled = self._manager.dict()
+                self._running = self._manager.dict()
+                self._state_lock = context.Lock()
+                self._processes = context.Pool(self.process_workers, initializer=_init_worker,
+                                               initargs=(self._cancelled, self._running, self._state_lock))
+            return self._processes
+
+    def _finish_process_call(self, call_id):
+        with self._lock:
+            self._pending.discard(call_id)
+
+    async def _run_process(self, spec, slot, deadline, args, kwargs):
+        loop = asyncio.get_running_loop()
+        result = loop.create_future()
+        call_id = next(self._call_ids)
+
+        def settle(setter, value):
+            if not result.done():
+                setter(value)
+
+        def finished(setter, value):
+            # Runs on the pool's result thread
+            self._finish_process_call(call_id)
+            slot.release()
+            try:
+                loop.call_soon_threadsafe(settle, setter, value)
+            except RuntimeError:
+                # The loop that made the call has since closed
+                pass
+
+        try:
+            pool = self._pool()
+            with self._lock:
+                self._pending.add(call_id)
+            pool.apply_async(_run_in_worker, (call_id, spec.fn, args, kwargs, spec.memory_limit_mb),
+                             callback=lambda value: finished(result.set_result, value),
+                             error_callback=lambda error: finished(result.set_exception, error))
+        except BaseException:
+            self._finish_process_call(call_id)
+            slot.release()
+            raise
+        try:
+            return await asyncio.wait_for(result, self._remaining(spec, deadline))
+        except (asyncio.TimeoutError, ToolTimeout, asyncio.CancelledError):
+            self._abandon(call_id)
+            slot.release()
+            raise
+
+    def _abandon(self, call_id):
+        """
+        Stop a process call nobody is waiting for: a queued call is marked
+        so its worker skips it, and the worker running a started one is
+        killed, which makes the pool start a replacement.
+        """
+        with self._lock:
+            if call_id not in self._pending:
+                return
+            self._pending.discard(call_id)
+        # Held while killing, so the worker can't finish this call and start another in between
+        with self._state_lock:
+            pid = self._running.pop(call_id, None)
+            if pid is None:
+                self._cancelled[call_id] = True
+                return
+            try:
+                os.kill(pid, getattr(signal, 'SIGKILL', signal.SIGTERM))
+            except ProcessLookupError:
+                pass
+
+    def shutdown(self):
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            # Calls still in flight have nothing left to cancel or kill
+            self._pending.clear()
+            if self._processes is not None:
+                self._processes.terminate()
+                self._manager.shutdown()
+                self._processes = None
+                self._manager = None
+
+TOOL_EXECUTOR = ToolExecutor()
+atexit.register(TOOL_EXECUTOR.shutdown)
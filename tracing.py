@@ -0,0 +1,245 @@
+import contextvars
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+import metrics
+from core.session import get_session
+from settings import settings
+from utils import log_error
+
+SPANS_DROPPED = metrics.counter(
+    'smart_host_trace_spans_dropped_total', 'Finished spans dropped because the trace exporter fell behind')
+
+# W3C Trace Context: version-trace_id-parent_id-flags
+TRACEPARENT = re.compile(r'^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+# OTLP span kinds
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+class Span:
+    """One timed stage of a request."""
+
+    __slots__ = ('trace', 'name', 'span_id', 'parent_id', 'kind', 'attributes', 'error', 'start_ns', 'end_ns')
+
+    def __init__(self, trace, name, parent_id=None, kind="internal", attributes=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def end(self):
+        self.end_ns = time.time_ns()
+        self.trace.record(self)
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_record(self):
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start_ns / 1e9,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": SPAN_KINDS[self.kind],
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 0},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+class Trace:
+    """
+    The spans finished while handling one request.
+
+    Worker threads the request hands off to record into the same Trace,
+    since they see it through a copy of the request's context.
+    """
+
+    def __init__(self, trace_id=None, sampled=True):
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.sampled = sampled
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def record(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def server_timing(self, root=None):
+        """Render a Server-Timing header: total time per stage name, in the order stages first started."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start_ns)
+        totals = {}
+        for span in spans:
+            if span is not root:
+                totals[span.name] = totals.get(span.name, 0.0) + span.duration_ms
+        entries = [f"{name};dur={duration:.1f}" for name, duration in totals.items()]
+        if root is not None:
+            entries.append(f"total;dur={root.duration_ms:.1f}")
+        return ", ".join(entries)
+
+_CURRENT_SPAN = contextvars.ContextVar('trace_span', default=None)
+
+def current_span():
+    return _CURRENT_SPAN.get()
+
+def parse_traceparent(header):
+    """Return (trace_id, parent_span_id, sampled) from a traceparent header, or None if it isn't valid."""
+    match = TRACEPARENT.match((header or "").strip().lower())
+    if not match:
+        return None
+    version, trace_id, parent_id, flags = match.groups()
+    if version == "ff" or trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+def format_traceparent(span):
+    return f"00-{span.trace.trace_id}-{span.span_id}-{'01' if span.trace.sampled else '00'}"
+
+def start_trace(name, traceparent=None, attributes=None):
+    """
+    Begin the root span of a request, continuing the caller's trace when a
+    valid traceparent is given. Returns (root_span, handle for end_trace()).
+    """
+    incoming = parse_traceparent(traceparent)
+    if incoming:
+        trace_id, parent_id, sampled = incoming
+    else:
+        trace_id, parent_id = None, None
+        sampled = random.random() < settings.TRACE_SAMPLE_RATE
+    root = Span(Trace(trace_id, sampled), name, parent_id, kind="server", attributes=attributes)
+    return root, _CURRENT_SPAN.set(root)
+
+def end_trace(root, handle):
+    root.end()
+    _CURRENT_SPAN.reset(handle)
+    if root.trace.sampled and EXPORTER is not None:
+        EXPORTER.export(root.trace.spans)
+
+@contextmanager
+def span(name, **attributes):
+    """Time a stage as a child of the current span; a no-op outside a traced request."""
+    parent = _CURRENT_SPAN.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes=attributes)
+    handle = _CURRENT_SPAN.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _CURRENT_SPAN.reset(handle)
+        child.end()
+
+class SpanExporter:
+    """
+    Ships finished traces from a background thread, so exporting never
+    holds up a request: to a JSONL file (one span per line) or to an
+    OTLP/HTTP collector as JSON. When more than `max_pending` traces are
+    waiting, new ones are dropped and counted.
+    """
+
+    def __init__(self, target, path=None, endpoint=None, max_pending=1000, batch_size=512, interval=1.0):
+        self.target = target
+        self.path = path
+        self.endpoint = endpoint
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        if self._queue.qsize() >= self.max_pending:
+            SPANS_DROPPED.labels().inc(len(spans))
+            return
+        self._queue.put(list(spans))
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+
+    def _next_batch(self):
+        batch = list(self._queue.get())
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.extend(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self.write(batch)
+            except Exception as e:
+                SPANS_DROPPED.labels().inc(len(batch))
+                log_error(e, {"trace_exporter": self.target, "spans": len(batch)})
+
+    def write(self, spans):
+        if self.target == "file":
+            with open(self.path, 'a', encoding='utf-8') as f:
+                for span in spans:
+                    f.write(json.dumps(span.to_record(), default=str) + '\n')
+        elif self.target == "otlp":
+            response = get_session().post(self.endpoint, json=otlp_payload(spans), timeout=10)
+            response.raise_for_status()
+
+def otlp_payload(spans):
+    return {"resourceSpans": [{
+        "resource": {"attributes": [_otlp_attribute("service.name", settings.TRACE_SERVICE_NAME)]},
+        "scopeSpans": [{"scope": {"name": "smart_host"}, "spans": [span.to_otlp() for span in spans]}],
+    }]}
+
+EXPORTER = (
+    SpanExporter(settings.TRACE_EXPORTER, path=settings.TRACE_FILE, endpoint=settings.TRACE_OTLP_ENDPOINT)
+    if settings.TRACE_EXPORTER in ("file", "otlp") else None
+)
@@ -1,23 +1,109 @@
+import atexit
 import logging
+import logging.handlers
+import queue
+import random
 import sys
+import time
 import traceback
 import json
 from typing import Dict, Any, Optional
+import metrics
+from request_metrics import ERRORS, REQUEST_LATENCY, REQUESTS, model_label
 from settings import settings
 
-# Configure logging
+LOG_RECORDS_DROPPED = metrics.counter(
+    'smart_host_log_records_dropped_total', 'Log records dropped because the background writer fell behind')
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+class JsonFormatter(logging.Formatter):
+    """Format a record as one JSON object, merging in the structured fields it was logged with."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        # Queued records carry their traceback pre-rendered in exc_text (see BackgroundQueueHandler.prepare)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    """The classic one-line format, with any structured fields appended as JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = getattr(record, 'fields', None)
+        return f"{line}: {json.dumps(fields, default=str)}" if fields else line
+
+class BackgroundQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hand records to the background writer without formatting or blocking.
+
+    The stock QueueHandler formats each record on the caller's thread; here
+    the message and its JSON are only rendered by the listener. When more
+    than `max_pending` records are waiting, new ones are dropped and counted
+    rather than making the request wait for disk or console I/O.
+    """
+
+    def __init__(self, log_queue: queue.Queue, max_pending: int):
+        super().__init__(log_queue)
+        self.max_pending = max_pending
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            # Tracebacks hold the caller's frames alive; render them now
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.max_pending and self.queue.qsize() >= self.max_pending:
+            LOG_RECORDS_DROPPED.labels().inc()
+            return
+        self.queue.put_nowait(record)
+
+def _output_handlers() -> list:
+    formatter = JsonFormatter() if settings.LOG_FORMAT == 'json' else TextFormatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if settings.LOG_FILE:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            settings.LOG_FILE, maxBytes=settings.LOG_MAX_BYTES, backupCount=settings.LOG_BACKUP_COUNT,
+            encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+# Configure logging: request threads only enqueue, a listener thread formats and writes
 log_level = getattr(logging, settings.LOG_LEVEL, logging.INFO)
+# Unbounded so the listener's stop sentinel always fits; the handler enforces LOG_QUEUE_SIZE
+log_queue = queue.Queue()
+log_listener = logging.handlers.QueueListener(log_queue, *_output_handlers(), respect_handler_level=True)
 logging.basicConfig(
     level=log_level,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('smart_host.log')
-    ]
+    handlers=[BackgroundQueueHandler(log_queue, settings.LOG_QUEUE_SIZE)]
 )
+log_listener.start()
+# Flush whatever is still queued when the process exits
+atexit.register(log_listener.stop)
 
 logger = logging.getLogger('smart_host')
 
+def _sampled() -> bool:
+    """Whether to keep a routine (request or successful response) record."""
+    rate = settings.LOG_SUCCESS_SAMPLE_RATE
+    return rate >= 1 or random.random() < rate
+
 def log_error(error: Exception, context: Optional[Dict[str, Any]] = None) -> None:
     """
     Log an exception with optional context information
@@ -32,10 +118,12 @@ def log_error(error: Exception, context: Optional[Dict[str, Any]] = None) -> Non
         'traceback': traceback.format_exc()
     }
     
+    ERRORS.labels(error_details['error_type']).inc()
+    
     if context:
         error_details['context'] = context
         
-    logger.error(f"Error: {json.dumps(error_details, default=str)}")
+    logger.error("Error: %s", error_details['error_type'], extra={'fields': error_details})
 
 def log_request(provider: str, endpoint: str, request_data: Dict[str, Any]) -> None:
     """
@@ -46,24 +134,42 @@ def log_request(provider: str, endpoint: str, request_data: Dict[str, Any]) -> N
         endpoint: The endpoint being called (chat, embed, image)
         request_data: The request data (with sensitive info removed)
     """
+    # Build nothing unless the record will actually be written
+    if not logger.isEnabledFor(logging.INFO) or not _sampled():
+        return
+    
     # Remove any sensitive information
     sanitized_data = request_data.copy()
     if 'api_key' in sanitized_data:
         sanitized_data['api_key'] = '[REDACTED]'
         
-    logger.info(f"Request to {provider}/{endpoint}: {json.dumps(sanitized_data, default=str)}")
+    logger.info("Request to %s/%s", provider, endpoint,
+                extra={'fields': {'provider': provider, 'endpoint': endpoint, 'request': sanitized_data}})
     
-def log_response(provider: str, endpoint: str, status_code: int, response_time: float) -> None:
+def log_response(provider: str, endpoint: str, status_code: int, response_time: float,
+                 model: Optional[str] = None) -> None:
     """
-    Log an API response
+    Log an API response and record it in the request metrics
     
     Args:
         provider: The LLM provider (openai, mcp, etc.)
         endpoint: The endpoint being called (chat, embed, image)
         status_code: HTTP status code
         response_time: Time taken for the request in seconds
+        model: The model used, when known
     """
-    logger.info(f"Response from {provider}/{endpoint}: status_code={status_code}, time={response_time:.2f}s")
+    # Metrics see every response, whatever the log level or sampling
+    label = model_label(model)
+    REQUESTS.labels(endpoint, provider, label, status_code).inc()
+    REQUEST_LATENCY.labels(endpoint, provider, label).observe(response_time)
+    
+    # Failures are always kept; successes are subject to sampling
+    level = logging.INFO if status_code < 400 else logging.WARNING
+    if not logger.isEnabledFor(level) or (level == logging.INFO and not _sampled()):
+        return
+    logger.log(level, "Response from %s/%s", provider, endpoint,
+               extra={'fields': {'provider': provider, 'endpoint': endpoint, 'status_code': status_code,
+                                 'response_time': round(response_time, 4)}})
     
 def format_error_response(error: Exception) -> Dict[str, Any]:
     """